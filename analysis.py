@@ -1,5 +1,30 @@
+import hashlib
 import json
-import math
+import os
+from array import array
+
+import diagnostics
+
+try:
+    import ijson # Optional: incremental parser, keeps memory flat on large result files
+except ImportError:
+    ijson = None
+
+# --- JSON Parsing ---
+# Shared by analyze_ac_session and the engine. Files up to this size are parsed with json.load,
+# which is several times faster than dispatching ijson's events in Python; only larger files
+# are streamed, to keep memory flat.
+STREAMING_THRESHOLD_BYTES = 16 * 1024 * 1024
+
+INVALID_JSON_ERRORS = (json.JSONDecodeError, UnicodeDecodeError) + ((ijson.JSONError,) if ijson is not None else ())
+
+def use_streaming_parser(file_size):
+    """True when a results file of file_size bytes should be parsed with iter_json_events."""
+    return ijson is not None and file_size > STREAMING_THRESHOLD_BYTES
+
+def iter_json_events(f):
+    """(prefix, event, value) parse events of an open binary file; numbers come back as floats/ints."""
+    return ijson.parse(f, use_float=True)
 
 def format_ms_to_time(ms):
     """Converts milliseconds (int/float) to a standard time string (m:ss.zzz)"""
@@ -13,158 +38,316 @@ def format_ms_to_time(ms):
     # Ensure seconds are formatted to three decimal places
     return f"{minutes}:{seconds:06.3f}"
 
+# Lookup tables for format_ms_column: "ss." and "zzz" parts of m:ss.zzz
+_SECOND_STRINGS = [f"{second:02d}." for second in range(60)]
+_MILLI_STRINGS = [f"{milli:03d}" for milli in range(1000)]
+
+def format_ms_column(values):
+    """
+    Formats a whole column of millisecond values at once (same output as format_ms_to_time).
+    Whole-millisecond values skip the float formatting: ints, and the integral floats read from
+    the REAL time columns of the database.
+    """
+    formatted = []
+    append = formatted.append
+    for ms in values:
+        if ms is None or ms < 0:
+            append("N/A")
+            continue
+        if type(ms) is float and ms.is_integer():
+            ms = int(ms)
+        if type(ms) is int:
+            minutes, rest = divmod(ms, 60000)
+            seconds, millis = divmod(rest, 1000)
+            append(f"{minutes}:{_SECOND_STRINGS[seconds]}{_MILLI_STRINGS[millis]}")
+        else:
+            append(format_ms_to_time(ms))
+    return formatted
+
+class _HashingReader:
+    """File wrapper that feeds every chunk read by the JSON parser into a SHA-256 digest."""
+    def __init__(self, f):
+        self._f = f
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self._f.read(size)
+        self.digest.update(chunk)
+        return chunk
+
+class SessionAnalysis:
+    """
+    Result of analyze_ac_session for the first session of a results file.
+
+    Laps are kept as parallel typed arrays (one element per lap, -1 where a sector is missing)
+    and go straight into the laps table through lap_rows(). Bests and averages are computed
+    once by finish(); the text report is only built when report() is called.
+    """
+    __slots__ = (
+        'file_path', 'file_size', 'file_mtime', 'content_hash', 'error',
+        'track', 'car', 'session_datetime',
+        'lap_time', 'sector_1', 'sector_2', 'sector_3', 'cuts',
+        'valid_lap_count', 'best_lap_ms', 'average_lap_ms', 'best_sectors', 'theoretical_ms'
+    )
+
+    def __init__(self, file_path):
+        self.file_path = os.path.abspath(file_path) # Source file info for the ingest ledger
+        self.file_size = None
+        self.file_mtime = None
+        self.content_hash = None
+        self.error = None            # Report line explaining why the file could not be read
+        self.track = None            # Display names
+        self.car = None
+        self.session_datetime = None
+
+        self.lap_time = array('q')
+        self.sector_1 = array('q')
+        self.sector_2 = array('q')
+        self.sector_3 = array('q')
+        self.cuts = array('i')
+
+        self.valid_lap_count = 0
+        self.best_lap_ms = -1
+        self.average_lap_ms = -1
+        self.best_sectors = (-1, -1, -1)
+        self.theoretical_ms = -1
+
+    @property
+    def lap_count(self):
+        return len(self.lap_time)
+
+    @property
+    def readable(self):
+        """The file was read and parsed (it may still have no valid laps)."""
+        return self.file_size is not None
+
+    @property
+    def usable(self):
+        """The session has at least one valid lap, so it can be saved."""
+        return self.best_lap_ms > 0
+
+    def add_lap(self, lap_time, sectors, cuts):
+        n = len(sectors)
+        self.lap_time.append(int(lap_time))
+        self.sector_1.append(int(sectors[0]) if n > 0 else -1)
+        self.sector_2.append(int(sectors[1]) if n > 1 else -1)
+        self.sector_3.append(int(sectors[2]) if n > 2 else -1)
+        self.cuts.append(int(cuts))
+
+    def finish(self):
+        """Computes the valid-lap statistics in one pass over the lap arrays."""
+        # A lap is considered VALID if time > 0 and no cuts occurred
+        best, total, valid = -1, 0, 0
+        best_sectors = [-1, -1, -1]
+        for lap_time, s1, s2, s3, cuts in zip(self.lap_time, self.sector_1, self.sector_2, self.sector_3, self.cuts):
+            if lap_time <= 0 or cuts != 0:
+                continue
+            valid += 1
+            total += lap_time
+            if best < 0 or lap_time < best:
+                best = lap_time
+            for k, sector in enumerate((s1, s2, s3)):
+                if sector > 0 and (best_sectors[k] < 0 or sector < best_sectors[k]):
+                    best_sectors[k] = sector
+
+        self.valid_lap_count = valid
+        self.best_lap_ms = best
+        self.average_lap_ms = int(total / valid) if valid else -1
+        self.best_sectors = tuple(best_sectors)
+
+        # Theoretical Best (Supports 3 or 2 sectors)
+        b1, b2, b3 = best_sectors
+        if b1 > 0 and b2 > 0 and b3 > 0:
+            self.theoretical_ms = b1 + b2 + b3
+        elif b1 > 0 and b2 > 0:
+            self.theoretical_ms = b1 + b2
+        else:
+            self.theoretical_ms = -1
+
+    def lap_rows(self, session_id):
+        """
+        Yields laps table rows (session_id, lap_number, lap_time, sector_1..3, cuts, is_valid)
+        straight from the arrays for executemany. Missing sectors are stored as NULL.
+        """
+        laps = zip(self.lap_time, self.sector_1, self.sector_2, self.sector_3, self.cuts)
+        for lap_number, (lap_time, s1, s2, s3, cuts) in enumerate(laps, start=1):
+            yield (
+                session_id, lap_number, lap_time,
+                s1 if s1 >= 0 else None, s2 if s2 >= 0 else None, s3 if s3 >= 0 else None,
+                cuts, 1 if lap_time > 0 and cuts == 0 else 0
+            )
+
+    def report(self):
+        """Renders the lap analysis report as a list of lines."""
+        with diagnostics.stage('analysis.render_report'):
+            return self._render_report()
+
+    def _render_report(self):
+        if self.error:
+            return [self.error]
+
+        output = []
+        output.append("=" * 50)
+        output.append("   ASSETTO CORSA SESSION ANALYSIS   ")
+        output.append("=" * 50)
+        output.append(f"Track: {self.track}")
+        output.append(f"Car:   {self.car}")
+
+        if self.session_datetime:
+            date_part = self.session_datetime.split('T')[0]
+            time_part = self.session_datetime.split('T')[1]
+            output.append(f"Date:  {date_part}")
+            output.append(f"Time:  {time_part}")
+        else:
+            output.append("Time:  N/A (Could not extract session date/time)")
+
+        output.append("-" * 50)
+
+        if not self.lap_count:
+            return output + ["No lap data found for the session."]
+
+        output.append("LAP HISTORY (Lap | Time | S1 | S2 | S3 | Valid)")
+        laps = zip(self.lap_time, self.sector_1, self.sector_2, self.sector_3, self.cuts)
+        for lap_number, (lap_time, s1, s2, s3, cuts) in enumerate(laps, start=1):
+            is_valid_flag = (lap_time > 0 and cuts == 0)
+            valid_status = "YES" if is_valid_flag else (f"CUTS ({cuts})" if cuts > 0 else "INVALID")
+            output.append(
+                f"{lap_number:3} | {format_ms_to_time(lap_time):10} | {format_ms_to_time(s1 if s1 > 0 else -1):8} | "
+                f"{format_ms_to_time(s2 if s2 > 0 else -1):8} | {format_ms_to_time(s3 if s3 > 0 else -1):8} | {valid_status}"
+            )
+
+        if not self.valid_lap_count:
+            return output + ["-" * 50, "No valid laps were recorded in the session."]
+
+        output.append("-" * 50)
+        valid_rate = (self.valid_lap_count / self.lap_count) * 100
+        output.append(f"Total Valid Laps: {self.valid_lap_count}")
+        output.append(f"Validity Rate:    {valid_rate:.1f}%")
+        output.append(f"Best Lap Time:    {format_ms_to_time(self.best_lap_ms)}")
+        output.append(f"Average Lap Time: {format_ms_to_time(self.average_lap_ms)}")
+
+        best_s1, best_s2, best_s3 = self.best_sectors
+        if best_s1 > 0 and best_s2 > 0 and best_s3 > 0:
+            output.append(f"Theoretical Best: {format_ms_to_time(self.theoretical_ms)}")
+            output.append(f"    (S1: {format_ms_to_time(best_s1)}, S2: {format_ms_to_time(best_s2)}, S3: {format_ms_to_time(best_s3)})")
+        elif best_s1 > 0 and best_s2 > 0:
+            output.append(f"Theoretical Best: {format_ms_to_time(self.theoretical_ms)}")
+            output.append(f"    (S1: {format_ms_to_time(best_s1)}, S2: {format_ms_to_time(best_s2)})")
+        else:
+            output.append("Theoretical Best: N/A (Missing Sector Data)")
+
+        output.append("-" * 50)
+        return output
+
+def _read_session_fields_streaming(f, session):
+    """
+    Reads only the fields the analysis needs from an open results file using ijson events.
+    The first session's laps go straight into session's arrays; everything else is discarded
+    as it streams past. Returns (track, car, quick_drive).
+    """
+    track = car = quick_drive = None
+    session_index = -1
+    in_lap = False
+    lap_time, cuts, sectors = -1, 0, None
+
+    for prefix, event, value in iter_json_events(f):
+        if prefix == 'track' and event == 'string':
+            track = value
+        elif prefix == 'players.item.car' and car is None:
+            car = value
+        elif prefix == '__quickDrive' and event == 'string':
+            quick_drive = value
+        elif prefix == 'sessions.item' and event == 'start_map':
+            session_index += 1
+        elif session_index != 0:
+            continue # Only the first session is analyzed
+        elif prefix == 'sessions.item.laps.item':
+            if event == 'start_map':
+                in_lap = True
+                lap_time, cuts, sectors = -1, 0, None
+            elif event == 'end_map':
+                session.add_lap(lap_time, sectors if sectors is not None else (-1, -1, -1), cuts)
+                in_lap = False
+        elif in_lap:
+            if prefix == 'sessions.item.laps.item.time':
+                lap_time = value
+            elif prefix == 'sessions.item.laps.item.cuts':
+                cuts = value
+            elif prefix == 'sessions.item.laps.item.sectors' and event == 'start_array':
+                sectors = []
+            elif prefix == 'sessions.item.laps.item.sectors.item':
+                sectors.append(value)
+
+    return track, car, quick_drive
+
+def _read_session_fields(session):
+    """
+    Reads track, car, quick_drive and the first session's laps of session.file_path into
+    session, plus the file's size, mtime and content hash (computed in the same read pass).
+    Large files are streamed when ijson is installed (see use_streaming_parser); otherwise
+    json.load is used and the full document is dropped as soon as the fields are copied out.
+    Returns (track, car, quick_drive).
+    """
+    with open(session.file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        reader = _HashingReader(f)
+        if use_streaming_parser(stat.st_size):
+            track, car, quick_drive = _read_session_fields_streaming(reader, session)
+        else:
+            data = json.load(reader)
+            sessions = data.get('sessions') or [{}]
+            track = data.get('track')
+            car = (data.get('players') or [{}])[0].get('car')
+            quick_drive = data.get('__quickDrive')
+            for lap in sessions[0].get('laps', []):
+                session.add_lap(lap.get('time', -1), lap.get('sectors', (-1, -1, -1)), lap.get('cuts', 0))
+            del data
+        # Drain anything the parser did not need so the hash always covers the whole file
+        while reader.read(65536):
+            pass
+
+    session.file_size = stat.st_size
+    session.file_mtime = stat.st_mtime_ns
+    session.content_hash = reader.digest.hexdigest()
+    return track, car, quick_drive
+
 def analyze_ac_session(file_path):
     """
-    Parses the Assetto Corsa session JSON and generates a lap analysis report.
-    Returns: (list of report lines, summary_data)
+    Parses the Assetto Corsa session JSON into a SessionAnalysis.
+    Errors are reported through result.error (and result.report()), not raised.
     """
-    summary_data = {
-        'best_lap_ms': -1,
-        'theoretical_ms': -1,
-        'all_laps': [],          # RENAMED from 'valid_laps' to 'all_laps'
-        'raw_data': None,
-        'session_datetime': None # Included from previous update
-    }
+    session = SessionAnalysis(file_path)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            summary_data['raw_data'] = data
+        with diagnostics.stage('analysis.parse_json'):
+            track, car, quick_drive_str = _read_session_fields(session)
     except FileNotFoundError:
-        return ["Error: File not found."], summary_data
-    except json.JSONDecodeError:
-        return ["Error: Invalid JSON file format."], summary_data
+        session.error = "Error: File not found."
+    except INVALID_JSON_ERRORS:
+        session.error = "Error: Invalid JSON file format."
     except Exception as e:
-        return [f"An unexpected error occurred: {e}"], summary_data
+        session.error = f"An unexpected error occurred: {e}"
+    if session.error:
+        # Partially read laps are of no use
+        session.file_size = None
+        session.lap_time, session.sector_1, session.sector_2, session.sector_3, session.cuts = (
+            array('q'), array('q'), array('q'), array('q'), array('i'))
+        return session
 
     # --- Extract Session Datetime from nested JSON ---
-    session_datetime = None
-    quick_drive_str = data.get('__quickDrive')
     if quick_drive_str:
         try:
-            quick_drive_data = json.loads(quick_drive_str)
-            session_datetime = quick_drive_data.get('dtv')
+            session_datetime = json.loads(quick_drive_str).get('dtv')
             if session_datetime:
-                 session_datetime = session_datetime.split('+')[0].split('.')[0] 
+                session.session_datetime = session_datetime.split('+')[0].split('.')[0]
         except json.JSONDecodeError:
-            pass 
+            pass
     # -----------------------------------------------------------
 
     # Basic data extraction
-    track = data.get("track", "Unknown Track").replace("ks_", "").replace("-", " ")
-    car = data.get("players", [{}])[0].get("car", "Unknown Car").replace("ks_", "").replace("_", " ")
-
-    output = []
-    output.append("=" * 50)
-    output.append("   ASSETTO CORSA SESSION ANALYSIS   ")
-    output.append("=" * 50)
-    output.append(f"Track: {track.title()}")
-    output.append(f"Car:   {car.title()}")
-    
-    if session_datetime:
-        date_part = session_datetime.split('T')[0]
-        time_part = session_datetime.split('T')[1]
-        output.append(f"Date:  {date_part}")
-        output.append(f"Time:  {time_part}")
-    else:
-        output.append("Time:  N/A (Could not extract session date/time)")
-
-    output.append("-" * 50)
-
-    # 1. Extract laps data
-    laps_data = data.get('sessions', [{}])[0].get('laps', [])
-
-    if not laps_data:
-        return output + ["No lap data found for the session."], summary_data
-
-    valid_laps_ms = []       # STILL only for calculations (best lap, average lap)
-    sector_1_times = []      # STILL only for valid laps
-    sector_2_times = []
-    sector_3_times = []
-
-    all_laps_for_db = []     # NEW: Collects ALL laps
-
-    output.append("LAP HISTORY (Lap | Time | S1 | S2 | S3 | Valid)")
-    for i, lap in enumerate(laps_data):
-        lap_number = i + 1
-        lap_time = lap.get("time", -1)
-        sectors = lap.get("sectors", [-1, -1, -1])
-        cuts = lap.get("cuts", 0)
+    session.track = (track or "Unknown Track").replace("ks_", "").replace("-", " ").title()
+    session.car = (car or "Unknown Car").replace("ks_", "").replace("_", " ").title()
 
-        # A lap is considered VALID if time > 0 and no cuts occurred
-        is_valid_flag = (lap_time > 0 and cuts == 0)
-
-        time_str = format_ms_to_time(lap_time)
-
-        # Handle S1, S2, S3 extraction safely
-        s1_time = sectors[0] if len(sectors) > 0 and sectors[0] > 0 else -1
-        s2_time = sectors[1] if len(sectors) > 1 and sectors[1] > 0 else -1
-        s3_time = sectors[2] if len(sectors) > 2 and sectors[2] > 0 else -1
-
-        s1_str = format_ms_to_time(s1_time)
-        s2_str = format_ms_to_time(s2_time)
-        s3_str = format_ms_to_time(s3_time)
-
-        valid_status = "YES" if is_valid_flag else (f"CUTS ({cuts})" if cuts > 0 else "INVALID")
-        output.append(f"{lap_number:3} | {time_str:10} | {s1_str:8} | {s2_str:8} | {s3_str:8} | {valid_status}")
-
-        # --- Data Collection Logic ---
-        # 1. Collect data for Summary Calculations (ONLY VALID LAPS)
-        if is_valid_flag:
-            valid_laps_ms.append(lap_time)
-            if s1_time > 0: sector_1_times.append(s1_time)
-            if s2_time > 0: sector_2_times.append(s2_time)
-            if s3_time > 0: sector_3_times.append(s3_time)
-
-        # 2. Prepare data for Database Insertion (ALL LAPS)
-        all_laps_for_db.append({
-            'lap_number': lap_number,
-            'time': lap_time,
-            'sectors': sectors,
-            'cuts': cuts,
-            'is_valid': 1 if is_valid_flag else 0 # Store 1 or 0
-        })
-        # --- End Data Collection Logic ---
-
-
-    if not valid_laps_ms:
-        return output + ["-" * 50, "No valid laps were recorded in the session."], summary_data
-
-    # --- Summary Calculations (unchanged, still based on valid laps) ---
-    output.append("-" * 50)
-    # ... (rest of summary calculations are unchanged) ...
-    total_laps = len(laps_data)
-    valid_laps_count = len(valid_laps_ms)
-    valid_rate = (valid_laps_count / total_laps) * 100
-    best_lap_ms = min(valid_laps_ms)
-    average_lap_ms = sum(valid_laps_ms) / len(valid_laps_ms)
-
-    output.append(f"Total Valid Laps: {valid_laps_count}")
-    output.append(f"Validity Rate:    {valid_rate:.1f}%")
-    output.append(f"Best Lap Time:    {format_ms_to_time(best_lap_ms)}")
-    output.append(f"Average Lap Time: {format_ms_to_time(int(average_lap_ms))}")
-
-    # Theoretical Best (Supports 3 or 2 sectors)
-    theoretical_best = -1
-    if sector_1_times and sector_2_times and sector_3_times:
-        best_s1, best_s2, best_s3 = min(sector_1_times), min(sector_2_times), min(sector_3_times)
-        theoretical_best = best_s1 + best_s2 + best_s3
-        output.append(f"Theoretical Best: {format_ms_to_time(theoretical_best)}")
-        output.append(f"    (S1: {format_ms_to_time(best_s1)}, S2: {format_ms_to_time(best_s2)}, S3: {format_ms_to_time(best_s3)})")
-    elif sector_1_times and sector_2_times:
-        best_s1, best_s2 = min(sector_1_times), min(sector_2_times)
-        theoretical_best = best_s1 + best_s2
-        output.append(f"Theoretical Best: {format_ms_to_time(theoretical_best)}")
-        output.append(f"    (S1: {format_ms_to_time(best_s1)}, S2: {format_ms_to_time(best_s2)})")
-    else:
-        output.append("Theoretical Best: N/A (Missing Sector Data)")
-
-    output.append("-" * 50)
-
-    # Populate summary data for the caller
-    summary_data['best_lap_ms'] = best_lap_ms
-    summary_data['theoretical_ms'] = theoretical_best
-    summary_data['all_laps'] = all_laps_for_db # UPDATED KEY
-    summary_data['session_datetime'] = session_datetime 
-
-    return output, summary_data
\ No newline at end of file
+    with diagnostics.stage('analysis.summarize'):
+        session.finish()
+    return session
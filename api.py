@@ -0,0 +1,326 @@
+"""
+Local HTTP/JSON API over the session database, for pit-wall dashboards and overlay tools.
+
+    python cli.py serve --port 8765
+
+    GET /status                           session count and schema version
+    GET /sessions?car=&track=&from=&to=&before=STARTED_AT:ID&limit=100
+                                          newest first, paged like the viewer ('next' = before cursor)
+    GET /sessions/count?car=&track=&from=&to=
+    GET /sessions/<id>/laps
+    GET /combos                           every car/track combo with its personal best
+    GET /combos/best?car=&track=          one combo's bests and theoretical best
+
+Read-only: queries run on a small thread pool whose connections are opened with mode=ro, so
+in WAL mode polling clients never block the desktop app's writes. Responses are cached with an
+ETag (clients send If-None-Match and get 304 Not Modified) until the database changes: writes
+in this process are reported by database change listeners, writes by other processes (the
+desktop app) show up as a new PRAGMA data_version, polled in the background. Identical
+requests arriving together share one query.
+"""
+import asyncio
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import database
+import diagnostics
+
+API_HOST = '127.0.0.1'
+API_PORT = 8765
+API_WORKERS = 2         # Query threads; kept small so the desktop app keeps the CPU and the disk
+API_CACHE_ENTRIES = 512 # Cached responses (LRU)
+API_MAX_PAGE_SIZE = 1000
+KEEP_ALIVE_SECONDS = 30
+DATA_VERSION_POLL_SECONDS = 0.25 # How often writes by other processes are looked for
+MAX_HEADERS = 100
+
+class ApiError(Exception):
+    """A request the API cannot answer; becomes a JSON error response with this status."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# --- Endpoints ---
+# Run on the query pool. Each takes the query string as {name: value} and returns JSON data.
+
+def _filters(query):
+    filters = {
+        'car_filter': query.get('car', 'All Cars'),
+        'track_filter': query.get('track', 'All Tracks'),
+        'date_from': query.get('from'),
+        'date_to': query.get('to'),
+    }
+    try:
+        for value in (filters['date_from'], filters['date_to']):
+            if value is not None:
+                database.to_started_at(value)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "from/to must be ISO dates (YYYY-MM-DD).")
+    return filters
+
+def _int_param(query, name, default):
+    try:
+        return int(query.get(name, default))
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be an integer.")
+
+def get_status(query):
+    return {'sessions': database.get_session_count(), 'schema_version': database.SCHEMA_VERSION}
+
+def get_sessions(query):
+    limit = min(max(_int_param(query, 'limit', database.SESSION_PAGE_SIZE), 1), API_MAX_PAGE_SIZE)
+    before = None
+    if 'before' in query:
+        match = re.fullmatch(r'(-?\d+):(\d+)', query['before'])
+        if not match:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "before must be STARTED_AT:ID (the 'next' value of a page).")
+        before = (int(match.group(1)), int(match.group(2)))
+    records = database.get_sessions_page(before=before, limit=limit, **_filters(query))
+    columns = [column.strip() for column in database.SESSION_COLUMNS.split(',')]
+    sessions = [dict(zip(columns, record)) for record in records]
+    next_page = f"{records[-1][6]}:{records[-1][0]}" if len(records) == limit else None
+    return {'sessions': sessions, 'next': next_page}
+
+def count_sessions(query):
+    return {'count': database.count_sessions(**_filters(query))}
+
+def get_laps(query, session_id):
+    columns = ('lap_number', 'lap_time', 'sector_1', 'sector_2', 'sector_3', 'cuts', 'is_valid')
+    laps = [dict(zip(columns, lap)) for lap in database.get_laps_for_session(int(session_id))]
+    for lap in laps:
+        lap['is_valid'] = bool(lap['is_valid'])
+    return {'session_id': int(session_id), 'laps': laps}
+
+def get_combos(query):
+    return {'combos': [dict(zip(database.COMBO_LIST_COLUMNS, row)) for row in database.get_all_combo_stats()]}
+
+def get_combo_best(query):
+    if 'car' not in query or 'track' not in query:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "car and track are required.")
+    stats = database.get_combo_stats(query['car'], query['track'])
+    if stats is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, "No sessions for this car and track.")
+    return dict(stats, car_model=query['car'], track_name=query['track'])
+
+ROUTES = (
+    (re.compile(r'/status'), get_status),
+    (re.compile(r'/sessions'), get_sessions),
+    (re.compile(r'/sessions/count'), count_sessions),
+    (re.compile(r'/sessions/(\d+)/laps'), get_laps),
+    (re.compile(r'/combos'), get_combos),
+    (re.compile(r'/combos/best'), get_combo_best),
+)
+
+def _render(endpoint, query, path_args):
+    """Runs an endpoint on a query thread. Returns (status, body, etag)."""
+    try:
+        with diagnostics.stage('api.query'):
+            data = endpoint(query, *path_args)
+        status = HTTPStatus.OK
+    except ApiError as e:
+        status, data = e.status, {'error': str(e)}
+    except database.DatabaseError as e:
+        status, data = HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)}
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return status, body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+# --- Server ---
+
+class ApiServer:
+    """
+    asyncio HTTP/1.1 server (keep-alive, GET/HEAD only). All cache bookkeeping happens on the
+    event loop thread; only queries and JSON encoding run on the pool.
+    """
+    def __init__(self, host=API_HOST, port=API_PORT, workers=API_WORKERS, cache_entries=API_CACHE_ENTRIES):
+        self.host = host
+        self.port = port
+        self.cache_entries = cache_entries
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="aca-api", initializer=database.use_read_only_connection
+        )
+        # The data_version check gets its own read-only connection, so it never waits behind queries
+        self._version_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="aca-api-version", initializer=database.use_read_only_connection
+        )
+        self._cache = OrderedDict()  # (path, query) -> (status, body, etag)
+        self._inflight = {}          # (path, query) -> Future of the query computing it
+        self._generation = 0         # Bumped on every invalidation; stale results are not cached
+        self._data_version = None
+        self._loop = None
+        self._server = None
+        self._version_task = None
+
+    async def start(self):
+        """Starts listening; returns the bound (host, port)."""
+        self._loop = asyncio.get_running_loop()
+        self._data_version = await self._loop.run_in_executor(self._version_executor, database.data_version)
+        self._version_task = asyncio.create_task(self._watch_data_version())
+        database.add_change_listener(self._on_database_changed)
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        database.remove_change_listener(self._on_database_changed)
+        if self._version_task is not None:
+            self._version_task.cancel()
+        if self._server is not None:
+            self._server.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._version_executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Cache ---
+    def _on_database_changed(self):
+        # Called on whichever thread committed
+        self._loop.call_soon_threadsafe(self.invalidate)
+
+    def invalidate(self):
+        self._generation += 1
+        self._cache.clear()
+        diagnostics.count('api.invalidations')
+
+    async def _watch_data_version(self):
+        """Invalidates when another connection (e.g. the desktop app) has committed since the last check."""
+        while True:
+            await asyncio.sleep(DATA_VERSION_POLL_SECONDS)
+            try:
+                version = await self._loop.run_in_executor(self._version_executor, database.data_version)
+            except database.DatabaseError:
+                continue # Busy or briefly unavailable; look again next time
+            if version != self._data_version:
+                self._data_version = version
+                self.invalidate()
+
+    async def _get(self, path, query, endpoint, path_args):
+        key = (path, tuple(sorted(query.items())))
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+            diagnostics.count('api.cache_hits')
+            return entry
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._loop.run_in_executor(self._executor, _render, endpoint, query, path_args)
+            self._inflight[key] = future
+            generation = self._generation
+            future.add_done_callback(lambda f: self._on_rendered(key, generation, f))
+        else:
+            diagnostics.count('api.shared_queries')
+        # Shielded: a client hanging up must not cancel a query other clients are waiting for
+        return await asyncio.shield(future)
+
+    def _on_rendered(self, key, generation, future):
+        self._inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        status = future.result()[0]
+        if generation == self._generation and status != HTTPStatus.SERVICE_UNAVAILABLE:
+            self._cache[key] = future.result()
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    # --- HTTP ---
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                    if len(headers) > MAX_HEADERS:
+                        raise ValueError("Too many headers")
+
+                parts = request_line.decode('latin-1').split()
+                keep_alive = (
+                    len(parts) == 3 and parts[2] == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                )
+                with diagnostics.stage('api.request'):
+                    status, body, etag = await self._respond(parts, headers)
+                head_only = parts[0] == 'HEAD' if parts else False
+                self._write_response(writer, status, body, etag, keep_alive, head_only)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass # Oversized or garbled requests and clients that hang up just lose their connection
+        finally:
+            writer.close()
+
+    async def _respond(self, parts, headers):
+        diagnostics.count('api.requests')
+        if len(parts) != 3:
+            return self._error(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+        method, target, _ = parts
+        if method not in ('GET', 'HEAD'):
+            return self._error(HTTPStatus.METHOD_NOT_ALLOWED, "Only GET and HEAD are supported.")
+        url = urlsplit(target)
+        path = url.path.rstrip('/') or '/'
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        for pattern, endpoint in ROUTES:
+            match = pattern.fullmatch(path)
+            if match:
+                break
+        else:
+            return self._error(HTTPStatus.NOT_FOUND, f"No such endpoint: {path}")
+
+        try:
+            status, body, etag = await self._get(path, query, endpoint, match.groups())
+        except database.DatabaseError as e:
+            return self._error(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+        if status == HTTPStatus.OK and etag in self._if_none_match(headers):
+            diagnostics.count('api.not_modified')
+            return HTTPStatus.NOT_MODIFIED, b'', etag
+        return status, body, etag
+
+    @staticmethod
+    def _if_none_match(headers):
+        value = headers.get('if-none-match', '')
+        return [tag.strip().removeprefix('W/') for tag in value.split(',') if tag.strip()]
+
+    @staticmethod
+    def _error(status, message):
+        return status, json.dumps({'error': message}).encode('utf-8'), None
+
+    @staticmethod
+    def _write_response(writer, status, body, etag, keep_alive, head_only=False):
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        if status != HTTPStatus.NOT_MODIFIED:
+            lines.append("Content-Type: application/json; charset=utf-8")
+            lines.append(f"Content-Length: {len(body)}")
+        if etag:
+            lines.append(f"ETag: {etag}")
+            lines.append("Cache-Control: no-cache") # Cache, but revalidate with If-None-Match
+        lines.append("Access-Control-Allow-Origin: *") # Browser-based overlays on other local ports
+        lines.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if not head_only and status != HTTPStatus.NOT_MODIFIED:
+            writer.write(body)
+
+async def serve(host=API_HOST, port=API_PORT, workers=API_WORKERS, on_started=None):
+    """Runs the API until cancelled. on_started(host, port) is called once listening."""
+    server = ApiServer(host, port, workers)
+    try:
+        address = await server.start()
+        if on_started:
+            on_started(*address)
+        await server.serve_forever()
+    finally:
+        server.close()
@@ -1,10 +1,29 @@
+import time
+_STARTUP_T0 = time.perf_counter() # Taken before any other import, for --profile-startup
+
+import multiprocessing
+import os
+import sys
 import tkinter as tk
-from tkinterdnd2 import TkinterDnD
+from tkinter import filedialog, messagebox
 
 # Import functions from the modular files
-from database import setup_database, get_session_count
-from ui_upload import LapAnalyzerApp
-from ui_viewer import DatabaseViewer
+# Screen modules (and tkinterdnd2, NumPy, watchdog behind them) are imported when first opened,
+# so the main menu can paint without paying for them.
+from database import setup_database, get_session_count, close_connections
+from tasks import TaskRunner
+
+# The results-folder watcher lives for the whole app, independent of the screen being shown
+results_watcher = None
+WATCH_REFRESH_MS = 500
+
+# App-wide worker for database setup and the main-menu session count
+app_tasks = None
+database_ready = False
+cached_session_count = None # Last known count, shown immediately while a fresh one is computed
+
+# Startup measurement (--profile-startup): milestone name -> seconds since _STARTUP_T0
+startup_marks = {}
 
 # ==============================================================================
 # MAIN APPLICATION STRUCTURE & NAVIGATION
@@ -17,14 +36,22 @@ def clear_screen(root):
 
 def open_upload_screen(root):
     """Opens the LapAnalyzerApp screen."""
+    from ui_upload import LapAnalyzerApp
     clear_screen(root)
     LapAnalyzerApp(root, back_command=lambda: show_main_menu(root))
 
 def open_database_screen(root):
     """Opens the DatabaseViewer screen."""
+    from ui_viewer import DatabaseViewer
     clear_screen(root)
     DatabaseViewer(root, back_command=lambda: show_main_menu(root))
 
+def open_diagnostics_screen(root):
+    """Opens the DiagnosticsViewer screen."""
+    from ui_diagnostics import DiagnosticsViewer
+    clear_screen(root)
+    DiagnosticsViewer(root, back_command=lambda: show_main_menu(root))
+
 def show_main_menu(root):
     """Builds and displays the main menu screen."""
 
@@ -45,7 +72,8 @@ def show_main_menu(root):
         command=lambda: open_upload_screen(root),
         width=40,
         height=2,
-        font=('Arial', 12)
+        font=('Arial', 12),
+        state=tk.NORMAL if database_ready else tk.DISABLED
     )
     upload_button.pack(pady=15)
 
@@ -56,41 +84,173 @@ def show_main_menu(root):
         command=lambda: open_database_screen(root),
         width=40,
         height=2,
-        font=('Arial', 12)
+        font=('Arial', 12),
+        state=tk.NORMAL if database_ready else tk.DISABLED
     )
     db_button.pack(pady=15)
 
-    # Setup Status
-    count = get_session_count() # Get count from database module
-    if count >= 0:
-        status_text = f"Database Ready. {count} session(s) saved."
-        status_color = 'green'
-    else:
-        status_text = "Database Error: Could not connect."
-        status_color = 'red'
+    # Option 3: Watch the Content Manager results folder and auto-import new sessions
+    watching = results_watcher is not None and results_watcher.running
+    watch_button = tk.Button(
+        root,
+        text="Stop Watching Results Folder" if watching else "Watch Results Folder (Auto-Import)",
+        command=lambda: toggle_results_watcher(root),
+        width=40,
+        height=2,
+        font=('Arial', 12)
+    )
+    watch_button.pack(pady=15)
 
-    tk.Label(
+    # Option 4: Stage timings (parsing, report building, database writes, Treeview inserts)
+    tk.Button(
         root,
-        text=status_text,
-        fg=status_color,
+        text="Diagnostics",
+        command=lambda: open_diagnostics_screen(root),
+        width=20,
         font=('Arial', 10)
-    ).pack(pady=(40, 10))
+    ).pack(pady=5)
+
+    # Setup Status: show the cached count now, refresh it in the background
+    status_label = tk.Label(root, font=('Arial', 10))
+    status_label.pack(pady=(40, 10))
+    show_session_count(status_label, cached_session_count)
+    if database_ready:
+        refresh_session_count(status_label)
+    else:
+        # Enabled once start_app's deferred database setup has finished
+        root.screen_buttons = (upload_button, db_button)
 
+    if watching:
+        tk.Label(
+            root,
+            text=f"Watching: {results_watcher.directory} ({results_watcher.backend})",
+            fg='gray',
+            font=('Arial', 9)
+        ).pack()
+        poll_watcher_status(root, status_label, results_watcher.ingested_total)
 
-def start_app():
-    """Initializes the database and runs the main application loop."""
+def show_session_count(status_label, count):
+    if count is None:
+        status_label.config(text="Opening database...", fg='gray')
+    elif count >= 0:
+        status_label.config(text=f"Database Ready. {count} session(s) saved.", fg='green')
+    else:
+        status_label.config(text="Database Error: Could not connect.", fg='red')
 
+def refresh_session_count(status_label):
+    """Counts sessions on a worker thread and updates the label if it is still on screen."""
+    def on_done(count):
+        global cached_session_count
+        cached_session_count = count
+        if status_label.winfo_exists():
+            show_session_count(status_label, count)
+    app_tasks.submit('session_count', get_session_count, on_done=on_done) # Get count from database module
+
+def poll_watcher_status(root, status_label, seen_total):
+    """Refreshes the main-menu session count whenever the watcher has ingested new sessions."""
+    if not status_label.winfo_exists() or results_watcher is None or not results_watcher.running:
+        return
+    if results_watcher.ingested_total != seen_total:
+        seen_total = results_watcher.ingested_total
+        refresh_session_count(status_label)
+    if results_watcher.last_error is not None:
+        status_label.config(text=f"Auto-import error: {results_watcher.last_error}", fg='red')
+    root.after(WATCH_REFRESH_MS, lambda: poll_watcher_status(root, status_label, seen_total))
+
+def toggle_results_watcher(root):
+    """Starts or stops auto-ingest of the Content Manager results folder."""
+    global results_watcher
+    if results_watcher is not None and results_watcher.running:
+        results_watcher.stop()
+    else:
+        from watcher import ResultsWatcher, DEFAULT_RESULTS_DIR
+        directory = DEFAULT_RESULTS_DIR
+        if not os.path.isdir(directory):
+            directory = filedialog.askdirectory(title="Select Content Manager Results Folder")
+            if not directory:
+                return
+        results_watcher = ResultsWatcher(directory)
+        try:
+            results_watcher.start()
+        except OSError as e:
+            messagebox.showerror("Watch Error", f"Could not watch results folder: {e}")
+            return
+    show_main_menu(root)
+
+
+def on_database_ready(root, count):
+    """Runs on the Tk thread once the deferred setup_database() and first count have finished."""
+    global database_ready, cached_session_count
+    database_ready = True
+    cached_session_count = count
+    mark_startup("database_ready")
+
+    for button in getattr(root, 'screen_buttons', ()):
+        if button.winfo_exists():
+            button.config(state=tk.NORMAL)
+    root.screen_buttons = ()
+    for widget in root.winfo_children():
+        # Only the main menu can be showing before the database is ready
+        if isinstance(widget, tk.Label) and widget.cget('text') == "Opening database...":
+            show_session_count(widget, count)
+
+def on_database_error(root, error):
+    global cached_session_count
+    cached_session_count = -1
+    mark_startup("database_ready")
+    messagebox.showerror("Database Error", str(error))
+
+def setup_and_count():
     setup_database() # Call setup from database module
+    return get_session_count()
+
+def mark_startup(name):
+    startup_marks.setdefault(name, time.perf_counter() - _STARTUP_T0)
+
+def report_startup(root):
+    """--profile-startup: prints the startup milestones (ms) to stderr and exits."""
+    if 'database_ready' not in startup_marks:
+        root.after(10, lambda: report_startup(root))
+        return
+    for name, seconds in sorted(startup_marks.items(), key=lambda item: item[1]):
+        print(f"{name:>16}: {seconds * 1000:8.1f} ms", file=sys.stderr)
+    root.destroy()
+
+def start_app(profile_startup=False):
+    """Paints the main menu first, then initializes the database in the background and runs the main loop."""
+    global app_tasks
+    mark_startup("imports")
 
-    root = TkinterDnD.Tk()
+    root = tk.Tk()
     root.title("Sim Racing Data Analyzer")
     root.geometry("950x600")
     root.columnconfigure(0, weight=1)
     root.rowconfigure(0, weight=1)
+    mark_startup("tk_init")
 
+    app_tasks = TaskRunner(root, max_workers=1)
     show_main_menu(root)
 
+    # Process the pending map/expose events now, so the first frame is on screen before any DB work
+    root.update()
+    mark_startup("first_frame")
+
+    app_tasks.submit(
+        'setup', setup_and_count,
+        on_done=lambda count: on_database_ready(root, count),
+        on_error=lambda e: on_database_error(root, e)
+    )
+    if profile_startup:
+        report_startup(root)
+
     root.mainloop()
 
+    if results_watcher is not None:
+        results_watcher.stop()
+    # Release the shared database connections (checkpoints the WAL) once the window closes
+    close_connections()
+
 if __name__ == "__main__":
-    start_app()
\ No newline at end of file
+    # Bulk import uses a process pool; in the frozen exe, workers would otherwise start another GUI
+    multiprocessing.freeze_support()
+    start_app(profile_startup='--profile-startup' in sys.argv[1:])
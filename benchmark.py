@@ -0,0 +1,198 @@
+"""
+Performance benchmarks for the analysis and database hot paths.
+
+Seeds a throwaway database per size with synthetic sessions (see synthetic_results.py),
+times analyze_ac_session, save_session_data, get_sessions, get_laps_for_session and
+delete_session_by_id, and writes the timings as JSON. Pass --compare with an earlier
+results file to flag regressions between versions:
+
+    python benchmark.py -o bench_new.json --compare bench_old.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import database
+from analysis import SessionAnalysis, analyze_ac_session
+from synthetic_results import CARS, TRACKS, generate_laps, write_results
+
+DEFAULT_SIZES = ('1k', '100k', '1M')
+LAPS_PER_SESSION = 50
+SEED_BATCH_SESSIONS = 1000
+REGRESSION_THRESHOLD = 0.20 # A median this much slower than the baseline counts as a regression
+
+def parse_size(text):
+    """'1k' -> 1000, '100k' -> 100000, '1M' -> 1000000 (laps)."""
+    multipliers = {'k': 1000, 'm': 1000000}
+    suffix = text[-1].lower()
+    if suffix in multipliers:
+        return int(float(text[:-1]) * multipliers[suffix])
+    return int(text)
+
+def _display_name(track_id, car_id):
+    # Same clean-up analyze_ac_session applies before saving
+    return (track_id.replace("ks_", "").replace("-", " ").title(), car_id.replace("ks_", "").replace("_", " ").title())
+
+def synthetic_session(rng, index, laps=LAPS_PER_SESSION):
+    """A SessionAnalysis (as analyze_ac_session returns) for one synthetic single-driver session."""
+    track_id, sector_count, base_ms = rng.choice(TRACKS)
+    session = SessionAnalysis(f"benchmark_{index}.json")
+    session.track, session.car = _display_name(track_id, rng.choice(CARS))
+    started = datetime.datetime(2022, 1, 1) + datetime.timedelta(minutes=37 * index)
+    session.session_datetime = started.strftime('%Y-%m-%dT%H:%M:%S')
+    session.file_size, session.file_mtime = 0, 0
+    for lap in generate_laps(rng, 1, laps, sector_count, base_ms):
+        session.add_lap(lap['time'], lap['sectors'], lap['cuts'])
+    session.finish()
+    return session
+
+def seed_database(path, lap_count, seed=0):
+    """Creates (or reuses, if it already holds lap_count laps) a benchmark database at path."""
+    database.DB_NAME = path
+    database.setup_database()
+    existing = database.get_connection().execute("SELECT COUNT(*) FROM laps").fetchone()[0]
+    if existing == lap_count:
+        return
+    if existing:
+        database.close_connections()
+        os.remove(path)
+        database.setup_database()
+
+    rng = random.Random(seed)
+    sessions = max(1, lap_count // LAPS_PER_SESSION)
+    for start in range(0, sessions, SEED_BATCH_SESSIONS):
+        batch = [synthetic_session(rng, i) for i in range(start, min(sessions, start + SEED_BATCH_SESSIONS))]
+        database.save_sessions_batch(batch)
+    database.get_connection().execute("ANALYZE")
+
+def measure(fn, repeat):
+    """Calls fn() repeat times; returns median/min/max wall time in ms."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 4),
+        'min_ms': round(min(timings), 4),
+        'max_ms': round(max(timings), 4),
+        'runs': repeat,
+    }
+
+def bench_analysis(work_dir, repeat):
+    """analyze_ac_session on a typical practice file and on a large multi-driver file."""
+    small = write_results(os.path.join(work_dir, 'files_small'), 1, players=1, laps_per_player=30)[0]
+    large = write_results(os.path.join(work_dir, 'files_large'), 1, players=8, laps_per_player=60, sessions=3)[0]
+    return {
+        'analyze_ac_session[1 driver, 30 laps]': measure(lambda: analyze_ac_session(small), repeat),
+        'analyze_ac_session[8 drivers, 3 sessions]': measure(lambda: analyze_ac_session(large), repeat),
+    }
+
+def bench_database(repeat, rng):
+    """Database benchmarks against the currently seeded DB_NAME."""
+    conn = database.get_connection()
+    ids = [row[0] for row in conn.execute("SELECT id FROM sessions")]
+    car = conn.execute("SELECT car_model FROM sessions LIMIT 1").fetchone()[0]
+    results = {}
+
+    pending = iter([synthetic_session(rng, 10000000 + i) for i in range(repeat)])
+    results['save_session_data'] = measure(lambda: database.save_session_data(next(pending)), repeat)
+
+    results['get_sessions[all]'] = measure(lambda: database.get_sessions(), repeat)
+    results['get_sessions[car]'] = measure(lambda: database.get_sessions(car_filter=car), repeat)
+    results['get_laps_for_session'] = measure(lambda: database.get_laps_for_session(rng.choice(ids)), repeat)
+
+    # Delete the sessions the save benchmark added, so the database keeps its size for the next run
+    added = iter([row[0] for row in conn.execute("SELECT id FROM sessions ORDER BY id DESC LIMIT ?", (repeat,))])
+    results['delete_session_by_id'] = measure(lambda: database.delete_session_by_id(next(added)), repeat)
+    return results
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes, repeat, db_dir, seed=0):
+    rng = random.Random(seed)
+    report = {
+        'revision': _git_revision(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'laps_per_session': LAPS_PER_SESSION,
+        'repeat': repeat,
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        report['results']['analysis'] = bench_analysis(work_dir, repeat)
+        print("analysis: done", file=sys.stderr)
+
+        for size in sizes:
+            lap_count = parse_size(size)
+            path = os.path.join(db_dir or work_dir, f"bench_{size}.db")
+            start = time.perf_counter()
+            seed_database(path, lap_count, seed)
+            print(f"{size}: seeded in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            report['results'][size] = bench_database(repeat, rng)
+            database.close_connections()
+
+    return report
+
+def compare(report, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns [(group, benchmark, old_ms, new_ms)] for medians that got slower than threshold."""
+    regressions = []
+    for group, benchmarks in report['results'].items():
+        for name, timing in benchmarks.items():
+            old = baseline.get('results', {}).get(group, {}).get(name)
+            if old and old['median_ms'] > 0 and timing['median_ms'] > old['median_ms'] * (1 + threshold):
+                regressions.append((group, name, old['median_ms'], timing['median_ms']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark analysis and database operations.")
+    parser.add_argument('--sizes', default=",".join(DEFAULT_SIZES), help="Database sizes in laps (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=20, help="Runs per benchmark")
+    parser.add_argument('--db-dir', help="Keep seeded databases here and reuse them on the next run")
+    parser.add_argument('-o', '--output', default='benchmark_results.json')
+    parser.add_argument('--compare', metavar='BASELINE', help="Earlier results JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.db_dir:
+        os.makedirs(args.db_dir, exist_ok=True)
+    report = run([s.strip() for s in args.sizes.split(',') if s.strip()], args.repeat, args.db_dir)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    for group, benchmarks in report['results'].items():
+        for name, timing in benchmarks.items():
+            print(f"{group:>8}  {name:<42} {timing['median_ms']:10.3f} ms")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for group, name, old, new in regressions:
+            print(f"REGRESSION {group} {name}: {old:.3f} ms -> {new:.3f} ms", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
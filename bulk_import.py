@@ -0,0 +1,138 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Import functions from other modules
+import diagnostics
+from analysis import analyze_ac_session
+from database import get_ingest_ledger, save_sessions_batch
+
+BATCH_SIZE = 200 # Sessions written per transaction
+PARALLEL_THRESHOLD = 8 # Fewer files than this are parsed in-process (pool startup would dominate)
+
+def find_result_files(paths):
+    """
+    Expands a list of dropped/selected paths into a sorted list of JSON files.
+    Directories are walked recursively; plain files are kept if they end in .json.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, _, file_names in os.walk(path):
+                for name in file_names:
+                    if name.lower().endswith('.json'):
+                        files.append(os.path.join(dir_path, name))
+        elif os.path.isfile(path) and path.lower().endswith('.json'):
+            files.append(path)
+    return sorted(files)
+
+def _parse_file(file_path):
+    """
+    Worker-process entry point. Only the compact SessionAnalysis (typed lap arrays, no report)
+    is pickled back to the parent. Returns (session, parse_ms); parse_ms is returned because
+    timings recorded in a worker process stay there.
+    """
+    start = time.perf_counter()
+    session = analyze_ac_session(file_path)
+    return session, (time.perf_counter() - start) * 1000
+
+def filter_unchanged(file_paths):
+    """
+    Splits file paths into (to_parse, unchanged) using the ingest ledger.
+    A file is unchanged when its size and mtime match the ledger entry, so it is never re-parsed.
+    """
+    ledger = get_ingest_ledger()
+    to_parse, unchanged = [], []
+    for path in file_paths:
+        entry = ledger.get(os.path.abspath(path))
+        if entry:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat and entry == (stat.st_size, stat.st_mtime_ns):
+                unchanged.append(path)
+                continue
+        to_parse.append(path)
+    return to_parse, unchanged
+
+def _parse_all(file_paths, workers):
+    """Yields (session, parse_ms) per file, in completion order (session is None if parsing crashed)."""
+    if workers == 0 or len(file_paths) < PARALLEL_THRESHOLD:
+        for path in file_paths:
+            try:
+                yield _parse_file(path)
+            except Exception:
+                yield None, 0.0
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_parse_file, path) for path in file_paths]
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception:
+                yield None, 0.0
+
+def import_files(file_paths, workers=None, progress_callback=None):
+    """
+    Parses the given result files across a process pool (workers=0, or a handful
+    of files, parses in-process) and saves all valid sessions in batched
+    transactions. Files recorded unchanged in the ingest ledger are skipped
+    without parsing; duplicate content is not saved twice.
+
+    progress_callback(stats) is called after each parsed file with a dict:
+    {'done', 'total', 'saved', 'skipped', 'unchanged', 'duplicates', 'elapsed', 'files_per_sec'}.
+    Returns the final stats dict.
+    """
+    start = time.perf_counter()
+    to_parse, unchanged = filter_unchanged(file_paths)
+    stats = {
+        'done': 0,
+        'total': len(to_parse),
+        'saved': 0,
+        'skipped': 0,
+        'unchanged': len(unchanged),
+        'duplicates': 0,
+        'elapsed': 0.0,
+        'files_per_sec': 0.0
+    }
+    if not to_parse:
+        return stats
+
+    pending, unusable = [], []
+
+    def flush():
+        saved, duplicates = save_sessions_batch(pending, unusable)
+        stats['saved'] += saved
+        stats['duplicates'] += duplicates
+        pending.clear()
+        unusable.clear()
+
+    diagnostics.count('bulk_import.files_unchanged', len(unchanged))
+    for session, parse_ms in _parse_all(to_parse, workers):
+        diagnostics.record('bulk_import.parse_file', parse_ms)
+        if session is not None and session.usable:
+            pending.append(session)
+        else:
+            stats['skipped'] += 1
+            # Remember readable files without valid laps so re-scans skip them too
+            if session is not None and session.readable:
+                unusable.append(session)
+        if len(pending) + len(unusable) >= BATCH_SIZE:
+            flush()
+
+        stats['done'] += 1
+        stats['elapsed'] = time.perf_counter() - start
+        stats['files_per_sec'] = stats['done'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+        if progress_callback:
+            progress_callback(stats)
+
+    flush()
+    stats['elapsed'] = time.perf_counter() - start
+    stats['files_per_sec'] = stats['done'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+    return stats
+
+def import_directory(directory, workers=None, progress_callback=None):
+    """Walks a Content Manager results folder and bulk-imports every JSON file in it."""
+    return import_files(find_result_files([directory]), workers=workers, progress_callback=progress_callback)
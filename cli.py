@@ -0,0 +1,357 @@
+"""
+Headless command-line entry point for the Sim Racing Data Analyzer.
+
+Imports no GUI modules, so it runs on machines without a display (ingest boxes, cron).
+Errors go to stderr and are reported through the exit code:
+0 = success, 1 = error, 2 = invalid usage, 3 = requested item not found.
+"""
+import argparse
+import csv
+import datetime
+import multiprocessing
+import sys
+
+import database
+import diagnostics
+from analysis import analyze_ac_session, format_ms_to_time
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_NOT_FOUND = 3
+
+def cmd_analyze(args):
+    if args.all_drivers:
+        # Imported on demand: the NumPy engine is the slowest import in the project
+        from engine import analyze_results
+        try:
+            report = analyze_results(args.file).render_report()
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return EXIT_ERROR
+        print("\n".join(report))
+        return EXIT_OK
+
+    session = analyze_ac_session(args.file)
+    print("\n".join(session.report()))
+    if not session.readable:
+        return EXIT_ERROR # The report holds the read/parse error
+    if args.save:
+        if not session.usable:
+            print("Error: No valid laps; session not saved.", file=sys.stderr)
+            return EXIT_ERROR
+        database.setup_database() # Only analyze --save touches the database
+        database.save_session_data(session)
+        print("Session saved.")
+    return EXIT_OK
+
+def cmd_import(args):
+    from bulk_import import find_result_files, import_files
+
+    files = find_result_files(args.paths)
+    if not files:
+        print("Error: No JSON result files found.", file=sys.stderr)
+        return EXIT_NOT_FOUND
+
+    def progress(stats):
+        print(f"\r{stats['done']}/{stats['total']} parsed ({stats['files_per_sec']:.1f} files/s)", end="", file=sys.stderr)
+
+    stats = import_files(files, workers=args.workers, progress_callback=None if args.quiet else progress)
+    if not args.quiet and stats['total']:
+        print(file=sys.stderr)
+    print(
+        f"saved={stats['saved']} unchanged={stats['unchanged']} duplicates={stats['duplicates']} "
+        f"skipped={stats['skipped']} elapsed={stats['elapsed']:.2f}s"
+    )
+    return EXIT_OK
+
+def cmd_list(args):
+    records = database.get_sessions_page(
+        car_filter=args.car, track_filter=args.track, limit=args.limit, date_from=args.date_from, date_to=args.date_to
+    )
+    writer = csv.writer(sys.stdout, delimiter='\t', lineterminator='\n')
+    writer.writerow(('id', 'car', 'track', 'best_lap', 'theoretical', 'date'))
+    for row in records:
+        writer.writerow((row[0], row[1], row[2], format_ms_to_time(row[3]), format_ms_to_time(row[4]), row[5]))
+    return EXIT_OK
+
+def cmd_laps(args):
+    if args.analytics:
+        return cmd_lap_analytics(args)
+    laps = database.get_laps_for_session(args.session_id)
+    if not laps:
+        print(f"Error: No laps found for session {args.session_id}.", file=sys.stderr)
+        return EXIT_NOT_FOUND
+    writer = csv.writer(sys.stdout, delimiter='\t', lineterminator='\n')
+    writer.writerow(('lap', 'time', 's1', 's2', 's3', 'cuts', 'valid'))
+    for lap_number, lap_time, s1, s2, s3, cuts, is_valid in laps:
+        writer.writerow((
+            lap_number, format_ms_to_time(lap_time), format_ms_to_time(s1),
+            format_ms_to_time(s2), format_ms_to_time(s3), cuts, is_valid
+        ))
+    return EXIT_OK
+
+def cmd_lap_analytics(args):
+    laps = database.get_lap_analytics(args.session_id, window=args.window)
+    if not laps:
+        print(f"Error: No laps found for session {args.session_id}.", file=sys.stderr)
+        return EXIT_NOT_FOUND
+    writer = csv.writer(sys.stdout, delimiter='\t', lineterminator='\n')
+    writer.writerow(('lap', 'time', 'valid', 'delta_ms', 'rolling_avg', 'rolling_stddev_ms', 'stint', 'stint_lap', 'percent_rank'))
+    for lap_number, lap_time, s1, s2, s3, cuts, is_valid, delta, avg, stddev, stint, stint_lap, rank in laps:
+        writer.writerow((
+            lap_number, format_ms_to_time(lap_time), is_valid, round(delta) if delta is not None else '', format_ms_to_time(avg) if avg is not None else '',
+            f"{stddev:.1f}" if stddev is not None else '', stint or '', stint_lap or '',
+            f"{rank:.3f}" if rank is not None else ''
+        ))
+
+    stats = database.get_session_consistency(args.session_id)
+    if stats:
+        print(
+            f"clean_laps={stats['clean_laps']} mean={format_ms_to_time(stats['mean'])} "
+            f"stddev_ms={stats['stddev']:.1f} consistency={stats['consistency']:.2f}% "
+            f"p10={format_ms_to_time(stats['p10'])} p50={format_ms_to_time(stats['p50'])} "
+            f"p90={format_ms_to_time(stats['p90'])} stints={stats['stints']}",
+            file=sys.stderr
+        )
+    return EXIT_OK
+
+def cmd_search(args):
+    for kind, name in database.search_names(args.query, kind=args.kind, limit=args.limit):
+        print(f"{kind}\t{name}")
+    return EXIT_OK
+
+def print_reclaim_warning():
+    error = database.get_reclaim_error()
+    if error is not None:
+        print(f"Warning: Disk space was not reclaimed: {error}", file=sys.stderr)
+
+def cmd_delete(args):
+    deleted = database.delete_sessions(args.session_ids)
+    if not deleted:
+        print(f"Error: No session with id {', '.join(map(str, args.session_ids))}.", file=sys.stderr)
+        return EXIT_ERROR
+    print(f"Deleted {deleted} session(s).")
+    print_reclaim_warning()
+    return EXIT_OK
+
+def cmd_prune(args):
+    if args.keep_last is None and args.invalid_older_than is None:
+        print("Error: Give --keep-last and/or --invalid-older-than.", file=sys.stderr)
+        return EXIT_USAGE
+    session_ids = database.prune_sessions(args.keep_last, args.invalid_older_than, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"Would delete {len(session_ids)} session(s): {' '.join(map(str, session_ids))}")
+    else:
+        print(f"Deleted {len(session_ids)} session(s).")
+        print_reclaim_warning()
+    return EXIT_OK
+
+def cmd_vacuum(args):
+    reclaimed = database.reclaim_space(full=True)
+    print(f"Reclaimed {reclaimed / 1048576:.1f} MB.")
+    return EXIT_OK
+
+def cmd_telemetry_import(args):
+    from telemetry import ingest_telemetry_csv  # NumPy; only needed for telemetry
+
+    try:
+        stats = ingest_telemetry_csv(args.session_id, args.file, lap_offset=args.lap_offset)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    ratio = stats['raw_bytes'] / stats['stored_bytes'] if stats['stored_bytes'] else 0
+    print(
+        f"Stored {stats['samples']} sample(s) of {stats['laps']} lap(s), {stats['channels']} channel(s): "
+        f"{stats['raw_bytes'] / 1048576:.1f} MB raw, {stats['stored_bytes'] / 1048576:.1f} MB stored ({ratio:.1f}x)."
+    )
+    if stats['skipped_laps']:
+        print(f"Skipped laps not in session {args.session_id}: {' '.join(map(str, stats['skipped_laps']))}", file=sys.stderr)
+    return EXIT_OK
+
+def cmd_telemetry(args):
+    rows = database.get_telemetry_summary(args.session_id)
+    if not rows:
+        print(f"No telemetry for session {args.session_id}.", file=sys.stderr)
+        return EXIT_NOT_FOUND
+    print("lap\tlap_id\tchannels\tsamples\tstored_kb")
+    for lap_number, lap_id, channels, samples, stored in rows:
+        print(f"{lap_number}\t{lap_id}\t{channels}\t{samples}\t{stored / 1024:.1f}")
+    return EXIT_OK
+
+def cmd_merge(args):
+    if not args.sources:
+        for source, last_session_id, merged, merged_at in database.get_merge_sources():
+            print(f"{source}\tlast_id={last_session_id}\tsessions={merged}\tmerged_at={merged_at}")
+        return EXIT_OK
+    status = EXIT_OK
+    for source in args.sources:
+        # One transaction per source: a broken rig file does not stop the others
+        try:
+            stats = database.merge_database(source, full=args.full)
+        except database.DatabaseError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            status = EXIT_ERROR
+            continue
+        print(
+            f"{source}: merged {stats['sessions']} session(s), {stats['laps']} lap(s), "
+            f"{stats['telemetry']} telemetry channel(s); {stats['duplicates']} duplicate(s) skipped"
+        )
+    return status
+
+def cmd_serve(args):
+    import asyncio
+    from api import serve
+
+    def on_started(host, port):
+        print(f"Serving the session API on http://{host}:{port}/ (Ctrl+C to stop)", file=sys.stderr)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, on_started=on_started))
+    except KeyboardInterrupt:
+        pass
+    return EXIT_OK
+
+def cmd_export(args):
+    from export import ExportError, export_laps
+
+    target = sys.stdout if args.output == '-' else args.output
+    try:
+        rows = export_laps(
+            target, fmt=args.format, car_filter=args.car, track_filter=args.track,
+            date_from=args.date_from, date_to=args.date_to
+        )
+    except ExportError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    print(f"Exported {rows} lap(s).", file=sys.stderr)
+    return EXIT_OK
+
+def cmd_rebuild_stats(args):
+    database.rebuild_combo_stats()
+    print("Car/track statistics rebuilt.")
+    return EXIT_OK
+
+def print_timings():
+    stages, counters = diagnostics.snapshot()
+    for name in sorted(stages):
+        s = stages[name]
+        print(
+            f"{name:<32} n={s['count']:<7} total={s['total_ms']:10.1f} ms  mean={s['mean_ms']:8.3f} ms  "
+            f"p95<={s['p95_ms']:g} ms  max={s['max_ms']:.3f} ms",
+            file=sys.stderr
+        )
+    for name in sorted(counters):
+        print(f"{name:<32} {counters[name]}", file=sys.stderr)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="aca", description="Assetto Corsa session analyzer (headless).")
+    parser.add_argument('--db', default=database.DB_NAME, help="SQLite database file (default: %(default)s)")
+    parser.add_argument('--timings', action='store_true', help="Print per-stage timings to stderr when done")
+    commands = parser.add_subparsers(dest='command', required=True)
+    # Every command but analyze creates/migrates --db first; analyze alone must not create a file
+    parser.set_defaults(uses_database=True)
+
+    p = commands.add_parser('analyze', help="Print the analysis report for a results JSON file")
+    p.add_argument('file')
+    p.add_argument('--save', action='store_true', help="Also save the session to the database")
+    p.add_argument('--all-drivers', action='store_true', help="Report every driver in every session")
+    p.set_defaults(func=cmd_analyze, uses_database=False)
+
+    p = commands.add_parser('import', help="Bulk-import result files and/or folders")
+    p.add_argument('paths', nargs='+')
+    p.add_argument('--workers', type=int, default=None, help="Parser processes (0 = parse in-process)")
+    p.add_argument('-q', '--quiet', action='store_true', help="No progress output")
+    p.set_defaults(func=cmd_import)
+
+    p = commands.add_parser('list', help="List saved sessions, newest first")
+    p.add_argument('--car', default='All Cars')
+    p.add_argument('--track', default='All Tracks')
+    p.add_argument('--limit', type=int, default=database.SESSION_PAGE_SIZE)
+    p.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat, help="First session date, YYYY-MM-DD")
+    p.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat, help="Last session date, YYYY-MM-DD")
+    p.set_defaults(func=cmd_list)
+
+    p = commands.add_parser('laps', help="Show the laps of one session")
+    p.add_argument('session_id', type=int)
+    p.add_argument('--analytics', action='store_true', help="Add delta to best, rolling consistency and stints")
+    p.add_argument('--window', type=int, default=database.ROLLING_WINDOW, help="Rolling window in laps (with --analytics)")
+    p.set_defaults(func=cmd_laps)
+
+    p = commands.add_parser('search', help="Find car and track names (type-ahead search)")
+    p.add_argument('query')
+    p.add_argument('--kind', choices=('car', 'track'), default=None)
+    p.add_argument('--limit', type=int, default=database.SEARCH_LIMIT)
+    p.set_defaults(func=cmd_search)
+
+    p = commands.add_parser('delete', help="Delete sessions and their laps")
+    p.add_argument('session_ids', type=int, nargs='+')
+    p.set_defaults(func=cmd_delete)
+
+    p = commands.add_parser('prune', help="Delete sessions by retention rules, in one transaction")
+    p.add_argument('--keep-last', type=int, metavar='N', help="Keep only the newest N sessions per car/track")
+    p.add_argument('--invalid-older-than', type=int, metavar='DAYS', help="Delete sessions without valid laps older than DAYS")
+    p.add_argument('--dry-run', action='store_true', help="Only list the sessions that would be deleted")
+    p.set_defaults(func=cmd_prune)
+
+    p = commands.add_parser('vacuum', help="Rewrite the database file to reclaim all free space")
+    p.set_defaults(func=cmd_vacuum)
+
+    p = commands.add_parser('import-telemetry', help="Store a per-lap telemetry CSV with a saved session")
+    p.add_argument('session_id', type=int)
+    p.add_argument('file', help="CSV with a lap column and one column per channel")
+    p.add_argument('--lap-offset', type=int, default=0, help="Added to the CSV's lap numbers (1 if the logger counts from 0)")
+    p.set_defaults(func=cmd_telemetry_import)
+
+    p = commands.add_parser('telemetry', help="Show the stored telemetry of a session per lap")
+    p.add_argument('session_id', type=int)
+    p.set_defaults(func=cmd_telemetry)
+
+    p = commands.add_parser('merge', help="Merge new sessions from rig databases into --db (no sources: show watermarks)")
+    p.add_argument('sources', nargs='*', help="Rig sim_data.db files")
+    p.add_argument('--full', action='store_true', help="Ignore the watermarks and re-check every session (deduplicated)")
+    p.set_defaults(func=cmd_merge)
+
+    p = commands.add_parser('serve', help="Serve sessions, laps and bests as read-only JSON over HTTP")
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--workers', type=int, default=2, help="Query threads (default: %(default)s)")
+    p.set_defaults(func=cmd_serve)
+
+    p = commands.add_parser('export', help="Export laps joined with sessions as CSV, Parquet or Arrow")
+    p.add_argument('-o', '--output', default='-', help="Output file (default: CSV to stdout)")
+    p.add_argument('--format', choices=('csv', 'parquet', 'arrow'), default=None, help="Default: from the file extension")
+    p.add_argument('--car', default='All Cars')
+    p.add_argument('--track', default='All Tracks')
+    p.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat, help="First session date, YYYY-MM-DD")
+    p.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat, help="Last session date, YYYY-MM-DD")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser('rebuild-stats', help="Recompute the per car/track personal-best table")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    database.DB_NAME = args.db
+    try:
+        if args.uses_database:
+            database.setup_database()
+        return args.func(args)
+    except database.DatabaseError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        database.close_connections()
+        if args.timings:
+            print_timings()
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support() # Bulk import workers in a frozen build
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Lap-by-lap and sector-by-sector comparison of several sessions against a reference session.
+
+Lap data is kept per session as typed arrays in an LRU cache, so switching the reference,
+the compared metric or between recently compared sessions does not touch the database.
+"""
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+import diagnostics
+from database import get_laps_for_sessions
+
+# Total laps held by the shared cache (~50 bytes per lap); override with ACA_LAP_CACHE_LAPS
+LAP_ARRAY_CACHE_LAPS = int(os.environ.get('ACA_LAP_CACHE_LAPS', 500000))
+
+METRICS = ('lap_time', 'sector_1', 'sector_2', 'sector_3')
+METRIC_LABELS = {'lap_time': "Lap Time", 'sector_1': "Sector 1", 'sector_2': "Sector 2", 'sector_3': "Sector 3"}
+
+class SessionLaps:
+    """The laps of one saved session as typed arrays; missing times are -1."""
+    __slots__ = ('session_id', 'lap_number', 'lap_time', 'sector_1', 'sector_2', 'sector_3', 'is_valid')
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.lap_number = array('i')
+        self.lap_time = array('q')
+        self.sector_1 = array('q')
+        self.sector_2 = array('q')
+        self.sector_3 = array('q')
+        self.is_valid = array('b')
+
+    def __len__(self):
+        return len(self.lap_number)
+
+    def add(self, lap_number, lap_time, s1, s2, s3, is_valid):
+        self.lap_number.append(lap_number)
+        self.lap_time.append(int(lap_time) if lap_time is not None else -1)
+        self.sector_1.append(int(s1) if s1 is not None else -1)
+        self.sector_2.append(int(s2) if s2 is not None else -1)
+        self.sector_3.append(int(s3) if s3 is not None else -1)
+        self.is_valid.append(1 if is_valid else 0)
+
+    def best(self, metric):
+        """Best value of metric over the valid laps, or -1."""
+        values = [v for v, valid in zip(getattr(self, metric), self.is_valid) if valid and v > 0]
+        return min(values) if values else -1
+
+    def theoretical(self):
+        """Sum of the best sectors (2 or 3 sector tracks), or -1, as in analysis.SessionAnalysis."""
+        b1, b2, b3 = (self.best(metric) for metric in ('sector_1', 'sector_2', 'sector_3'))
+        if b1 > 0 and b2 > 0:
+            return b1 + b2 + (b3 if b3 > 0 else 0)
+        return -1
+
+class LapArrayCache:
+    """
+    Thread-safe LRU cache of SessionLaps by session id, bounded by the total number of laps held.
+    Saved laps never change, so entries only need invalidating when a session is deleted.
+    """
+    def __init__(self, max_laps=LAP_ARRAY_CACHE_LAPS):
+        self.max_laps = max_laps
+        self._entries = OrderedDict()
+        self._laps = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, session_ids):
+        """Returns {session_id: SessionLaps}, loading all missing sessions with one query."""
+        session_ids = [int(session_id) for session_id in session_ids]
+        found = {}
+        with self._lock:
+            for session_id in session_ids:
+                entry = self._entries.get(session_id)
+                if entry is not None:
+                    self._entries.move_to_end(session_id)
+                    found[session_id] = entry
+        missing = [session_id for session_id in session_ids if session_id not in found]
+        diagnostics.count('comparison.cache_hits', len(found))
+        if not missing:
+            return found
+
+        diagnostics.count('comparison.cache_misses', len(missing))
+        loaded = {session_id: SessionLaps(session_id) for session_id in missing}
+        for session_id, *lap in get_laps_for_sessions(missing):
+            loaded[session_id].add(*lap)
+        with self._lock:
+            for session_id, entry in loaded.items():
+                self._put(session_id, entry)
+        found.update(loaded)
+        return found
+
+    def _put(self, session_id, entry):
+        old = self._entries.pop(session_id, None)
+        if old is not None:
+            self._laps -= len(old)
+        self._entries[session_id] = entry
+        self._laps += len(entry)
+        # Evict least recently used sessions, but always keep the newest one
+        while self._laps > self.max_laps and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._laps -= len(evicted)
+
+    def invalidate(self, session_id):
+        with self._lock:
+            entry = self._entries.pop(int(session_id), None)
+            if entry is not None:
+                self._laps -= len(entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._laps = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+# Shared by every viewer screen, so comparisons stay cached when the screen is reopened
+lap_cache = LapArrayCache()
+
+def compare_laps(reference, sessions, metric='lap_time'):
+    """
+    Lines up the laps of sessions (SessionLaps, reference included) by lap number.
+    Returns rows [lap_number, (value, delta, is_valid) per session]: value is -1 when the session
+    has no such lap or time, delta is value minus the reference's value (None if either is missing).
+    """
+    columns = []
+    for session in sessions:
+        columns.append({
+            n: (value, valid) for n, value, valid in zip(session.lap_number, getattr(session, metric), session.is_valid)
+        })
+    reference_column = columns[sessions.index(reference)]
+
+    rows = []
+    for lap_number in sorted(set().union(*columns)):
+        reference_value = reference_column.get(lap_number, (-1, 0))[0]
+        cells = []
+        for column in columns:
+            value, valid = column.get(lap_number, (-1, 0))
+            delta = value - reference_value if value > 0 and reference_value > 0 else None
+            cells.append((value, delta, valid))
+        rows.append([lap_number] + cells)
+    return rows
+
+def compare_bests(reference, sessions):
+    """
+    Per session: {'laps', 'valid_laps', metric: (best, delta to the reference best) for every
+    metric, 'theoretical': (value, delta)}. Deltas are None where either side has no time.
+    """
+    def with_delta(value, reference_value):
+        return value, (value - reference_value if value > 0 and reference_value > 0 else None)
+
+    reference_bests = {metric: reference.best(metric) for metric in METRICS}
+    reference_theoretical = reference.theoretical()
+    summary = []
+    for session in sessions:
+        entry = {'laps': len(session), 'valid_laps': sum(session.is_valid)}
+        for metric in METRICS:
+            entry[metric] = with_delta(session.best(metric), reference_bests[metric])
+        entry['theoretical'] = with_delta(session.theoretical(), reference_theoretical)
+        summary.append(entry)
+    return summary
@@ -1,225 +1,1429 @@
+import atexit
+import calendar
+import datetime
+import math
+import os
+import pathlib
 import sqlite3
-from tkinter import messagebox
+import threading
+
+import diagnostics
 
 DB_NAME = "sim_data.db"
 
-import sqlite3
-from tkinter import messagebox
+# --- Errors ---
+# This module never touches the GUI: failures are raised and reported by the caller
+# (message boxes in the Tk screens, stderr and exit codes in the CLI).
 
-DB_NAME = "sim_data.db"
+class DatabaseError(Exception):
+    """A database operation failed. The original sqlite3 error is chained as __cause__."""
 
-def setup_database():
-# ... (function body remains the same as date_time handling is in insert) ...
-    # Ensure S3 column and tables exist (implementation remains the same)
-    conn = None
+class DuplicateSessionError(DatabaseError):
+    """The session file's content is already stored (matching content_hash)."""
+
+# --- Connection Management ---
+# One long-lived connection per thread, so hot paths (main menu count, Treeview clicks)
+# never pay connection setup and SQLite's statement cache stays warm.
+
+_local = threading.local()
+_all_connections = []
+_connections_lock = threading.Lock()
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA auto_vacuum = INCREMENTAL", # New files only; existing ones switch on their next VACUUM
+    "PRAGMA foreign_keys = ON",       # Deleting a session cascades to its laps
+    "PRAGMA journal_mode = WAL",      # Readers never block the writer (and vice versa)
+    "PRAGMA synchronous = NORMAL",    # Safe with WAL, avoids an fsync per commit
+    "PRAGMA cache_size = -16000",     # 16 MB page cache
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",   # 256 MB memory-mapped reads
+)
+
+# Connections of threads marked with use_read_only_connection() (e.g. the HTTP API's query pool)
+READ_ONLY_PRAGMAS = (
+    "PRAGMA query_only = ON",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+)
+
+def use_read_only_connection():
+    """
+    Makes this thread's connection read-only (opened with mode=ro). With WAL its readers never
+    block the desktop app's writes. Call first thing on the thread, e.g. as a pool initializer.
+    """
+    if getattr(_local, 'conn', None) is not None:
+        _close(_local.conn)
+        _local.conn = None
+    _local.read_only = True
+
+def get_connection():
+    """
+    Returns this thread's shared connection to DB_NAME, opening and tuning it on first use.
+    Callers must not close it; use close_connections() on shutdown.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        if _local.db_name == DB_NAME and conn in _all_connections:
+            return conn
+        # Closed by close_connections() or DB_NAME was repointed: open a fresh one
+        _close(conn)
+
+    # check_same_thread=False only so close_connections() can close it from the exiting thread
+    if getattr(_local, 'read_only', False):
+        uri = pathlib.Path(DB_NAME).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=10, cached_statements=256, check_same_thread=False)
+        pragmas = READ_ONLY_PRAGMAS
+    else:
+        conn = sqlite3.connect(DB_NAME, timeout=10, cached_statements=256, check_same_thread=False)
+        pragmas = CONNECTION_PRAGMAS
+    for pragma in pragmas:
+        conn.execute(pragma)
+    _ensure_math_functions(conn)
+
+    _local.conn = conn
+    _local.db_name = DB_NAME
+    with _connections_lock:
+        _all_connections.append(conn)
+    return conn
+
+def _ensure_math_functions(conn):
+    """The analytics SQL uses sqrt(); register it when SQLite was built without math functions."""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        # Ensure S3 column exists in 'laps' table
-        cursor.execute("PRAGMA table_info(laps)")
-        columns = [col[1] for col in cursor.fetchall()]
-        if 'sector_3' not in columns:
-            try:
-                cursor.execute("ALTER TABLE laps ADD COLUMN sector_3 REAL")
-            except sqlite3.OperationalError:
-                # Table might not exist yet, proceed to creation
-                pass
-        
-        # Table creation is essential, so run it regardless
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                id INTEGER PRIMARY KEY,
-                car_model TEXT NOT NULL,
-                track_name TEXT NOT NULL,
-                date_time TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now')),
-                best_lap_time REAL,
-                theoretical_lap_time REAL
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS laps (
-                id INTEGER PRIMARY KEY,
-                session_id INTEGER,
-                lap_number INTEGER NOT NULL,
-                lap_time REAL NOT NULL,
-                sector_1 REAL,
-                sector_2 REAL,
-                sector_3 REAL,
-                cuts INTEGER,
-                is_valid INTEGER,
-                FOREIGN KEY (session_id) REFERENCES sessions (id)
-            )
-        """)
-        conn.commit()
+        conn.execute("SELECT sqrt(4)")
+    except sqlite3.OperationalError:
+        conn.create_function('sqrt', 1, lambda x: math.sqrt(x) if x is not None and x >= 0 else None, deterministic=True)
+
+def _close(conn):
+    with _connections_lock:
+        if conn in _all_connections:
+            _all_connections.remove(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+def close_connections():
+    """Closes every thread's shared connection. Safe to call more than once."""
+    with _connections_lock:
+        connections = list(_all_connections)
+    for conn in connections:
+        _close(conn)
+    _local.conn = None
+
+atexit.register(close_connections)
+
+# --- Change Notification ---
+# Listeners are called (on the committing thread) after a write that changes what readers see
+# commits: saved, imported or deleted sessions. Writes by other processes are not reported;
+# compare data_version() for those.
+
+_change_listeners = []
+
+def add_change_listener(callback):
+    """Registers callback() to be called after sessions are saved or deleted."""
+    with _connections_lock:
+        _change_listeners.append(callback)
+
+def remove_change_listener(callback):
+    with _connections_lock:
+        if callback in _change_listeners:
+            _change_listeners.remove(callback)
+
+def _notify_change():
+    with _connections_lock:
+        listeners = list(_change_listeners)
+    for callback in listeners:
+        try:
+            callback()
+        except Exception:
+            # The write has committed; a failing listener must not turn it into an error
+            diagnostics.count('database.change_listener_errors')
+
+def data_version():
+    """
+    SQLite's PRAGMA data_version for this thread's connection: it changes whenever another
+    connection (in this or any other process) has committed since the last call.
+    """
+    try:
+        return get_connection().execute("PRAGMA data_version").fetchone()[0]
     except sqlite3.Error as e:
-        messagebox.showerror("Database Error", f"Failed to initialize database: {e}")
-    finally:
-        if conn: conn.close()
+        raise DatabaseError(f"Error reading the data version: {e}") from e
 
+# --- Schema Migrations ---
+# Each migration upgrades the schema by one version and runs in its own transaction.
+# The applied version is stored in SQLite's PRAGMA user_version, so existing sim_data.db
+# files are upgraded in place. Never edit a released migration; append a new one.
 
-# MODIFIED FUNCTION SIGNATURE AND IMPLEMENTATION
+def _migration_1_base_schema(cursor):
+    """Base tables. Idempotent, because pre-migration databases already have some of them."""
+    # Ensure S3 column exists in 'laps' table
+    cursor.execute("PRAGMA table_info(laps)")
+    columns = [col[1] for col in cursor.fetchall()]
+    if columns and 'sector_3' not in columns:
+        cursor.execute("ALTER TABLE laps ADD COLUMN sector_3 REAL")
 
-def save_session_data(raw_data, best_lap_ms, theoretical_ms, all_laps_data, session_datetime):
-    """Saves the session summary and all laps (valid and invalid) to the database."""
-    conn = None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            car_model TEXT NOT NULL,
+            track_name TEXT NOT NULL,
+            date_time TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now')),
+            best_lap_time REAL,
+            theoretical_lap_time REAL,
+            content_hash TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS laps (
+            id INTEGER PRIMARY KEY,
+            session_id INTEGER,
+            lap_number INTEGER NOT NULL,
+            lap_time REAL NOT NULL,
+            sector_1 REAL,
+            sector_2 REAL,
+            sector_3 REAL,
+            cuts INTEGER,
+            is_valid INTEGER,
+            FOREIGN KEY (session_id) REFERENCES sessions (id)
+        )
+    """)
+
+    # Ensure content_hash column exists in 'sessions' table (older databases)
+    cursor.execute("PRAGMA table_info(sessions)")
+    columns = [col[1] for col in cursor.fetchall()]
+    if 'content_hash' not in columns:
+        cursor.execute("ALTER TABLE sessions ADD COLUMN content_hash TEXT")
+    # The same results file content can only ever be stored once
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_content_hash
+        ON sessions (content_hash) WHERE content_hash IS NOT NULL
+    """)
+
+    # Ingest ledger: lets re-scans skip files that have not changed since the last import
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_ledger (
+            file_path TEXT PRIMARY KEY,
+            file_size INTEGER NOT NULL,
+            file_mtime INTEGER NOT NULL,
+            content_hash TEXT,
+            session_id INTEGER,
+            imported_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now'))
+        )
+    """)
+
+def _migration_2_lookup_indexes(cursor):
+    """Indexes for the viewer's access paths, so lookups are index seeks instead of table scans."""
+    # get_laps_for_session: WHERE session_id = ? ORDER BY lap_number, answered from the index alone
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_laps_session_lap
+        ON laps (session_id, lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid)
+    """)
+    # get_sessions: ORDER BY date_time DESC, optionally filtered by car and/or track
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions (date_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_car_date ON sessions (car_model, date_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_track_date ON sessions (track_name, date_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_car_track_date ON sessions (car_model, track_name, date_time)")
+    cursor.execute("ANALYZE")
+
+def _migration_3_combo_stats(cursor):
+    """Materialized per car/track aggregates (personal bests, ideal sectors, lap counts)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS combo_stats (
+            car_model TEXT NOT NULL,
+            track_name TEXT NOT NULL,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            lap_count INTEGER NOT NULL DEFAULT 0,
+            valid_lap_count INTEGER NOT NULL DEFAULT 0,
+            best_lap_time REAL,
+            best_lap_session_id INTEGER,
+            best_sector_1 REAL,
+            best_sector_2 REAL,
+            best_sector_3 REAL,
+            PRIMARY KEY (car_model, track_name)
+        ) WITHOUT ROWID
+    """)
+    _rebuild_combo_stats(cursor)
+
+def _migration_4_name_search(cursor):
+    """
+    FTS5 trigram index over the car and track names for the viewer's type-ahead search, kept in
+    sync with combo_stats (one row per car/track) by triggers. SQLite builds without FTS5 or the
+    trigram tokenizer (before 3.34) skip it; search_names() then falls back to LIKE.
+    """
     try:
-        conn = sqlite3.connect(DB_NAME)
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS name_search USING fts5(name, kind UNINDEXED, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS name_search_combo_insert AFTER INSERT ON combo_stats BEGIN
+            INSERT INTO name_search (name, kind) SELECT new.car_model, 'car'
+                WHERE NOT EXISTS (SELECT 1 FROM name_search WHERE kind = 'car' AND name = new.car_model);
+            INSERT INTO name_search (name, kind) SELECT new.track_name, 'track'
+                WHERE NOT EXISTS (SELECT 1 FROM name_search WHERE kind = 'track' AND name = new.track_name);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS name_search_combo_delete AFTER DELETE ON combo_stats BEGIN
+            DELETE FROM name_search WHERE kind = 'car' AND name = old.car_model
+                AND NOT EXISTS (SELECT 1 FROM combo_stats WHERE car_model = old.car_model);
+            DELETE FROM name_search WHERE kind = 'track' AND name = old.track_name
+                AND NOT EXISTS (SELECT 1 FROM combo_stats WHERE track_name = old.track_name);
+        END
+    """)
+    _rebuild_name_search(cursor)
+
+def _migration_5_cascade_laps(cursor):
+    """
+    Rebuilds laps with ON DELETE CASCADE on session_id (SQLite cannot alter a foreign key in
+    place). Orphaned laps whose session no longer exists are dropped on the way.
+    """
+    cursor.execute("""
+        CREATE TABLE laps_new (
+            id INTEGER PRIMARY KEY,
+            session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+            lap_number INTEGER NOT NULL,
+            lap_time REAL NOT NULL,
+            sector_1 REAL,
+            sector_2 REAL,
+            sector_3 REAL,
+            cuts INTEGER,
+            is_valid INTEGER
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO laps_new (id, session_id, lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid)
+        SELECT id, session_id, lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid
+        FROM laps WHERE session_id IN (SELECT id FROM sessions)
+    """)
+    cursor.execute("DROP TABLE laps")
+    cursor.execute("ALTER TABLE laps_new RENAME TO laps")
+    cursor.execute("""
+        CREATE INDEX idx_laps_session_lap
+        ON laps (session_id, lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid)
+    """)
+
+# sessions.started_at: the session's wall-clock start (as recorded, no time zone) in seconds
+# since 1970-01-01 00:00, derived from date_time. Unparseable dates sort as the oldest (0).
+_STARTED_AT_SQL = "COALESCE(CAST(strftime('%s', {}) AS INTEGER), 0)"
+
+def _migration_6_started_at(cursor):
+    """Integer session start time with indexes, replacing the text date_time indexes for sorting and ranges."""
+    cursor.execute("ALTER TABLE sessions ADD COLUMN started_at INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("UPDATE sessions SET started_at = " + _STARTED_AT_SQL.format("date_time"))
+    for index in ('idx_sessions_date', 'idx_sessions_car_date', 'idx_sessions_track_date', 'idx_sessions_car_track_date'):
+        cursor.execute(f"DROP INDEX IF EXISTS {index}")
+    # Newest-first paging and date ranges, optionally filtered by car and/or track
+    cursor.execute("CREATE INDEX idx_sessions_started ON sessions (started_at)")
+    cursor.execute("CREATE INDEX idx_sessions_car_started ON sessions (car_model, started_at)")
+    cursor.execute("CREATE INDEX idx_sessions_track_started ON sessions (track_name, started_at)")
+    cursor.execute("CREATE INDEX idx_sessions_car_track_started ON sessions (car_model, track_name, started_at)")
+    cursor.execute("ANALYZE")
+
+def _migration_7_telemetry(cursor):
+    """
+    Per-lap telemetry: one row per lap and channel holding all samples as one encoded array
+    (see telemetry.py), instead of one row per sample. Deleting a lap (or its session) cascades.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS telemetry (
+            id INTEGER PRIMARY KEY,
+            lap_id INTEGER NOT NULL REFERENCES laps (id) ON DELETE CASCADE,
+            channel TEXT NOT NULL,
+            dtype TEXT NOT NULL,
+            sample_count INTEGER NOT NULL,
+            codec TEXT NOT NULL,
+            checksum INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            UNIQUE (lap_id, channel)
+        )
+    """)
+
+def _migration_8_merge_sources(cursor):
+    """Per-source watermarks of merge_database(): the highest source session id already merged."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS merge_sources (
+            source TEXT PRIMARY KEY,
+            last_session_id INTEGER NOT NULL DEFAULT 0,
+            sessions_merged INTEGER NOT NULL DEFAULT 0,
+            merged_at TEXT
+        )
+    """)
+
+MIGRATIONS = [
+    (1, _migration_1_base_schema),
+    (2, _migration_2_lookup_indexes),
+    (3, _migration_3_combo_stats),
+    (4, _migration_4_name_search),
+    (5, _migration_5_cascade_laps),
+    (6, _migration_6_started_at),
+    (7, _migration_7_telemetry),
+    (8, _migration_8_merge_sources),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    """Returns the schema version recorded in the database file (0 for unmigrated files)."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """Applies every pending migration in order. Returns the resulting schema version."""
+    version = get_schema_version(conn)
+    for target_version, migration in MIGRATIONS:
+        if target_version <= version:
+            continue
         cursor = conn.cursor()
+        # IMMEDIATE takes the write lock up front, and the version is re-read under it: when several
+        # processes start on the same file at once, only the first applies each migration
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            version = get_schema_version(conn)
+            if target_version > version:
+                migration(cursor)
+                # PRAGMA arguments cannot be bound; target_version is always one of our own ints
+                cursor.execute(f"PRAGMA user_version = {int(target_version)}")
+                version = target_version
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return version
 
-        # ... (summary data extraction remains the same) ...
-        track = raw_data.get("track", "Unknown Track").replace("ks_", "").replace("-", " ")
-        car = raw_data.get("players", [{}])[0].get("car", "Unknown Car").replace("ks_", "").replace("_", " ")
+def setup_database():
+    """Creates the database if needed and brings its schema up to SCHEMA_VERSION."""
+    try:
+        migrate(get_connection())
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Failed to initialize database: {e}") from e
 
-        date_time_to_save = session_datetime if session_datetime else sqlite3.Timestamp.now().isoformat()
 
-        # 1. Insert into sessions table (unchanged)
-        cursor.execute("""
-            INSERT INTO sessions (car_model, track_name, best_lap_time, theoretical_lap_time, date_time)
-            VALUES (?, ?, ?, ?, ?)
-        """, (car.title(), track.title(), best_lap_ms, theoretical_ms, date_time_to_save))
-
-        session_id = cursor.lastrowid
-
-        # 2. Insert all laps into laps table
-        lap_inserts = []
-        for lap in all_laps_data: # LOOPING over ALL laps
-            # Safely extract S3, defaulting to None if the array only has 2 elements
-            s3_time = lap['sectors'][2] if len(lap['sectors']) > 2 else None
-
-            lap_inserts.append((
-                session_id,
-                lap['lap_number'],
-                lap['time'],
-                lap['sectors'][0],
-                lap['sectors'][1],
-                s3_time,
-                lap['cuts'],
-                lap['is_valid'] # This column now stores 0 for invalid laps
-            ))
+# MODIFIED FUNCTION SIGNATURE AND IMPLEMENTATION
 
+def _insert_session(cursor, session):
+    """
+    Inserts one session row and its laps using an open cursor. session is a SessionAnalysis
+    (see analysis.py); its laps are streamed from the lap arrays into executemany.
+    Returns the new session id, or None when a session with the same content_hash is already stored.
+    """
+    if session.content_hash:
+        cursor.execute("SELECT id FROM sessions WHERE content_hash = ?", (session.content_hash,))
+        if cursor.fetchone():
+            return None
+
+    date_time_to_save = session.session_datetime if session.session_datetime else sqlite3.Timestamp.now().isoformat()
+
+    # 1. Insert into sessions table
+    cursor.execute(f"""
+        INSERT INTO sessions (car_model, track_name, best_lap_time, theoretical_lap_time, date_time, content_hash, started_at)
+        VALUES (?, ?, ?, ?, ?, ?, {_STARTED_AT_SQL.format("?")})
+    """, (session.car, session.track, session.best_lap_ms, session.theoretical_ms, date_time_to_save, session.content_hash,
+          date_time_to_save))
+
+    session_id = cursor.lastrowid
+
+    # 2. Insert all laps (valid and invalid) into laps table, straight from the lap arrays
+    with diagnostics.stage('database.insert_laps'):
         cursor.executemany("""
             INSERT INTO laps (session_id, lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, lap_inserts)
+        """, session.lap_rows(session_id))
+    diagnostics.count('database.laps_inserted', session.lap_count)
+
+    # 3. Fold the new laps into the car/track aggregates
+    _add_session_to_combo_stats(cursor, session_id, session.car, session.track)
+
+    return session_id
+
+def _record_ingest(cursor, entries):
+    """Upserts ingest ledger rows: (file_path, file_size, file_mtime, content_hash, session_id)."""
+    cursor.executemany("""
+        INSERT INTO ingest_ledger (file_path, file_size, file_mtime, content_hash, session_id)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (file_path) DO UPDATE SET
+            file_size = excluded.file_size,
+            file_mtime = excluded.file_mtime,
+            content_hash = excluded.content_hash,
+            session_id = COALESCE(excluded.session_id, ingest_ledger.session_id),
+            imported_at = strftime('%Y-%m-%d %H:%M:%S', 'now')
+    """, entries)
+
+def _ledger_entry(session, session_id):
+    """Builds a ledger row from the file info analyze_ac_session stored in the SessionAnalysis."""
+    return (session.file_path, session.file_size, session.file_mtime, session.content_hash, session_id)
+
+# --- Per Car/Track Aggregates ---
+# combo_stats is kept up to date by every insert and delete, so personal bests and ideal
+# sectors never need a scan of the laps table. rebuild_combo_stats() repairs it from scratch.
 
-        conn.commit()
-        return True
+# Aggregates of valid laps (time > 0, no cuts), matching how analyze_ac_session computes bests
+_LAP_AGGREGATES_SQL = """
+    COUNT(l.id),
+    COALESCE(SUM(l.is_valid), 0),
+    MIN(CASE WHEN l.is_valid = 1 THEN l.lap_time END),
+    MIN(CASE WHEN l.is_valid = 1 AND l.sector_1 > 0 THEN l.sector_1 END),
+    MIN(CASE WHEN l.is_valid = 1 AND l.sector_2 > 0 THEN l.sector_2 END),
+    MIN(CASE WHEN l.is_valid = 1 AND l.sector_3 > 0 THEN l.sector_3 END)
+"""
 
+def _combo_rows_sql(where_sql):
+    """SELECT producing full combo_stats rows for the combos matching where_sql (alias s = sessions)."""
+    return f"""
+        SELECT s.car_model, s.track_name, COUNT(DISTINCT s.id), {_LAP_AGGREGATES_SQL},
+               (SELECT l2.session_id FROM laps l2 JOIN sessions s2 ON s2.id = l2.session_id
+                WHERE s2.car_model = s.car_model AND s2.track_name = s.track_name AND l2.is_valid = 1
+                ORDER BY l2.lap_time ASC, l2.session_id ASC LIMIT 1)
+        FROM sessions s LEFT JOIN laps l ON l.session_id = s.id
+        {where_sql}
+        GROUP BY s.car_model, s.track_name
+    """
+
+_COMBO_INSERT_SQL = """
+    INSERT OR REPLACE INTO combo_stats (car_model, track_name, session_count, lap_count, valid_lap_count,
+        best_lap_time, best_sector_1, best_sector_2, best_sector_3, best_lap_session_id)
+"""
+
+def _rebuild_combo_stats(cursor):
+    cursor.execute("DELETE FROM combo_stats")
+    cursor.execute(_COMBO_INSERT_SQL + _combo_rows_sql(""))
+
+def _recompute_combo_stats(cursor, car_model, track_name):
+    """Recomputes one combo from its sessions (index seek on car/track), removing it if none are left."""
+    cursor.execute("DELETE FROM combo_stats WHERE car_model = ? AND track_name = ?", (car_model, track_name))
+    cursor.execute(
+        _COMBO_INSERT_SQL + _combo_rows_sql("WHERE s.car_model = ? AND s.track_name = ?"),
+        (car_model, track_name)
+    )
+
+def _add_session_to_combo_stats(cursor, session_id, car_model, track_name):
+    """Merges one newly inserted session's laps into its combo's aggregates."""
+    cursor.execute(f"SELECT {_LAP_AGGREGATES_SQL} FROM laps l WHERE l.session_id = ?", (session_id,))
+    lap_count, valid_count, best_lap, best_s1, best_s2, best_s3 = cursor.fetchone()
+    cursor.execute("""
+        INSERT INTO combo_stats (car_model, track_name, session_count, lap_count, valid_lap_count,
+            best_lap_time, best_lap_session_id, best_sector_1, best_sector_2, best_sector_3)
+        VALUES (?, ?, 1, ?, ?, ?, CASE WHEN ? IS NOT NULL THEN ? END, ?, ?, ?)
+        ON CONFLICT (car_model, track_name) DO UPDATE SET
+            session_count = session_count + 1,
+            lap_count = lap_count + excluded.lap_count,
+            valid_lap_count = valid_lap_count + excluded.valid_lap_count,
+            best_lap_session_id = CASE
+                WHEN excluded.best_lap_time < best_lap_time OR best_lap_time IS NULL
+                THEN excluded.best_lap_session_id ELSE best_lap_session_id END,
+            best_lap_time = COALESCE(MIN(best_lap_time, excluded.best_lap_time), best_lap_time, excluded.best_lap_time),
+            best_sector_1 = COALESCE(MIN(best_sector_1, excluded.best_sector_1), best_sector_1, excluded.best_sector_1),
+            best_sector_2 = COALESCE(MIN(best_sector_2, excluded.best_sector_2), best_sector_2, excluded.best_sector_2),
+            best_sector_3 = COALESCE(MIN(best_sector_3, excluded.best_sector_3), best_sector_3, excluded.best_sector_3)
+    """, (car_model, track_name, lap_count, valid_count, best_lap, best_lap, session_id, best_s1, best_s2, best_s3))
+
+def _remove_session_from_combo_stats(cursor, session_id):
+    """
+    Subtracts a session from its combo; must run before the session's rows are deleted.
+    Counts are decremented in place. If the session held one of the combo's minimums (or was
+    its last session) nothing is changed and (car_model, track_name) is returned instead, so the
+    caller can recompute that combo once the rows are gone.
+    """
+    cursor.execute("SELECT car_model, track_name FROM sessions WHERE id = ?", (session_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    car_model, track_name = row
+
+    cursor.execute(f"SELECT {_LAP_AGGREGATES_SQL} FROM laps l WHERE l.session_id = ?", (session_id,))
+    lap_count, valid_count, best_lap, best_s1, best_s2, best_s3 = cursor.fetchone()
+
+    cursor.execute("""
+        SELECT session_count, best_lap_time, best_sector_1, best_sector_2, best_sector_3
+        FROM combo_stats WHERE car_model = ? AND track_name = ?
+    """, (car_model, track_name))
+    combo = cursor.fetchone()
+    if combo is None:
+        return (car_model, track_name)
+
+    session_count, combo_best, combo_s1, combo_s2, combo_s3 = combo
+    held_minimum = any(
+        value is not None and value == combo_value
+        for value, combo_value in ((best_lap, combo_best), (best_s1, combo_s1), (best_s2, combo_s2), (best_s3, combo_s3))
+    )
+    if held_minimum or session_count <= 1:
+        # Deferred: the recompute must not see this session, so it runs after the delete
+        return (car_model, track_name)
+
+    cursor.execute("""
+        UPDATE combo_stats
+        SET session_count = session_count - 1, lap_count = lap_count - ?, valid_lap_count = valid_lap_count - ?
+        WHERE car_model = ? AND track_name = ?
+    """, (lap_count, valid_count, car_model, track_name))
+    return None
+
+def rebuild_combo_stats():
+    """Repairs the combo_stats table (and the name search index) by recomputing every car/track combo."""
+    conn = None
+    try:
+        conn = get_connection()
+        with conn:
+            cursor = conn.cursor()
+            _rebuild_combo_stats(cursor)
+            if _has_name_search(cursor):
+                _rebuild_name_search(cursor)
     except sqlite3.Error as e:
-        messagebox.showerror("Database Save Error", f"Failed to save session: {e}")
-        return False
-    finally:
-        if conn: conn.close()
+        raise DatabaseError(f"Failed to rebuild car/track statistics: {e}") from e
+    _notify_change()
+    return True
+
+def get_combo_stats(car_model, track_name):
+    """
+    Returns the precomputed aggregates for one car/track combo as a dict, or None if there are none:
+    session_count, lap_count, valid_lap_count, best_lap_time, best_lap_session_id,
+    best_sector_1..3 and theoretical_best (sum of the best sectors, or None when incomplete).
+    """
+    try:
+        conn = get_connection()
+        row = conn.execute("""
+            SELECT session_count, lap_count, valid_lap_count, best_lap_time, best_lap_session_id,
+                   best_sector_1, best_sector_2, best_sector_3
+            FROM combo_stats WHERE car_model = ? AND track_name = ?
+        """, (car_model, track_name)).fetchone()
+    except sqlite3.Error:
+        return None
+    if row is None:
+        return None
+
+    keys = ('session_count', 'lap_count', 'valid_lap_count', 'best_lap_time', 'best_lap_session_id',
+            'best_sector_1', 'best_sector_2', 'best_sector_3')
+    stats = dict(zip(keys, row))
+    # Theoretical best supports 3 or 2 sector tracks, like analyze_ac_session
+    sectors = [stats['best_sector_1'], stats['best_sector_2']]
+    if stats['best_sector_3'] is not None:
+        sectors.append(stats['best_sector_3'])
+    stats['theoretical_best'] = sum(sectors) if None not in sectors else None
+    return stats
+
+COMBO_LIST_COLUMNS = ('car_model', 'track_name', 'session_count', 'lap_count', 'valid_lap_count',
+                      'best_lap_time', 'best_lap_session_id')
+
+def get_all_combo_stats():
+    """Every car/track combo's aggregates (columns: COMBO_LIST_COLUMNS), by car and track."""
+    try:
+        return get_connection().execute(
+            f"SELECT {', '.join(COMBO_LIST_COLUMNS)} FROM combo_stats ORDER BY car_model, track_name"
+        ).fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error reading car/track statistics: {e}") from e
+
+def save_session_data(session):
+    """
+    Saves an analyzed session (a SessionAnalysis from analyze_ac_session) and all its laps,
+    valid and invalid, to the database, and records its source file in the ingest ledger.
+    Returns True on success. Raises DuplicateSessionError (without writing the session)
+    if the same file content was already saved, DatabaseError on any other failure.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        with diagnostics.stage('database.save_session'):
+            session_id = _insert_session(cursor, session)
+            if session.readable:
+                _record_ingest(cursor, [_ledger_entry(session, session_id)])
+            conn.commit()
+
+    except sqlite3.Error as e:
+        if conn: conn.rollback()
+        raise DatabaseError(f"Failed to save session: {e}") from e
+
+    if session_id is None:
+        raise DuplicateSessionError("This session file has already been saved to the database.")
+    _notify_change()
+    return True
+
+def save_sessions_batch(sessions, unusable_files=()):
+    """
+    Saves many analyzed sessions (SessionAnalysis objects) in a single transaction (used by
+    bulk import). Sessions whose content_hash is already stored are skipped. Every file,
+    including unusable_files (sessions that had no valid laps), is recorded in the ingest ledger.
+    Returns (saved, duplicates); the whole batch is rolled back and DatabaseError raised on error.
+    """
+    if not sessions and not unusable_files:
+        return 0, 0
+
+    saved, duplicates = 0, 0
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        ledger = [_ledger_entry(session, None) for session in unusable_files]
+        with diagnostics.stage('database.save_batch', sessions=len(sessions)):
+            for session in sessions:
+                session_id = _insert_session(cursor, session)
+                if session_id is None:
+                    duplicates += 1
+                else:
+                    saved += 1
+                ledger.append(_ledger_entry(session, session_id))
+            _record_ingest(cursor, ledger)
+            conn.commit()
+
+    except sqlite3.Error as e:
+        if conn: conn.rollback()
+        raise DatabaseError(f"Failed to save batch of {len(sessions)} sessions: {e}") from e
+    if saved:
+        _notify_change()
+    return saved, duplicates
+
+def get_ingest_ledger():
+    """Returns {file_path: (file_size, file_mtime)} for every file already ingested."""
+    ledger = {}
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT file_path, file_size, file_mtime FROM ingest_ledger")
+        ledger = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    except sqlite3.Error:
+        pass # An empty ledger just means every file gets parsed
+    return ledger
 
 # --- Database Reading Functions for Viewer ---
 
 def get_unique_cars_and_tracks():
-    """Fetches unique car models and tracks for filtering."""
+    """Fetches unique car models and tracks for filtering (from combo_stats, one row per car/track)."""
     cars, tracks = ['All Cars'], ['All Tracks']
-    conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT car_model FROM sessions ORDER BY car_model")
+        cursor.execute("SELECT DISTINCT car_model FROM combo_stats ORDER BY car_model")
         cars.extend([row[0] for row in cursor.fetchall()])
-        cursor.execute("SELECT DISTINCT track_name FROM sessions ORDER BY track_name")
+        cursor.execute("SELECT DISTINCT track_name FROM combo_stats ORDER BY track_name")
         tracks.extend([row[0] for row in cursor.fetchall()])
     except:
         pass # Return defaults on error
-    finally:
-        if conn: conn.close()
     return cars, tracks
 
-def get_sessions(car_filter='All Cars', track_filter='All Tracks'):
-    """Fetches sessions based on filters."""
-    sql = "SELECT id, car_model, track_name, best_lap_time, theoretical_lap_time, date_time FROM sessions WHERE 1=1"
+# --- Car/Track Name Search ---
+
+SEARCH_LIMIT = 20
+_TRIGRAM = 3 # The trigram index can only match search words of at least 3 characters
+
+def _rebuild_name_search(cursor):
+    cursor.execute("DELETE FROM name_search")
+    cursor.execute("""
+        INSERT INTO name_search (name, kind)
+        SELECT DISTINCT car_model, 'car' FROM combo_stats
+        UNION ALL
+        SELECT DISTINCT track_name, 'track' FROM combo_stats
+    """)
+
+def _has_name_search(cursor):
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'name_search'").fetchone() is not None
+
+def _like_pattern(word):
+    escaped = word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _search_rank(name, query, words):
+    """Sort key: whole-query prefix, then words starting a word of the name, then shorter names."""
+    lowered = name.lower()
+    name_words = lowered.split()
+    word_starts = sum(1 for word in words if any(part.startswith(word) for part in name_words))
+    return (not lowered.startswith(query), -word_starts, len(name), lowered)
+
+def search_names(query, kind=None, limit=SEARCH_LIMIT):
+    """
+    Type-ahead search over car and track names. Every word of query must appear somewhere in the
+    name (any order, case-insensitive). kind limits results to 'car' or 'track'.
+    Returns up to limit (kind, name) pairs, best matches first.
+    """
+    query = " ".join(query.lower().split())
+    words = query.split()
+    if not words:
+        return []
+
+    try:
+        cursor = get_connection().cursor()
+        with diagnostics.stage('database.search_names'):
+            long_words = [word for word in words if len(word) >= _TRIGRAM]
+            like_words = [word for word in words if len(word) < _TRIGRAM]
+            if long_words and _has_name_search(cursor):
+                # Trigram index: each quoted word matches as a substring
+                sql = "SELECT kind, name FROM name_search WHERE name_search MATCH ?"
+                params = [" AND ".join('"' + word.replace('"', '""') + '"' for word in long_words)]
+            else:
+                sql = """
+                    SELECT * FROM (
+                        SELECT DISTINCT 'car' AS kind, car_model AS name FROM combo_stats
+                        UNION
+                        SELECT DISTINCT 'track', track_name FROM combo_stats
+                    ) WHERE 1=1
+                """
+                params, like_words = [], words
+            for word in like_words:
+                sql += " AND name LIKE ? ESCAPE '\\'"
+                params.append(_like_pattern(word))
+            if kind is not None:
+                sql += " AND kind = ?"
+                params.append(kind)
+            matches = cursor.execute(sql, params).fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error searching cars and tracks: {e}") from e
+
+    matches.sort(key=lambda match: _search_rank(match[1], query, words))
+    return matches[:limit]
+
+SESSION_PAGE_SIZE = 100
+
+# Session rows as returned by get_sessions / get_sessions_page; started_at is the paging key
+SESSION_COLUMNS = "id, car_model, track_name, best_lap_time, theoretical_lap_time, date_time, started_at"
+
+def to_started_at(value):
+    """Converts a datetime.date/datetime or an ISO date(time) string to a sessions.started_at value."""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value) if len(value) > 10 else datetime.date.fromisoformat(value)
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    return calendar.timegm(value.timetuple())
+
+def _date_range(date_from, date_to):
+    """started_at bounds [start, end) for an inclusive date range; a plain date as date_to includes its whole day."""
+    start = to_started_at(date_from) if date_from is not None else None
+    end = None
+    if date_to is not None:
+        end = to_started_at(date_to)
+        if not isinstance(date_to, datetime.datetime) and len(str(date_to)) <= 10:
+            end += 86400
+    return start, end
+
+def _session_filter_sql(car_filter, track_filter, date_from=None, date_to=None, table=None):
+    """
+    Builds the shared WHERE clause (and params) for the car/track session filters.
+    date_from/date_to are inclusive 'YYYY-MM-DD' dates (or datetime.date/datetime); None leaves that end open.
+    table is the alias of the sessions table when the query joins other tables.
+    """
+    prefix = f"{table}." if table else ""
+    sql = " WHERE 1=1"
     params = []
     if car_filter != 'All Cars':
-        sql += " AND car_model = ?"
+        sql += f" AND {prefix}car_model = ?"
         params.append(car_filter)
     if track_filter != 'All Tracks':
-        sql += " AND track_name = ?"
+        sql += f" AND {prefix}track_name = ?"
         params.append(track_filter)
-    sql += " ORDER BY date_time DESC"
+    # Integer range on started_at: an index seek on the (car/track,) started_at indexes
+    start, end = _date_range(date_from, date_to)
+    if start is not None:
+        sql += f" AND {prefix}started_at >= ?"
+        params.append(start)
+    if end is not None:
+        sql += f" AND {prefix}started_at < ?"
+        params.append(end)
+    return sql, params
+
+def get_sessions(car_filter='All Cars', track_filter='All Tracks', date_from=None, date_to=None):
+    """Fetches sessions based on filters, newest first (columns: SESSION_COLUMNS)."""
+    where_sql, params = _session_filter_sql(car_filter, track_filter, date_from, date_to)
+    sql = f"SELECT {SESSION_COLUMNS} FROM sessions"
+    sql += where_sql + " ORDER BY started_at DESC, id DESC"
 
-    conn = None
-    records = []
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = get_connection()
         cursor = conn.cursor()
         cursor.execute(sql, params)
-        records = cursor.fetchall()
+        return cursor.fetchall()
     except sqlite3.Error as e:
-        messagebox.showerror("Database Error", f"Error reading sessions: {e}")
-    finally:
-        if conn: conn.close()
+        raise DatabaseError(f"Error reading sessions: {e}") from e
+
+def get_sessions_page(car_filter='All Cars', track_filter='All Tracks', before=None, after=None, limit=SESSION_PAGE_SIZE,
+                      date_from=None, date_to=None):
+    """
+    Fetches one page of sessions (newest first) using keyset pagination on (started_at, id).
+    before=(started_at, id) returns the page of older sessions that follows that row;
+    after=(started_at, id) returns the page of newer sessions that precedes it.
+    Rows are always returned newest first, in the same shape as get_sessions.
+    """
+    where_sql, params = _session_filter_sql(car_filter, track_filter, date_from, date_to)
+    sql = f"SELECT {SESSION_COLUMNS} FROM sessions" + where_sql
+    if after is not None:
+        # Walk upwards from the key, then flip the page back to newest-first below
+        sql += " AND (started_at, id) > (?, ?) ORDER BY started_at ASC, id ASC LIMIT ?"
+        params += [after[0], after[1], limit]
+    elif before is not None:
+        sql += " AND (started_at, id) < (?, ?) ORDER BY started_at DESC, id DESC LIMIT ?"
+        params += [before[0], before[1], limit]
+    else:
+        sql += " ORDER BY started_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        with diagnostics.stage('database.get_sessions_page'):
+            cursor.execute(sql, params)
+            records = cursor.fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error reading sessions: {e}") from e
+    if after is not None:
+        records.reverse()
     return records
 
+def count_sessions(car_filter='All Cars', track_filter='All Tracks', date_from=None, date_to=None):
+    """Counts the sessions matching the filters (for the viewer's row-count header)."""
+    where_sql, params = _session_filter_sql(car_filter, track_filter, date_from, date_to)
+    try:
+        conn = get_connection()
+        return conn.execute("SELECT COUNT(*) FROM sessions" + where_sql, params).fetchone()[0]
+    except sqlite3.Error:
+        return 0
+
+EXPORT_COLUMNS = (
+    'session_id', 'car_model', 'track_name', 'date_time',
+    'lap_number', 'lap_time', 'sector_1', 'sector_2', 'sector_3', 'cuts', 'is_valid'
+)
+EXPORT_CHUNK_SIZE = 5000
+
+def iter_laps_for_export(car_filter='All Cars', track_filter='All Tracks', date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Streams every lap joined with its session (columns: EXPORT_COLUMNS), filtered like get_sessions.
+    Yields lists of at most chunk_size rows fetched with fetchmany, so memory stays bounded.
+    """
+    where_sql, params = _session_filter_sql(car_filter, track_filter, date_from, date_to, table='s')
+    sql = f"""
+        SELECT s.id, s.car_model, s.track_name, s.date_time,
+               l.lap_number, l.lap_time, l.sector_1, l.sector_2, l.sector_3, l.cuts, l.is_valid
+        FROM sessions s JOIN laps l ON l.session_id = s.id
+        {where_sql}
+        ORDER BY s.started_at, s.id, l.lap_number
+    """
+    try:
+        # A dedicated cursor, so other queries on this thread's connection do not reset it
+        cursor = get_connection().cursor()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error exporting laps: {e}") from e
+
+# --- Lap Analytics ---
+# Consistency and stint metrics computed over the stored laps with window functions in one
+# pass (index range scan on idx_laps_session_lap), so long endurance sessions stay fast.
+
+ROLLING_WINDOW = 5      # Laps in the rolling consistency window
+PIT_LAP_FACTOR = 1.2    # Valid laps this much slower than the session best count as pit/out laps
+
+LAP_ANALYTICS_COLUMNS = (
+    'lap_number', 'lap_time', 'sector_1', 'sector_2', 'sector_3', 'cuts', 'is_valid',
+    'delta_to_best', 'rolling_avg', 'rolling_stddev', 'stint', 'stint_lap', 'percent_rank'
+)
+
+# CTE 'keyed': the laps of session :session_id with the session best, is_break (invalid or
+# pit/out lap) and stint_key, which is the same for all laps of one run of clean laps
+_LAP_STINTS_CTE = """
+        WITH base AS (
+            SELECT lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid,
+                   MIN(CASE WHEN is_valid = 1 THEN lap_time END) OVER () AS best
+            FROM laps WHERE session_id = :session_id
+        ),
+        flagged AS (
+            SELECT *, CASE WHEN is_valid = 1 AND lap_time <= best * :pit_factor THEN 0 ELSE 1 END AS is_break
+            FROM base
+        ),
+        keyed AS (
+            SELECT *, SUM(is_break) OVER (ORDER BY lap_number ROWS UNBOUNDED PRECEDING) AS stint_key
+            FROM flagged
+        )
+"""
+
+def _lap_analytics_cte(window):
+    """
+    CTEs ending in 'analytics', one row per lap of session :session_id. A stint is a run of clean
+    laps; invalid laps and pit/out laps break it (stint is NULL on those). Rolling stats cover the last
+    `window` laps of the current stint; percent_rank is 0.0 for the best valid lap, 1.0 for the slowest.
+    """
+    preceding = max(int(window), 1) - 1 # Frame offsets must be literals
+    return _LAP_STINTS_CTE + f""",
+        windowed AS (
+            SELECT *,
+                   COUNT(*) OVER stint_window AS rolling_n,
+                   AVG(lap_time) OVER stint_window AS rolling_mean,
+                   AVG(lap_time * lap_time) OVER stint_window AS rolling_mean_sq,
+                   ROW_NUMBER() OVER (PARTITION BY stint_key, is_break ORDER BY lap_number) AS stint_lap,
+                   PERCENT_RANK() OVER (PARTITION BY is_valid ORDER BY lap_time) AS valid_rank
+            FROM keyed
+            WINDOW stint_window AS (PARTITION BY stint_key, is_break ORDER BY lap_number ROWS BETWEEN {preceding} PRECEDING AND CURRENT ROW)
+        ),
+        analytics AS (
+            SELECT lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid, is_break,
+                   CASE WHEN lap_time > 0 THEN lap_time - best END AS delta_to_best,
+                   CASE WHEN is_break = 0 THEN rolling_mean END AS rolling_avg,
+                   CASE WHEN is_break = 0 AND rolling_n > 1 THEN sqrt(MAX(0.0, rolling_mean_sq - rolling_mean * rolling_mean)) END AS rolling_stddev,
+                   -- Stints are numbered by counting the clean laps that open one
+                   CASE WHEN is_break = 0 THEN SUM(is_break = 0 AND stint_lap = 1) OVER (ORDER BY lap_number ROWS UNBOUNDED PRECEDING) END AS stint,
+                   CASE WHEN is_break = 0 THEN stint_lap END AS stint_lap,
+                   CASE WHEN is_valid = 1 THEN valid_rank END AS percent_rank
+            FROM windowed
+        )
+    """
+
+def get_lap_analytics(session_id, window=ROLLING_WINDOW, pit_factor=PIT_LAP_FACTOR):
+    """
+    Returns one tuple per lap (columns: LAP_ANALYTICS_COLUMNS), ordered by lap number.
+    Times are in ms; rolling_avg/rolling_stddev are floats; metrics that do not apply are None.
+    """
+    sql = _lap_analytics_cte(window) + f"SELECT {', '.join(LAP_ANALYTICS_COLUMNS)} FROM analytics ORDER BY lap_number"
+    try:
+        with diagnostics.stage('database.get_lap_analytics'):
+            return get_connection().execute(sql, {'session_id': session_id, 'pit_factor': pit_factor}).fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error computing lap analytics: {e}") from e
+
+def get_session_consistency(session_id, pit_factor=PIT_LAP_FACTOR):
+    """
+    Returns session-level consistency of the clean laps (valid, not pit/out laps) as a dict, or None
+    without any: clean_laps, best, mean, stddev, p10, p50, p90 (nearest-rank percentiles, ms),
+    consistency (stddev / mean in %, lower is steadier) and stints.
+    """
+    sql = _LAP_STINTS_CTE + """,
+        ranked AS (
+            SELECT lap_time, stint_key, ROW_NUMBER() OVER (ORDER BY lap_time) AS position, COUNT(*) OVER () AS n
+            FROM keyed WHERE is_break = 0
+        )
+        SELECT COUNT(*), MIN(lap_time), AVG(lap_time),
+               sqrt(MAX(0.0, AVG(lap_time * lap_time) - AVG(lap_time) * AVG(lap_time))),
+               MIN(CASE WHEN position >= (10 * n + 99) / 100 THEN lap_time END),
+               MIN(CASE WHEN position >= (50 * n + 99) / 100 THEN lap_time END),
+               MIN(CASE WHEN position >= (90 * n + 99) / 100 THEN lap_time END),
+               COUNT(DISTINCT stint_key)
+        FROM ranked
+    """
+    try:
+        with diagnostics.stage('database.get_session_consistency'):
+            row = get_connection().execute(sql, {'session_id': session_id, 'pit_factor': pit_factor}).fetchone()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error computing session consistency: {e}") from e
+    if not row or not row[0]:
+        return None
+
+    stats = dict(zip(('clean_laps', 'best', 'mean', 'stddev', 'p10', 'p50', 'p90', 'stints'), row))
+    stats['consistency'] = 100.0 * stats['stddev'] / stats['mean'] if stats['mean'] else None
+    return stats
+
 def get_laps_for_session(session_id):
     """Fetches all lap details for a given session ID."""
     laps = []
-    conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid
-            FROM laps
-            WHERE session_id = ?
-            ORDER BY lap_number ASC
-        """, (session_id,))
-        laps = cursor.fetchall()
+        with diagnostics.stage('database.get_laps'):
+            cursor.execute("""
+                SELECT lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid
+                FROM laps
+                WHERE session_id = ?
+                ORDER BY lap_number ASC
+            """, (session_id,))
+            laps = cursor.fetchall()
     except sqlite3.Error:
         pass # Returning an empty list on error is safer
-    finally:
-        if conn: conn.close()
     return laps
 
+def get_laps_for_sessions(session_ids):
+    """
+    Fetches the laps of several sessions in one query, for comparisons.
+    Returns rows (session_id, lap_number, lap_time, sector_1, sector_2, sector_3, is_valid)
+    ordered by session and lap number; raises DatabaseError on failure.
+    """
+    session_ids = [int(session_id) for session_id in session_ids]
+    if not session_ids:
+        return []
+    placeholders = ", ".join("?" * len(session_ids))
+    try:
+        with diagnostics.stage('database.get_laps_for_sessions', sessions=len(session_ids)):
+            return get_connection().execute(f"""
+                SELECT session_id, lap_number, lap_time, sector_1, sector_2, sector_3, is_valid
+                FROM laps
+                WHERE session_id IN ({placeholders})
+                ORDER BY session_id, lap_number
+            """, session_ids).fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error fetching laps: {e}") from e
+
+# --- Telemetry ---
+# Storage only; encoding, CSV ingestion and the NumPy read API live in telemetry.py.
+
+TELEMETRY_COLUMNS = ('channel', 'dtype', 'sample_count', 'codec', 'checksum')
+
+def get_lap_ids(session_id):
+    """Returns {lap_number: laps.id} for one session."""
+    try:
+        rows = get_connection().execute(
+            "SELECT lap_number, id FROM laps WHERE session_id = ?", (session_id,)
+        ).fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error reading laps: {e}") from e
+    return dict(rows)
+
+def save_telemetry(records):
+    """
+    Stores encoded telemetry channels in one transaction, replacing channels already stored for a lap.
+    records: iterable of (lap_id, channel, dtype, sample_count, codec, checksum, data); it is consumed
+    lazily, so a generator keeps only one lap's data in memory. Returns the number of channels written.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        with conn, diagnostics.stage('database.save_telemetry'):
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT OR REPLACE INTO telemetry (lap_id, channel, dtype, sample_count, codec, checksum, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, records)
+            written = cursor.rowcount
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Failed to save telemetry: {e}") from e
+    diagnostics.count('database.telemetry_channels_saved', written)
+    return written
+
+def get_telemetry_index(lap_id, channels=None):
+    """Channel metadata (columns: TELEMETRY_COLUMNS) of one lap, without reading the sample data."""
+    sql = f"SELECT {', '.join(TELEMETRY_COLUMNS)} FROM telemetry WHERE lap_id = ?"
+    params = [lap_id]
+    if channels:
+        sql += f" AND channel IN ({', '.join('?' * len(channels))})"
+        params += list(channels)
+    try:
+        return get_connection().execute(sql + " ORDER BY channel", params).fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error reading telemetry: {e}") from e
+
+def get_telemetry_data(lap_id, channel):
+    """The encoded sample data of one channel as bytes, or None if the lap has no such channel."""
+    try:
+        with diagnostics.stage('database.get_telemetry_data'):
+            row = get_connection().execute(
+                "SELECT data FROM telemetry WHERE lap_id = ? AND channel = ?", (lap_id, channel)
+            ).fetchone()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error reading telemetry: {e}") from e
+    return row[0] if row else None
+
+def get_telemetry_checksums(lap_ids):
+    """The (lap_id, channel, checksum) of every stored channel of the given laps, as a set."""
+    lap_ids = sorted(set(lap_ids))
+    found = set()
+    try:
+        conn = get_connection()
+        # In chunks, to stay below SQLite's limit on bound parameters
+        for start in range(0, len(lap_ids), 500):
+            chunk = lap_ids[start:start + 500]
+            found.update(conn.execute(
+                f"SELECT lap_id, channel, checksum FROM telemetry WHERE lap_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ).fetchall())
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error reading telemetry: {e}") from e
+    return found
+
+def get_telemetry_summary(session_id):
+    """Per lap with telemetry: (lap_number, lap_id, channels, samples, stored_bytes), by lap number."""
+    try:
+        return get_connection().execute("""
+            SELECT l.lap_number, l.id, COUNT(t.id), MAX(t.sample_count), SUM(length(t.data))
+            FROM laps l JOIN telemetry t ON t.lap_id = l.id
+            WHERE l.session_id = ?
+            GROUP BY l.id
+            ORDER BY l.lap_number
+        """, (session_id,)).fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error reading telemetry: {e}") from e
+
 def get_session_count():
     """Gets the total number of sessions for the status bar."""
     count = -1
-    conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = get_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM sessions")
         count = cursor.fetchone()[0]
     except:
         count = -1
-    finally:
-        if conn: conn.close()
     return count
 
 def delete_session_by_id(session_id):
     """
     Deletes a session and all associated lap records from the database.
-    Returns True on success, False otherwise.
+    Returns True on success, False if no session id was given; raises DatabaseError on failure.
     """
     if not session_id:
         return False
-        
+    delete_sessions([session_id])
+    return True
+
+# DatabaseError of the best-effort reclaim after the most recent delete_sessions(), or None.
+# The delete itself succeeded; callers may show it as a warning.
+last_reclaim_error = None
+
+def get_reclaim_error():
+    """The error of the space reclaim after the last delete_sessions() call (a warning), or None."""
+    return last_reclaim_error
+
+def delete_sessions(session_ids, reclaim=True):
+    """
+    Deletes many sessions in one transaction; their laps go with them (ON DELETE CASCADE).
+    With reclaim, freed pages are returned to the file system afterwards (best effort, see reclaim_space).
+    Returns the number of sessions deleted; raises DatabaseError on failure (nothing is deleted).
+    """
+    global last_reclaim_error
+    session_ids = sorted({int(session_id) for session_id in session_ids})
+    if not session_ids:
+        return 0
+
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
+        conn = get_connection()
+        # The connection context manager commits on success and rolls back on error
+        with conn, diagnostics.stage('database.delete_sessions', sessions=len(session_ids)):
+            cursor = conn.cursor()
+            stale_combos = set()
+            for session_id in session_ids:
+                stale_combo = _remove_session_from_combo_stats(cursor, session_id)
+                if stale_combo:
+                    stale_combos.add(stale_combo)
+
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS delete_ids (id INTEGER PRIMARY KEY)")
+            cursor.executemany("INSERT OR IGNORE INTO temp.delete_ids (id) VALUES (?)", [(i,) for i in session_ids])
+            cursor.execute("DELETE FROM sessions WHERE id IN (SELECT id FROM temp.delete_ids)")
+            deleted = cursor.rowcount
+            cursor.execute("DELETE FROM temp.delete_ids")
+
+            # Sessions that held a personal best (or were a combo's last): recompute those combos
+            for stale_combo in stale_combos:
+                _recompute_combo_stats(cursor, *stale_combo)
+        diagnostics.count('database.sessions_deleted', deleted)
+
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Failed to delete {len(session_ids)} session(s): {e}") from e
+
+    if deleted:
+        _notify_change()
+    if reclaim:
+        # Best effort: the delete has committed, so a busy or failing vacuum must not report it as failed
+        try:
+            reclaim_space(checkpoint='PASSIVE')
+            last_reclaim_error = None
+        except DatabaseError as e:
+            diagnostics.count('database.reclaim_errors')
+            last_reclaim_error = e
+    return deleted
+
+# --- Retention & Disk Space ---
+
+def find_sessions_to_prune(keep_last=None, invalid_older_than_days=None, today=None):
+    """
+    Session ids matched by the retention rules (either rule may be None to skip it):
+      keep_last: keep only the newest keep_last sessions of every car/track combo
+      invalid_older_than_days: sessions without a single valid lap, older than that many days
+    """
+    queries, params = [], []
+    if keep_last is not None:
+        queries.append("""
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY car_model, track_name ORDER BY started_at DESC, id DESC
+                ) AS newest_first
+                FROM sessions
+            ) WHERE newest_first > ?
+        """)
+        params.append(max(int(keep_last), 0))
+    if invalid_older_than_days is not None:
+        cutoff = (today or datetime.date.today()) - datetime.timedelta(days=int(invalid_older_than_days))
+        queries.append("""
+            SELECT s.id FROM sessions s
+            WHERE s.started_at < ?
+              AND NOT EXISTS (SELECT 1 FROM laps l WHERE l.session_id = s.id AND l.is_valid = 1)
+        """)
+        params.append(to_started_at(cutoff))
+    if not queries:
+        return []
 
-        # Start transaction
-        conn.isolation_level = None # Autocommit off
-        cursor.execute("BEGIN")
+    try:
+        rows = get_connection().execute(" UNION ".join(queries) + " ORDER BY 1", params).fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error applying retention rules: {e}") from e
+    return [row[0] for row in rows]
 
-        # 1. Delete all laps associated with the session
-        cursor.execute("DELETE FROM laps WHERE session_id = ?", (session_id,))
+def prune_sessions(keep_last=None, invalid_older_than_days=None, dry_run=False):
+    """
+    Deletes the sessions matched by the retention rules (see find_sessions_to_prune) in one
+    transaction, then reclaims the freed space. Returns the ids deleted (or that would be, with dry_run).
+    """
+    session_ids = find_sessions_to_prune(keep_last, invalid_older_than_days)
+    if session_ids and not dry_run:
+        delete_sessions(session_ids)
+    return session_ids
 
-        # 2. Delete the session record itself
-        cursor.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+def reclaim_space(full=False, checkpoint='TRUNCATE'):
+    """
+    Returns free pages to the file system. Files in auto_vacuum=INCREMENTAL mode (all files created
+    by this version) just run an incremental vacuum, which only moves the freed pages. Older files
+    need one full VACUUM (full=True) to rewrite and switch them to incremental mode.
+    checkpoint: TRUNCATE waits (up to the busy timeout) for readers so the WAL file can be emptied;
+    PASSIVE copies what it can without waiting, for calls made on interactive paths.
+    Returns the number of bytes the database file shrank by.
+    """
+    conn = get_connection()
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        with diagnostics.stage('database.reclaim_space', full=full):
+            if full:
+                conn.execute("VACUUM") # Also applies the pending auto_vacuum = INCREMENTAL
+            elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                # executescript steps the pragma to completion; execute() frees a single page
+                conn.executescript("PRAGMA incremental_vacuum;")
+            else:
+                return 0
+            # Fold the WAL back into the file (TRUNCATE also empties it), so the space shows up on disk
+            conn.execute(f"PRAGMA wal_checkpoint({'PASSIVE' if checkpoint == 'PASSIVE' else 'TRUNCATE'})").fetchall()
+        after = conn.execute("PRAGMA page_count").fetchone()[0]
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Failed to reclaim disk space: {e}") from e
+    return (before - after) * page_size
+
+# --- Merging Rig Databases ---
+# Every rig writes its own sim_data.db; merge_database() copies a rig's new sessions (with their
+# laps and telemetry) into this database. Everything is set-based SQL over the ATTACHed file.
+
+def _source_columns(cursor, table):
+    cursor.execute(f"PRAGMA src.table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
 
-        conn.commit()
-        return True
+def _merge_source(cursor, source, full):
+    """Copies the new sessions of the database attached as 'src'. Runs inside the caller's transaction."""
+    session_columns = _source_columns(cursor, 'sessions')
+    lap_columns = _source_columns(cursor, 'laps')
+    if not session_columns or not lap_columns:
+        raise DatabaseError(f"{source} is not a session database.")
+    # Files from older versions may lack columns added by later migrations
+    content_hash = "s.content_hash" if 'content_hash' in session_columns else "NULL"
+    sector_3 = "l.sector_3" if 'sector_3' in lap_columns else "NULL"
 
+    cursor.execute("SELECT last_session_id FROM merge_sources WHERE source = ?", (source,))
+    row = cursor.fetchone()
+    watermark = row[0] if row and not full else 0
+    cursor.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM src.sessions WHERE id > ?", (watermark,))
+    source_max_id, candidates = cursor.fetchone()
+    stats = {'sessions': 0, 'laps': 0, 'telemetry': 0, 'duplicates': 0}
+    if not candidates:
+        return stats
+
+    # Remap ids: new sessions are numbered after this database's highest id, in source order.
+    # Content dedup: the results file hash, or for hashless (legacy) sessions car/track/date/best lap.
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS merge_ids (source_id INTEGER PRIMARY KEY, session_id INTEGER NOT NULL)")
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM main.sessions")
+    offset = cursor.fetchone()[0]
+    cursor.execute(f"""
+        INSERT INTO temp.merge_ids (source_id, session_id)
+        SELECT s.id, ? + ROW_NUMBER() OVER (ORDER BY s.id)
+        FROM src.sessions s
+        WHERE s.id > ?
+          AND NOT EXISTS (SELECT 1 FROM main.sessions m WHERE m.content_hash = {content_hash})
+          AND NOT ({content_hash} IS NULL AND EXISTS (
+              SELECT 1 FROM main.sessions m
+              WHERE m.car_model = s.car_model AND m.track_name = s.track_name
+                AND m.date_time = s.date_time AND m.best_lap_time IS s.best_lap_time))
+    """, (offset, watermark))
+    stats['sessions'] = cursor.rowcount
+    stats['duplicates'] = candidates - stats['sessions']
+
+    if stats['sessions']:
+        cursor.execute(f"""
+            INSERT INTO main.sessions (id, car_model, track_name, date_time, best_lap_time, theoretical_lap_time,
+                                       content_hash, started_at)
+            SELECT n.session_id, s.car_model, s.track_name, s.date_time, s.best_lap_time, s.theoretical_lap_time,
+                   {content_hash}, {_STARTED_AT_SQL.format("s.date_time")}
+            FROM temp.merge_ids n JOIN src.sessions s ON s.id = n.source_id
+            ORDER BY n.session_id
+        """)
+        cursor.execute(f"""
+            INSERT INTO main.laps (session_id, lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid)
+            SELECT n.session_id, l.lap_number, l.lap_time, l.sector_1, l.sector_2, {sector_3}, l.cuts, l.is_valid
+            FROM temp.merge_ids n JOIN src.laps l ON l.session_id = n.source_id
+            ORDER BY n.session_id, l.lap_number
+        """)
+        stats['laps'] = cursor.rowcount
+
+        if _source_columns(cursor, 'telemetry'):
+            # Source lap ids -> the new lap ids, matched by (session, lap number)
+            cursor.execute("""
+                INSERT OR IGNORE INTO main.telemetry (lap_id, channel, dtype, sample_count, codec, checksum, data)
+                SELECT ml.id, t.channel, t.dtype, t.sample_count, t.codec, t.checksum, t.data
+                FROM temp.merge_ids n
+                JOIN src.laps sl ON sl.session_id = n.source_id
+                JOIN src.telemetry t ON t.lap_id = sl.id
+                JOIN main.laps ml ON ml.session_id = n.session_id AND ml.lap_number = sl.lap_number
+            """)
+            stats['telemetry'] = cursor.rowcount
+
+        cursor.execute("""
+            SELECT s.id, s.car_model, s.track_name FROM temp.merge_ids n JOIN main.sessions s ON s.id = n.session_id
+        """)
+        for session_id, car_model, track_name in cursor.fetchall():
+            _add_session_to_combo_stats(cursor, session_id, car_model, track_name)
+    cursor.execute("DELETE FROM temp.merge_ids")
+
+    cursor.execute("""
+        INSERT INTO merge_sources (source, last_session_id, sessions_merged, merged_at)
+        VALUES (?, ?, ?, strftime('%Y-%m-%d %H:%M:%S', 'now'))
+        ON CONFLICT (source) DO UPDATE SET
+            last_session_id = MAX(last_session_id, excluded.last_session_id),
+            sessions_merged = sessions_merged + excluded.sessions_merged,
+            merged_at = excluded.merged_at
+    """, (source, source_max_id, stats['sessions']))
+    return stats
+
+def merge_database(source_path, full=False):
+    """
+    Merges one rig database into this one, in a single transaction: the sessions added to the
+    source since its last merge (per-source watermark on the source's session ids) are copied with
+    new ids, together with their laps and telemetry; sessions already stored here (same content)
+    are skipped. full=True ignores the watermark (still deduplicated), e.g. after a rig's
+    newest sessions were deleted and their ids reused.
+    Returns {'sessions', 'laps', 'telemetry', 'duplicates'}; raises DatabaseError on failure
+    (nothing from that source is merged).
+    """
+    source = os.path.abspath(source_path)
+    if not os.path.isfile(source):
+        raise DatabaseError(f"No such database: {source_path}") # ATTACH would create an empty one
+    if os.path.abspath(DB_NAME) == source:
+        raise DatabaseError("Cannot merge a database into itself.")
+
+    try:
+        conn = get_connection()
+        conn.execute("ATTACH DATABASE ? AS src", (source,)) # Not allowed inside a transaction
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                with diagnostics.stage('database.merge_database'):
+                    stats = _merge_source(cursor, source, full)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute("DETACH DATABASE src")
     except sqlite3.Error as e:
-        if conn: conn.rollback()
-        messagebox.showerror("Database Error", f"Failed to delete session {session_id}: {e}")
-        return False
-    finally:
-        if conn: conn.close()
\ No newline at end of file
+        raise DatabaseError(f"Failed to merge {source_path}: {e}") from e
+    diagnostics.count('database.sessions_merged', stats['sessions'])
+    if stats['sessions']:
+        _notify_change()
+    return stats
+
+def get_merge_sources():
+    """Merge watermarks: [(source, last_session_id, sessions_merged, merged_at)], by source."""
+    try:
+        return get_connection().execute(
+            "SELECT source, last_session_id, sessions_merged, merged_at FROM merge_sources ORDER BY source"
+        ).fetchall()
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Error reading merge sources: {e}") from e
@@ -0,0 +1,173 @@
+"""
+Lightweight per-stage timing for the slow paths (JSON parsing, report building, database
+writes, Treeview inserts). Timings are kept in memory as counters and histograms, can be
+streamed to a JSON lines file, and a single run of a stage can be captured with cProfile.
+
+    with diagnostics.stage('analysis.parse_json'):
+        ...
+
+Set ACA_DIAGNOSTICS_JSONL=<path> to stream every timing from startup.
+"""
+import bisect
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+# Upper bucket edges in ms; the last bucket is everything slower
+BUCKET_EDGES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+enabled = True
+
+_lock = threading.Lock()
+_stages = {}    # name -> _StageStats
+_counters = {}  # name -> int
+_jsonl = None   # Open JSON lines file, or None
+_profile_armed = set()  # Stage names whose next run is captured with cProfile
+_profiling = False
+last_profile = None     # (stage name, pstats text) of the most recent capture
+
+class _StageStats:
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKET_EDGES_MS) + 1)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        if ms < self.min: self.min = ms
+        if ms > self.max: self.max = ms
+        self.buckets[bisect.bisect_left(BUCKET_EDGES_MS, ms)] += 1
+
+    def percentile(self, fraction):
+        """Histogram estimate: the upper edge of the bucket holding that fraction of runs."""
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return BUCKET_EDGES_MS[index] if index < len(BUCKET_EDGES_MS) else self.max
+        return self.max
+
+def record(name, ms, **fields):
+    """Adds one timing (ms) for stage name. Extra fields only go to the JSON lines file."""
+    if not enabled:
+        return
+    with _lock:
+        stats = _stages.get(name)
+        if stats is None:
+            stats = _stages[name] = _StageStats()
+        stats.add(ms)
+        if _jsonl is not None:
+            entry = {'ts': round(time.time(), 6), 'stage': name, 'ms': round(ms, 4)}
+            entry.update(fields)
+            _jsonl.write(json.dumps(entry) + "\n")
+
+def count(name, n=1):
+    """Increments counter name by n (e.g. rows inserted, files skipped)."""
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+class stage:
+    """Context manager that times the enclosed block as one run of stage name."""
+    __slots__ = ('name', 'fields', '_start', '_profiler')
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self._profiler = None
+
+    def __enter__(self):
+        global _profiling
+        if _profile_armed and self.name in _profile_armed:
+            with _lock:
+                # cProfile allows one active profiler at a time
+                if self.name in _profile_armed and not _profiling:
+                    _profile_armed.discard(self.name)
+                    _profiling = True
+                    self._profiler = cProfile.Profile()
+            if self._profiler is not None:
+                self._profiler.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = (time.perf_counter() - self._start) * 1000
+        if self._profiler is not None:
+            self._profiler.disable()
+            _finish_profile(self.name, self._profiler)
+        record(self.name, elapsed, **self.fields)
+        return False
+
+def _finish_profile(name, profiler):
+    global last_profile, _profiling
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(40)
+    with _lock:
+        last_profile = (name, out.getvalue())
+        _profiling = False
+
+def profile_next(name):
+    """Captures the next run of stage name with cProfile; the result lands in last_profile."""
+    with _lock:
+        _profile_armed.add(name)
+
+def pending_profiles():
+    """Stage names armed with profile_next() that have not run yet."""
+    with _lock:
+        return sorted(_profile_armed)
+
+def snapshot():
+    """Returns ({stage: stats dict}, {counter: value}) for display."""
+    with _lock:
+        stages = {
+            name: {
+                'count': s.count,
+                'total_ms': s.total,
+                'mean_ms': s.total / s.count if s.count else 0.0,
+                'min_ms': s.min if s.count else 0.0,
+                'max_ms': s.max,
+                'p50_ms': s.percentile(0.5),
+                'p95_ms': s.percentile(0.95),
+                'buckets': list(s.buckets),
+            }
+            for name, s in _stages.items()
+        }
+        return stages, dict(_counters)
+
+def reset():
+    """Clears all timings and counters (the JSON lines file, if any, stays open)."""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+def start_jsonl(path):
+    """Appends every subsequent timing to path as one JSON object per line."""
+    global _jsonl
+    stop_jsonl()
+    f = open(path, 'a', encoding='utf-8', buffering=1) # Line buffered: each record is flushed
+    with _lock:
+        _jsonl = f
+
+def stop_jsonl():
+    global _jsonl
+    with _lock:
+        f, _jsonl = _jsonl, None
+    if f is not None:
+        f.close()
+
+def jsonl_path():
+    return _jsonl.name if _jsonl is not None else None
+
+if os.environ.get('ACA_DIAGNOSTICS_JSONL'):
+    start_jsonl(os.environ['ACA_DIAGNOSTICS_JSONL'])
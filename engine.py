@@ -0,0 +1,221 @@
+import json
+import os
+from array import array
+
+import numpy as np
+
+from analysis import format_ms_to_time, iter_json_events, use_streaming_parser
+
+MAX_SECTORS = 3
+SESSION_TYPES = {1: "Practice", 2: "Qualifying", 3: "Race"}
+
+class SessionLaps:
+    """
+    All laps of one session (every driver) as column arrays, one element per lap:
+    car (player index), time, cuts, and sectors with shape (laps, MAX_SECTORS), -1 where missing.
+    """
+    __slots__ = ('name', 'type', 'sector_count', 'car', 'time', 'cuts', 'sectors')
+
+    def __init__(self, name, session_type, sector_count, car, time, cuts, sectors):
+        self.name = name
+        self.type = session_type
+        self.sector_count = sector_count
+        self.car = car
+        self.time = time
+        self.cuts = cuts
+        self.sectors = sectors
+
+class _SessionBuilder:
+    """Accumulates one session's laps into compact typed arrays while the file streams past."""
+    def __init__(self):
+        self.name = None
+        self.type = None
+        self.sector_count = 0
+        self.car = array('i')
+        self.time = array('q')
+        self.cuts = array('i')
+        self.sectors = array('q')
+
+    def add_lap(self, car, time, cuts, sectors):
+        self.car.append(int(car))
+        self.time.append(int(time))
+        self.cuts.append(int(cuts))
+        sectors = [int(s) for s in sectors[:MAX_SECTORS]]
+        self.sector_count = max(self.sector_count, len(sectors))
+        self.sectors.extend(sectors + [-1] * (MAX_SECTORS - len(sectors)))
+
+    def build(self):
+        n = len(self.time)
+        return SessionLaps(
+            self.name,
+            self.type,
+            self.sector_count,
+            np.frombuffer(self.car, dtype=np.int32),
+            np.frombuffer(self.time, dtype=np.int64),
+            np.frombuffer(self.cuts, dtype=np.int32),
+            np.frombuffer(self.sectors, dtype=np.int64).reshape(n, MAX_SECTORS)
+        )
+
+def _load_streaming(f):
+    track, players, builders = None, [], []
+    player = lap = None
+
+    for prefix, event, value in iter_json_events(f):
+        if prefix == 'track' and event == 'string':
+            track = value
+        elif prefix == 'players.item':
+            if event == 'start_map':
+                player = {'name': None, 'car': None}
+            elif event == 'end_map':
+                players.append(player)
+        elif prefix == 'players.item.name':
+            player['name'] = value
+        elif prefix == 'players.item.car':
+            player['car'] = value
+        elif prefix == 'sessions.item' and event == 'start_map':
+            builders.append(_SessionBuilder())
+        elif prefix == 'sessions.item.name':
+            builders[-1].name = value
+        elif prefix == 'sessions.item.type':
+            builders[-1].type = value
+        elif prefix == 'sessions.item.laps.item':
+            if event == 'start_map':
+                lap = {'car': 0, 'time': -1, 'cuts': 0, 'sectors': []}
+            elif event == 'end_map':
+                builders[-1].add_lap(lap['car'], lap['time'], lap['cuts'], lap['sectors'])
+                lap = None
+        elif lap is not None:
+            if prefix == 'sessions.item.laps.item.car':
+                lap['car'] = value
+            elif prefix == 'sessions.item.laps.item.time':
+                lap['time'] = value
+            elif prefix == 'sessions.item.laps.item.cuts':
+                lap['cuts'] = value
+            elif prefix == 'sessions.item.laps.item.sectors.item':
+                lap['sectors'].append(value)
+
+    return track, players, builders
+
+def _load_document(f):
+    data = json.load(f)
+    players = [{'name': p.get('name'), 'car': p.get('car')} for p in data.get('players', [])]
+    builders = []
+    for session in data.get('sessions', []):
+        builder = _SessionBuilder()
+        builder.name = session.get('name')
+        builder.type = session.get('type')
+        for lap in session.get('laps', []):
+            builder.add_lap(lap.get('car', 0), lap.get('time', -1), lap.get('cuts', 0), lap.get('sectors', []))
+        builders.append(builder)
+    return data.get('track'), players, builders
+
+def load_results(file_path):
+    """
+    Loads every player and every session (practice, qualifying, race) of a results file.
+    Returns (track, players, sessions) where sessions is a list of SessionLaps.
+    """
+    with open(file_path, 'rb') as f:
+        if use_streaming_parser(os.fstat(f.fileno()).st_size):
+            track, players, builders = _load_streaming(f)
+        else:
+            track, players, builders = _load_document(f)
+    return track, players, [builder.build() for builder in builders]
+
+class DriverStats:
+    """
+    Per-driver statistics for one session, one array element per player (index = player index).
+    Times are in ms; -1 marks "no valid lap / no data", matching analyze_ac_session.
+    """
+    __slots__ = ('lap_count', 'valid_count', 'best', 'average', 'best_sectors', 'theoretical')
+
+    def __init__(self, session, player_count):
+        n = max(player_count, int(session.car.max()) + 1 if session.car.size else 0)
+        car, time = session.car, session.time
+
+        # Validity mask for every lap of every driver at once
+        valid = (time > 0) & (session.cuts == 0)
+
+        self.lap_count = np.bincount(car, minlength=n)
+        self.valid_count = np.bincount(car[valid], minlength=n)
+        valid_sum = np.bincount(car[valid], weights=time[valid], minlength=n)
+        self.average = np.where(self.valid_count > 0, valid_sum / np.maximum(self.valid_count, 1), -1)
+
+        self.best = self._group_min(car[valid], time[valid], n)
+
+        # Best of each sector over valid laps; theoretical best needs 3 (or 2) sectors, like analyze_ac_session
+        self.best_sectors = np.full((n, MAX_SECTORS), -1, dtype=np.int64)
+        for k in range(session.sector_count):
+            column = session.sectors[:, k]
+            mask = valid & (column > 0)
+            self.best_sectors[:, k] = self._group_min(car[mask], column[mask], n)
+
+        have = self.best_sectors > 0
+        three = have[:, :3].all(axis=1)
+        two = have[:, :2].all(axis=1)
+        self.theoretical = np.where(
+            three, self.best_sectors[:, :3].sum(axis=1),
+            np.where(two, self.best_sectors[:, :2].sum(axis=1), -1)
+        )
+
+    @staticmethod
+    def _group_min(groups, values, n):
+        """Minimum of values per group index (0..n-1), -1 for groups without values."""
+        result = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(result, groups, values)
+        result[result == np.iinfo(np.int64).max] = -1
+        return result
+
+class ResultsAnalysis:
+    """Batch analysis of a whole results file. The text report is only built by render_report()."""
+    def __init__(self, track, players, sessions):
+        self.track = track
+        self.players = players
+        self.sessions = sessions
+        self.stats = [DriverStats(session, len(players)) for session in sessions]
+
+    def _player_label(self, index):
+        if index < len(self.players):
+            player = self.players[index]
+            name = player.get('name') or f"Driver {index + 1}"
+            car = (player.get('car') or "Unknown Car").replace("ks_", "").replace("_", " ").title()
+            return f"{name} ({car})"
+        return f"Driver {index + 1}"
+
+    def render_report(self):
+        """Builds the multi-driver text report (list of lines), ranked by best lap per session."""
+        track = (self.track or "Unknown Track").replace("ks_", "").replace("-", " ").title()
+        output = [
+            "=" * 70,
+            "   ASSETTO CORSA FULL RESULTS ANALYSIS   ",
+            "=" * 70,
+            f"Track:   {track}",
+            f"Drivers: {len(self.players)}",
+        ]
+
+        for session, stats in zip(self.sessions, self.stats):
+            session_name = session.name or SESSION_TYPES.get(session.type, "Session")
+            output.append("-" * 70)
+            output.append(f"{session_name.upper()}  ({int(session.time.size)} laps)")
+            output.append("Pos | Driver | Best | Average | Theoretical | Valid/Total")
+
+            # Drivers with a valid lap ranked by best lap, then everyone else
+            has_best = stats.best > 0
+            ranked = np.concatenate([
+                np.flatnonzero(has_best)[np.argsort(stats.best[has_best], kind='stable')],
+                np.flatnonzero(~has_best & (stats.lap_count > 0))
+            ])
+            for position, index in enumerate(ranked, start=1):
+                output.append(
+                    f"{position:3} | {self._player_label(index)} | "
+                    f"{format_ms_to_time(int(stats.best[index]))} | "
+                    f"{format_ms_to_time(int(stats.average[index]))} | "
+                    f"{format_ms_to_time(int(stats.theoretical[index]))} | "
+                    f"{int(stats.valid_count[index])}/{int(stats.lap_count[index])}"
+                )
+
+        output.append("=" * 70)
+        return output
+
+def analyze_results(file_path):
+    """Loads and analyzes every driver in every session of a results file. Returns a ResultsAnalysis."""
+    return ResultsAnalysis(*load_results(file_path))
@@ -0,0 +1,121 @@
+import csv
+import os
+
+from database import EXPORT_COLUMNS, EXPORT_CHUNK_SIZE, DatabaseError, iter_laps_for_export
+
+try:
+    # Optional: columnar Parquet / Arrow IPC output
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_FORMATS = ('csv', 'parquet', 'arrow')
+FORMAT_EXTENSIONS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'}
+
+class ExportError(Exception):
+    """Writing the export file failed (the partial file is removed). The cause is chained as __cause__."""
+
+# Columnar files get one row group / record batch per chunk, so chunks are larger than for CSV
+COLUMNAR_CHUNK_SIZE = 65536
+
+def _arrow_schema():
+    return pa.schema([
+        ('session_id', pa.int64()),
+        ('car_model', pa.string()),
+        ('track_name', pa.string()),
+        ('date_time', pa.string()),
+        ('lap_number', pa.int32()),
+        ('lap_time', pa.int64()),
+        ('sector_1', pa.int64()),
+        ('sector_2', pa.int64()),
+        ('sector_3', pa.int64()),
+        ('cuts', pa.int32()),
+        ('is_valid', pa.bool_()),
+    ])
+
+def format_for_path(path):
+    """Picks the export format from the file extension (CSV when unknown or writing to stdout)."""
+    return FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+def _write_csv(out, chunks, progress_callback):
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_COLUMNS)
+    rows = 0
+    for chunk in chunks:
+        writer.writerows(chunk)
+        rows += len(chunk)
+        if progress_callback:
+            progress_callback(rows)
+    return rows
+
+def _arrow_column(values, field):
+    # SQLite has no boolean type: is_valid comes back as 0/1
+    if field.type == pa.bool_():
+        values = [None if v is None else bool(v) for v in values]
+    return pa.array(values, type=field.type)
+
+def _write_columnar(path, fmt, chunks, progress_callback):
+    schema = _arrow_schema()
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(path, schema, compression='zstd')
+    else:
+        writer = ipc.new_file(path, schema)
+
+    rows = 0
+    try:
+        for chunk in chunks:
+            # Transpose the row chunk into columns; only one chunk is held in memory at a time
+            columns = zip(*chunk)
+            batch = pa.RecordBatch.from_arrays(
+                [_arrow_column(column, field) for column, field in zip(columns, schema)],
+                schema=schema
+            )
+            writer.write_batch(batch)
+            rows += len(chunk)
+            if progress_callback:
+                progress_callback(rows)
+    finally:
+        writer.close()
+    return rows
+
+def export_laps(path, fmt=None, car_filter='All Cars', track_filter='All Tracks', date_from=None, date_to=None, progress_callback=None):
+    """
+    Streams laps joined with their sessions (columns: EXPORT_COLUMNS) to a CSV, Parquet or
+    Arrow IPC file, filtered like get_sessions. fmt defaults to the one implied by the extension.
+    path may also be an open text stream for CSV. Returns the number of laps written.
+
+    progress_callback(rows_written) is called after every chunk. Raises ExportError if writing
+    fails (the partial file is deleted), ValueError/RuntimeError for unusable formats or paths.
+    """
+    if fmt is None:
+        fmt = format_for_path(path) if isinstance(path, str) else 'csv'
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    if fmt == 'csv':
+        chunks = iter_laps_for_export(car_filter, track_filter, date_from, date_to, chunk_size=EXPORT_CHUNK_SIZE)
+        if not isinstance(path, str):
+            return _write_csv(path, chunks, progress_callback)
+    else:
+        if pa is None:
+            raise RuntimeError(f"Exporting to {fmt} needs pyarrow (pip install pyarrow).")
+        if not isinstance(path, str):
+            raise ValueError(f"{fmt} export needs a file path.")
+        chunks = iter_laps_for_export(car_filter, track_filter, date_from, date_to, chunk_size=COLUMNAR_CHUNK_SIZE)
+
+    try:
+        if fmt == 'csv':
+            with open(path, 'w', newline='', encoding='utf-8') as out:
+                return _write_csv(out, chunks, progress_callback)
+        return _write_columnar(path, fmt, chunks, progress_callback)
+    except Exception as e:
+        # Never leave a truncated file behind that looks like a finished export
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        if isinstance(e, DatabaseError):
+            raise
+        raise ExportError(f"Failed to write {path}: {e}") from e
@@ -0,0 +1,205 @@
+"""
+Generates realistic Assetto Corsa / Content Manager results JSON files for benchmarks and
+manual testing: multiple players, interleaved laps, 2- and 3-sector tracks, cuts, slow
+out-laps and a __quickDrive block carrying the session date ('dtv').
+
+    python synthetic_results.py OUT_DIR --files 50 --players 4 --laps 30
+"""
+import argparse
+import csv
+import datetime
+import json
+import math
+import os
+import random
+
+# (track id, sector count, typical lap time in ms)
+TRACKS = (
+    ('ks_monza', 3, 107000),
+    ('ks_nurburgring-layout_gp_a', 3, 118000),
+    ('ks_brands_hatch-indy', 2, 52000),
+    ('ks_vallelunga-club_circuit', 2, 66000),
+    ('spa', 3, 141000),
+    ('ks_red_bull_ring-layout_national', 3, 71000),
+    ('magione', 2, 74000),
+)
+
+CARS = (
+    'ks_mazda_mx5_cup', 'ks_porsche_911_gt3_cup_2017', 'ks_ferrari_488_gt3', 'bmw_m3_e30',
+    'ks_audi_r8_lms_2016', 'lotus_exige_240', 'ks_toyota_gt86', 'ks_mclaren_650_gt3',
+)
+
+DRIVER_NAMES = ('Player', 'A. Senna', 'J. Clark', 'N. Lauda', 'G. Villeneuve', 'M. Hakkinen', 'K. Raikkonen', 'A. Prost')
+
+SESSION_TYPES = ((1, "Practice"), (2, "Qualifying"), (3, "Race"))
+
+def _split_sectors(rng, lap_time, sector_count):
+    """Splits a lap time into sector times that add up to it exactly."""
+    weights = [rng.uniform(0.9, 1.1) for _ in range(sector_count)]
+    total = sum(weights)
+    sectors = [int(lap_time * w / total) for w in weights[:-1]]
+    sectors.append(lap_time - sum(sectors))
+    return sectors
+
+def generate_laps(rng, player_count, laps_per_player, sector_count, base_ms, cut_rate=0.1):
+    """
+    Returns AC lap dicts for every player, interleaved in completion order like real results.
+    Each player has their own pace; the first lap is a slow out-lap; cut laps are slower too.
+    """
+    laps = []
+    for car in range(player_count):
+        pace = base_ms * rng.uniform(0.98, 1.06)
+        elapsed = 0
+        for lap in range(laps_per_player):
+            # Drivers improve over a stint, with lap-to-lap noise around their pace
+            lap_time = pace * (1.0 + 0.01 * rng.expovariate(1.0) - 0.0004 * min(lap, 10))
+            cuts = 0
+            if lap == 0:
+                lap_time *= rng.uniform(1.15, 1.35)
+            elif rng.random() < cut_rate:
+                cuts = rng.choice((1, 1, 1, 2, 3))
+                lap_time *= rng.uniform(0.995, 1.08)
+            lap_time = int(lap_time)
+            elapsed += lap_time
+            laps.append({
+                'lap': lap,
+                'car': car,
+                'sectors': _split_sectors(rng, lap_time, sector_count),
+                'time': lap_time,
+                'cuts': cuts,
+                'tyre': 'SM',
+                '_finished_at': elapsed,
+            })
+
+    laps.sort(key=lambda lap: lap['_finished_at'])
+    for lap in laps:
+        del lap['_finished_at']
+    return laps
+
+def _quick_drive(track, car, mode, session_datetime):
+    return json.dumps({
+        'Mode': f"/Pages/Drive/QuickDrive_{mode}.xaml",
+        'ModeData': "{}",
+        'CarId': car,
+        'TrackId': track,
+        'WeatherId': "3_clear",
+        'TrackPropertiesPreset': "Optimum",
+        'dtv': session_datetime.strftime('%Y-%m-%dT%H:%M:%S.0000000+01:00'),
+    }, separators=(',', ':'))
+
+def generate_results(players=1, laps_per_player=20, sessions=1, track=None, car=None,
+                     session_datetime=None, cut_rate=0.1, seed=None):
+    """
+    Builds one results document as Content Manager writes it. track/car default to a random
+    pick (track sets the sector count: 2 or 3). Player 0 drives car; opponents get random cars.
+    """
+    rng = random.Random(seed)
+    track_id, sector_count, base_ms = next((t for t in TRACKS if t[0] == track), None) or rng.choice(TRACKS)
+    car = car or rng.choice(CARS)
+    if session_datetime is None:
+        session_datetime = datetime.datetime(2024, 1, 1, 9) + datetime.timedelta(minutes=rng.randrange(0, 60 * 24 * 365))
+
+    player_list = [
+        {
+            'name': DRIVER_NAMES[i] if i < len(DRIVER_NAMES) else f"Driver {i + 1}",
+            'car': car if i == 0 else rng.choice(CARS),
+            'skin': "00_default",
+        }
+        for i in range(players)
+    ]
+
+    session_list = []
+    for index in range(sessions):
+        session_type, name = SESSION_TYPES[min(index, len(SESSION_TYPES) - 1)]
+        laps = generate_laps(rng, players, laps_per_player, sector_count, base_ms, cut_rate)
+        best = {}
+        for lap in laps:
+            if lap['cuts'] == 0 and lap['time'] < best.get(lap['car'], (1 << 62, 0))[0]:
+                best[lap['car']] = (lap['time'], lap['lap'])
+        session_list.append({
+            'event': index,
+            'name': name,
+            'type': session_type,
+            'lapsCount': laps_per_player if session_type == 3 else 0,
+            'duration': 0 if session_type == 3 else 30,
+            'laps': laps,
+            'lapstotal': [laps_per_player] * players,
+            'bestLaps': [{'car': c, 'time': t, 'lap': n} for c, (t, n) in sorted(best.items())],
+            'raceResult': sorted(best, key=lambda c: best[c][0]),
+        })
+
+    return {
+        'track': track_id,
+        'number_of_sessions': sessions,
+        'players': player_list,
+        'sessions': session_list,
+        'extras': [],
+        '__quickDrive': _quick_drive(track_id, car, session_list[0]['name'] if session_list else "Practice", session_datetime),
+    }
+
+def results_file_name(document):
+    """Content Manager style name: YYYY_M_D_H_M_S_TYPE.json, taken from the quick-drive date."""
+    stamp = datetime.datetime.strptime(json.loads(document['__quickDrive'])['dtv'][:19], '%Y-%m-%dT%H:%M:%S')
+    kind = document['sessions'][0]['name'].upper() if document['sessions'] else "PRACTICE"
+    return f"{stamp.year}_{stamp.month}_{stamp.day}_{stamp.hour}_{stamp.minute}_{stamp.second}_{kind}.json"
+
+def write_results(directory, count, seed=0, **options):
+    """Writes count results files into directory (options as for generate_results). Returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        document = generate_results(seed=seed + i, **options)
+        path = os.path.join(directory, f"{i:06d}_" + results_file_name(document))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+        paths.append(path)
+    return paths
+
+def write_telemetry_csv(path, lap_times, rate_hz=60, seed=0):
+    """
+    Writes a telemetry CSV as a logger would (lap, time, speed, throttle, brake, steering, gear,
+    pos_x, pos_y, pos_z; one row per sample, laps numbered from 1). lap_times in ms.
+    Returns the number of samples written.
+    """
+    rng = random.Random(seed)
+    samples = 0
+    elapsed = 0.0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('lap', 'time', 'speed', 'throttle', 'brake', 'steering', 'gear', 'pos_x', 'pos_y', 'pos_z'))
+        for lap_number, lap_time in enumerate(lap_times, start=1):
+            count = int(lap_time / 1000 * rate_hz)
+            for i in range(count):
+                phase = 2 * math.pi * i / count  # Position on a roughly oval track
+                corner = math.sin(4 * phase)
+                speed = 150 + 90 * corner + rng.gauss(0, 0.5)
+                throttle = min(max(corner + 0.3 + rng.gauss(0, 0.02), 0.0), 1.0)
+                brake = min(max(-corner - 0.6, 0.0), 1.0)
+                writer.writerow((
+                    lap_number, f"{elapsed:.3f}", f"{speed:.2f}", f"{throttle:.3f}", f"{brake:.3f}",
+                    f"{math.cos(4 * phase) * 0.3:.4f}", 2 + int(speed // 50),
+                    f"{800 * math.cos(phase):.2f}", f"{500 * math.sin(phase):.2f}", f"{12 * math.sin(2 * phase):.2f}"
+                ))
+                elapsed += 1 / rate_hz
+            samples += count
+    return samples
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic Assetto Corsa results JSON files.")
+    parser.add_argument('directory')
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--players', type=int, default=1)
+    parser.add_argument('--laps', type=int, default=20, help="Laps per player per session")
+    parser.add_argument('--sessions', type=int, default=1)
+    parser.add_argument('--cut-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    paths = write_results(
+        args.directory, args.files, seed=args.seed, players=args.players,
+        laps_per_player=args.laps, sessions=args.sessions, cut_rate=args.cut_rate
+    )
+    print(f"Wrote {len(paths)} file(s) to {args.directory}")
+
+if __name__ == "__main__":
+    main()
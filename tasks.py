@@ -0,0 +1,146 @@
+import itertools
+import queue
+import tkinter as tk
+from tkinter import ttk
+from concurrent.futures import ThreadPoolExecutor
+
+class TaskRunner:
+    """
+    Runs blocking work (file parsing, database queries) on worker threads and delivers
+    the results back on the Tk thread by polling a queue with after().
+
+    Tasks are submitted under a key. Submitting a new task with the same key makes the
+    previous one obsolete: it is cancelled if it has not started yet, and its result is
+    discarded if it has. This keeps rapid clicks/filter changes from queuing up stale work.
+    """
+    def __init__(self, master, max_workers=2, poll_ms=30, on_busy_change=None):
+        self.master = master
+        self.poll_ms = poll_ms
+        self.on_busy_change = on_busy_change
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="aca-worker")
+        self._results = queue.Queue()
+        self._tokens = itertools.count(1)
+        self._latest = {}    # key -> token of the newest task submitted under that key
+        self._futures = {}   # key -> Future of that task
+        self._pending = 0    # tasks whose results have not been collected yet
+        self._after_id = None
+        self._closed = False
+
+        # Stop polling once the screen that owns this runner is destroyed
+        master.bind('<Destroy>', self._on_destroy, add='+')
+
+    @property
+    def busy(self):
+        return self._pending > 0
+
+    def submit(self, key, fn, *args, on_done=None, on_error=None, **kwargs):
+        """
+        Runs fn(*args, **kwargs) on a worker thread. on_done(result) or on_error(exception)
+        is called on the Tk thread, but only if no newer task was submitted under the same key.
+        """
+        if self._closed:
+            return None
+
+        self.cancel(key)
+        token = next(self._tokens)
+        self._latest[key] = token
+
+        def run():
+            try:
+                self._results.put((key, token, True, fn(*args, **kwargs), on_done, on_error))
+            except Exception as e:
+                self._results.put((key, token, False, e, on_done, on_error))
+
+        self._futures[key] = self._executor.submit(run)
+        self._set_pending(self._pending + 1)
+        self._schedule_poll()
+        return token
+
+    def post(self, callback, *args):
+        """Thread-safe: queues callback(*args) to run on the Tk thread (e.g. progress updates)."""
+        # No after() here: it is not safe off the Tk thread. Posts come from running tasks,
+        # and the poll loop keeps going while any task is pending.
+        self._results.put((None, None, True, args, lambda a: callback(*a), None))
+
+    def cancel(self, key):
+        """Marks the task under key obsolete and cancels it if it has not started."""
+        future = self._futures.pop(key, None)
+        self._latest.pop(key, None)
+        if future is not None and future.cancel():
+            # A cancelled future never reports back, so collect it here
+            self._set_pending(self._pending - 1)
+
+    def shutdown(self):
+        """Discards all pending results and stops the worker threads (without waiting for them)."""
+        self._closed = True
+        self._latest.clear()
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        if self._after_id is not None:
+            try:
+                self.master.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+            self._after_id = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _on_destroy(self, event):
+        if event.widget is self.master:
+            self.shutdown()
+
+    def _set_pending(self, pending):
+        was_busy = self.busy
+        self._pending = pending
+        if self.on_busy_change and was_busy != self.busy and not self._closed:
+            self.on_busy_change(self.busy)
+
+    def _schedule_poll(self):
+        if self._after_id is None and not self._closed:
+            self._after_id = self.master.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        self._after_id = None
+        if self._closed:
+            return
+
+        try:
+            while not self._closed:
+                try:
+                    key, token, ok, value, on_done, on_error = self._results.get_nowait()
+                except queue.Empty:
+                    break
+
+                if key is not None:
+                    self._set_pending(self._pending - 1)
+                    if self._latest.get(key) != token:
+                        continue # Obsolete: a newer task was submitted under this key
+                    del self._latest[key]
+                    self._futures.pop(key, None)
+
+                if ok:
+                    if on_done:
+                        on_done(value)
+                elif on_error:
+                    on_error(value)
+                else:
+                    raise value
+        finally:
+            # Keep polling while work is outstanding, even if a callback raised
+            if self._pending > 0 or not self._results.empty():
+                self._schedule_poll()
+
+class BusyIndicator:
+    """Small indeterminate progress bar that is packed only while work is running."""
+    def __init__(self, master, **pack_options):
+        self.bar = ttk.Progressbar(master, mode='indeterminate', length=120)
+        self.pack_options = pack_options
+
+    def set_busy(self, busy):
+        if busy:
+            self.bar.pack(**self.pack_options)
+            self.bar.start(15)
+        else:
+            self.bar.stop()
+            self.bar.pack_forget()
@@ -0,0 +1,271 @@
+"""
+Per-lap telemetry traces (speed, throttle, brake, steering, position, ... at 50-100 Hz).
+
+Traces are logged as CSV with one row per sample and a lap column. Each lap's channels are
+stored as one typed array per channel in the telemetry table, byte-shuffled and zlib compressed
+(the bytes of similar floats line up, so a channel shrinks to a fraction of its raw size).
+
+    stats = ingest_telemetry_csv(session_id, "laps.csv")
+    channels = open_lap(lap_id)            # {channel: read-only np.memmap}
+    speed = channels['speed']
+"""
+import hashlib
+import os
+import re
+import tempfile
+import zlib
+from itertools import islice
+
+import numpy as np
+
+import database
+import diagnostics
+
+CODEC = 'shuffle+zlib'
+ZLIB_LEVEL = 6
+CSV_CHUNK_ROWS = 200000 # Samples parsed per NumPy call while reading a CSV
+
+LAP_COLUMNS = ('lap', 'lap_number', 'lapnumber', 'lap_no', 'lap_count')
+# Time stamps need float64: float32 loses milliseconds after a few hours of session time
+FLOAT64_CHANNELS = ('t', 'time', 'timestamp', 'time_s', 'elapsed')
+
+# Decoded channels are written here once as .npy files and then memory-mapped
+TELEMETRY_CACHE_DIR = os.environ.get('ACA_TELEMETRY_CACHE', os.path.join(tempfile.gettempdir(), 'aca_telemetry'))
+# Per database; past it the least recently opened cache files are evicted
+TELEMETRY_CACHE_MAX_BYTES = int(os.environ.get('ACA_TELEMETRY_CACHE_MB', 1024)) * 1048576
+CACHE_FILE_PATTERN = re.compile(r'^(\d+)-([0-9a-z_]+)-([0-9a-f]{8})\.npy$')
+
+# --- Encoding ---
+
+def encode_channel(values):
+    """
+    Encodes a 1-D array for storage. Returns (dtype, sample_count, codec, checksum, data) in the
+    column order of the telemetry table; checksum is the CRC32 of the raw (decoded) bytes.
+    """
+    values = np.ascontiguousarray(values)
+    # Byte shuffle: all first bytes, then all second bytes, ... (exponents end up next to each other)
+    shuffled = values.view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+    return values.dtype.str, len(values), CODEC, zlib.crc32(values), zlib.compress(shuffled, ZLIB_LEVEL)
+
+def decode_channel(dtype, sample_count, codec, checksum, data):
+    """Inverse of encode_channel. Raises ValueError for an unknown codec or a checksum mismatch."""
+    dtype = np.dtype(dtype)
+    if codec == CODEC:
+        planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(dtype.itemsize, sample_count)
+        values = planes.T.copy().view(dtype).reshape(sample_count)
+    elif codec == 'raw':
+        values = np.frombuffer(data, dtype=dtype, count=sample_count)
+    else:
+        raise ValueError(f"Unknown telemetry codec: {codec}")
+    if zlib.crc32(values) != checksum:
+        raise ValueError("Telemetry data is corrupt (checksum mismatch).")
+    return values
+
+# --- CSV Ingestion ---
+
+def _channel_name(header):
+    name = re.sub(r'[^0-9a-z]+', '_', header.strip().lower()).strip('_')
+    if not name:
+        raise ValueError(f"Unusable telemetry column name: {header!r}")
+    return name
+
+def _lap_columns(pieces, channels):
+    block = np.concatenate(pieces) if len(pieces) > 1 else pieces[0]
+    return {
+        name: block[:, index].astype(np.float64 if name in FLOAT64_CHANNELS else np.float32)
+        for index, name in channels
+    }
+
+def read_laps_csv(path, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Reads a telemetry CSV (header row, comma/semicolon/tab separated, numeric values) lap by lap.
+    Rows must be grouped by lap, as loggers write them. Yields (lap_number, {channel: ndarray}).
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = f.readline()
+        delimiter = max(',;\t', key=header.count)
+        names = [_channel_name(column) for column in header.split(delimiter)]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate telemetry columns in {os.path.basename(path)}.")
+        lap_index = next((i for i, name in enumerate(names) if name in LAP_COLUMNS), None)
+        if lap_index is None:
+            raise ValueError(f"{os.path.basename(path)} has no lap column ({', '.join(LAP_COLUMNS)}).")
+        channels = [(i, name) for i, name in enumerate(names) if i != lap_index]
+
+        current_lap, pieces, seen = None, [], set()
+        while True:
+            lines = list(islice(f, chunk_rows))
+            if not lines:
+                break
+            try:
+                block = np.loadtxt(lines, delimiter=delimiter, ndmin=2, dtype=np.float64)
+            except ValueError as e:
+                raise ValueError(f"Bad telemetry values in {os.path.basename(path)}: {e}") from e
+            if not len(block):
+                continue
+            laps = block[:, lap_index].astype(np.int64)
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(laps)) + 1))
+            for start, end in zip(starts, np.append(starts[1:], len(block))):
+                lap = int(laps[start])
+                if lap != current_lap:
+                    if pieces:
+                        yield current_lap, _lap_columns(pieces, channels)
+                    if lap in seen:
+                        raise ValueError(f"Telemetry rows of lap {lap} are not contiguous; sort the CSV by lap.")
+                    seen.add(lap)
+                    current_lap, pieces = lap, []
+                pieces.append(block[start:end])
+        if pieces:
+            yield current_lap, _lap_columns(pieces, channels)
+
+def ingest_telemetry_csv(session_id, path, lap_offset=0, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Stores the laps of a telemetry CSV against the saved laps of session_id, matched by lap number
+    (CSV lap + lap_offset, for loggers that count from 0). Everything is written in one transaction.
+    Returns {'laps', 'samples', 'channels', 'raw_bytes', 'stored_bytes', 'skipped_laps'}.
+    Raises ValueError for unusable files, DatabaseError if storing fails.
+    """
+    lap_ids = database.get_lap_ids(session_id)
+    if not lap_ids:
+        raise ValueError(f"Session {session_id} has no saved laps.")
+    stats = {'laps': 0, 'samples': 0, 'channels': 0, 'raw_bytes': 0, 'stored_bytes': 0, 'skipped_laps': []}
+
+    def records():
+        # Consumed lazily by executemany, so only one lap is decoded and encoded at a time
+        for lap_number, columns in read_laps_csv(path, chunk_rows):
+            lap_id = lap_ids.get(lap_number + lap_offset)
+            if lap_id is None:
+                stats['skipped_laps'].append(lap_number)
+                continue
+            with diagnostics.stage('telemetry.encode_lap'):
+                encoded = [(name, values.nbytes, encode_channel(values)) for name, values in columns.items()]
+            stats['laps'] += 1
+            stats['samples'] += len(next(iter(columns.values()), ()))
+            for name, raw_bytes, channel in encoded:
+                stats['channels'] += 1
+                stats['raw_bytes'] += raw_bytes
+                stats['stored_bytes'] += len(channel[-1])
+                yield (lap_id, name) + channel
+
+    with diagnostics.stage('telemetry.ingest_csv'):
+        database.save_telemetry(records())
+    return stats
+
+# --- Reading ---
+
+def load_lap(lap_id, channels=None):
+    """Decodes a lap's channels (all, or the names given) into {channel: ndarray}."""
+    result = {}
+    for channel, dtype, sample_count, codec, checksum in database.get_telemetry_index(lap_id, channels):
+        data = database.get_telemetry_data(lap_id, channel)
+        result[channel] = decode_channel(dtype, sample_count, codec, checksum, data)
+    return result
+
+def _cache_directory(cache_dir):
+    # Lap ids are per database file, so every database gets its own cache
+    key = hashlib.sha1(os.path.abspath(database.DB_NAME).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir or TELEMETRY_CACHE_DIR, key)
+
+def open_lap(lap_id, channels=None, cache_dir=None, max_bytes=None):
+    """
+    Returns a lap's channels as read-only memory-mapped arrays ({channel: np.memmap}).
+    A channel is decoded from the database only the first time; after that it is mapped straight
+    from its .npy file in the cache (no copy, no decompression). Cache files are named after the
+    data's checksum, so replaced telemetry never maps stale samples. After a miss the cache is
+    pruned (see prune_cache) down to max_bytes, default TELEMETRY_CACHE_MAX_BYTES.
+    """
+    directory = _cache_directory(cache_dir)
+    _cache_roots.add(cache_dir or TELEMETRY_CACHE_DIR)
+    result = {}
+    paths = set()
+    missed = False
+    for channel, dtype, sample_count, codec, checksum in database.get_telemetry_index(lap_id, channels):
+        path = os.path.join(directory, f"{lap_id}-{channel}-{checksum:08x}.npy")
+        if os.path.exists(path):
+            os.utime(path) # Recently used, so it is evicted last
+        else:
+            values = decode_channel(dtype, sample_count, codec, checksum, database.get_telemetry_data(lap_id, channel))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                np.save(f, values)
+            os.replace(temp_path, path) # Atomic, so concurrent readers never map a partial file
+            diagnostics.count('telemetry.cache_misses')
+            missed = True
+        result[channel] = np.load(path, mmap_mode='r')
+        paths.add(path)
+    if missed:
+        _prune(directory, TELEMETRY_CACHE_MAX_BYTES if max_bytes is None else max_bytes, keep=paths)
+    return result
+
+# --- Cache Maintenance ---
+
+# Cache roots open_lap has used in this process; pruned again whenever sessions are deleted
+_cache_roots = set()
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False # Removed by another process, or still mapped (Windows)
+
+def _prune(directory, max_bytes, keep=()):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    files = []
+    for name in names:
+        match = CACHE_FILE_PATTERN.match(name)
+        if not match:
+            continue # Temporary files of a write in progress
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path, (int(match[1]), match[2], int(match[3], 16))))
+
+    stored = database.get_telemetry_checksums({key[0] for _, _, _, key in files})
+    removed = 0
+    kept = []
+    for mtime, size, path, key in files:
+        if key in stored:
+            kept.append((mtime, size, path))
+        elif _remove(path): # Deleted lap, or telemetry replaced since
+            removed += 1
+    total = sum(size for _, size, _ in kept)
+    for mtime, size, path in sorted(kept):
+        if total <= max_bytes:
+            break
+        if path not in keep and _remove(path):
+            total -= size
+            removed += 1
+    if removed:
+        diagnostics.count('telemetry.cache_files_pruned', removed)
+    return removed
+
+def prune_cache(cache_dir=None, max_bytes=None):
+    """
+    Deletes the cache files of laps (or channels) no longer stored in the current database, then the
+    least recently opened ones until the rest fit in max_bytes. Returns the number of files removed.
+    """
+    return _prune(_cache_directory(cache_dir), TELEMETRY_CACHE_MAX_BYTES if max_bytes is None else max_bytes)
+
+def _on_database_change():
+    # Deleted sessions take their laps' telemetry with them (ON DELETE CASCADE); so do their cache files
+    for cache_dir in list(_cache_roots):
+        prune_cache(cache_dir)
+
+database.add_change_listener(_on_database_change)
+
+def clear_cache(cache_dir=None):
+    """Deletes the memory-map cache of the current database. Returns the number of files removed."""
+    directory = _cache_directory(cache_dir)
+    removed = 0
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+            removed += 1
+    return removed
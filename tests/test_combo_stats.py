@@ -0,0 +1,76 @@
+"""combo_stats maintained incrementally across saves and deletes equals a full rebuild."""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import synthetic_results
+from analysis import analyze_ac_session
+
+class ComboStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        database.DB_NAME = os.path.join(self.directory, 'sim_data.db')
+        database.setup_database()
+        # Few combos, so saves and deletes keep landing on the same aggregates
+        self.paths = []
+        for i, track in enumerate(('magione', 'ks_brands_hatch-indy')):
+            self.paths += synthetic_results.write_results(
+                os.path.join(self.directory, track), 8, seed=100 * i, car='ks_mazda_mx5_cup', track=track,
+                laps_per_player=5, cut_rate=0.3
+            )
+
+    def tearDown(self):
+        database.close_connections()
+        shutil.rmtree(self.directory)
+
+    def save(self, path):
+        """Saves a results file through the incremental path. Returns the new session id."""
+        database.save_session_data(analyze_ac_session(path))
+        return database.get_connection().execute("SELECT MAX(id) FROM sessions").fetchone()[0]
+
+    def assertMatchesRebuild(self):
+        conn = database.get_connection()
+        sql = "SELECT * FROM combo_stats ORDER BY car_model, track_name"
+        stored = conn.execute(sql).fetchall()
+        cursor = conn.cursor()
+        database._rebuild_combo_stats(cursor)
+        rebuilt = cursor.execute(sql).fetchall()
+        conn.rollback()
+        self.assertEqual(stored, rebuilt)
+
+    def test_mixed_saves_and_deletes(self):
+        rng = random.Random(7)
+        saved = []
+        for path in rng.sample(self.paths, len(self.paths)):
+            saved.append(self.save(path))
+            self.assertMatchesRebuild()
+            if len(saved) >= 3 and rng.random() < 0.4:
+                session_id = saved.pop(rng.randrange(len(saved)))
+                database.delete_session_by_id(session_id)
+                self.assertMatchesRebuild()
+
+        combos = [(row[0], row[1]) for row in database.get_all_combo_stats()]
+        self.assertEqual(len(combos), 2)
+        for combo in combos:
+            # Deleting the session that holds the combo's best lap forces a recompute
+            best = database.get_combo_stats(*combo)['best_lap_session_id']
+            database.delete_sessions([best], reclaim=False)
+            saved.remove(best)
+            self.assertMatchesRebuild()
+            self.assertNotEqual(database.get_combo_stats(*combo)['best_lap_session_id'], best)
+
+        # A batch across both combos, then everything that is left
+        database.delete_sessions(saved[:3], reclaim=False)
+        self.assertMatchesRebuild()
+        database.delete_sessions(saved[3:], reclaim=False)
+        self.assertMatchesRebuild()
+        self.assertEqual(database.get_all_combo_stats(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Round trip of export_laps: every format is written from a small database and read back."""
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli
+import database
+import synthetic_results
+from database import EXPORT_COLUMNS
+from export import ExportError, export_laps, pa
+
+class ExportRoundTripTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.db_name = os.path.join(cls.directory, 'sim_data.db')
+        synthetic_results.write_results(os.path.join(cls.directory, 'results'), 3, laps_per_player=5, cut_rate=0.3)
+        cli.main(['--db', cls.db_name, 'import', os.path.join(cls.directory, 'results')])
+
+    @classmethod
+    def tearDownClass(cls):
+        database.close_connections()
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        database.DB_NAME = self.db_name
+        self.expected = [row for chunk in database.iter_laps_for_export() for row in chunk]
+        self.assertTrue(self.expected)
+
+    def export(self, name):
+        path = os.path.join(self.directory, name)
+        self.assertEqual(export_laps(path), len(self.expected))
+        return path
+
+    def test_csv(self):
+        with open(self.export('laps.csv'), newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(tuple(rows[0]), EXPORT_COLUMNS)
+        self.assertEqual(len(rows) - 1, len(self.expected))
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(self.export('laps.parquet'))
+        self.assertEqual(table.column_names, list(EXPORT_COLUMNS))
+        self.assertEqual(table.num_rows, len(self.expected))
+        self.assertEqual(table.column('is_valid').to_pylist(), [bool(row[-1]) for row in self.expected])
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_arrow(self):
+        import pyarrow.ipc
+        with pyarrow.ipc.open_file(self.export('laps.arrow')) as reader:
+            table = reader.read_all()
+        self.assertEqual(table.num_rows, len(self.expected))
+        self.assertEqual(table.column('lap_time').to_pylist(), [row[5] for row in self.expected])
+
+    def test_filtered_rows_match_sessions(self):
+        car = self.expected[0][1]
+        rows = [row for chunk in database.iter_laps_for_export(car_filter=car) for row in chunk]
+        self.assertEqual({row[1] for row in rows}, {car})
+        session_ids = {session[0] for session in database.get_sessions(car_filter=car)}
+        self.assertEqual({row[0] for row in rows}, session_ids)
+
+    def test_failed_export_removes_file(self):
+        path = os.path.join(self.directory, 'failed.csv')
+        def fail(rows):
+            raise OSError("disk full")
+        with self.assertRaises(ExportError):
+            export_laps(path, progress_callback=fail)
+        self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""merge_database: rig databases merged into one, without duplicates, with consistent combo_stats."""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli
+import database
+import synthetic_results
+import telemetry
+
+def table_counts():
+    conn = database.get_connection()
+    return tuple(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ('sessions', 'laps', 'telemetry'))
+
+def combo_stats_and_rebuilt():
+    """The stored combo_stats rows, and the rows _rebuild_combo_stats computes from the sessions."""
+    conn = database.get_connection()
+    sql = "SELECT * FROM combo_stats ORDER BY car_model, track_name"
+    stored = conn.execute(sql).fetchall()
+    cursor = conn.cursor()
+    database._rebuild_combo_stats(cursor)
+    rebuilt = cursor.execute(sql).fetchall()
+    conn.rollback()
+    return stored, rebuilt
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.rigs = [self.make_rig('rig_a', seed=0, telemetry_session=True), self.make_rig('rig_b', seed=100)]
+        database.DB_NAME = os.path.join(self.directory, 'sim_data.db')
+        database.setup_database()
+
+    def tearDown(self):
+        database.close_connections()
+        shutil.rmtree(self.directory)
+
+    def make_rig(self, name, seed, telemetry_session=False):
+        """Imports synthetic results into a rig database. Returns (path, (sessions, laps, telemetry))."""
+        path = os.path.join(self.directory, f'{name}.db')
+        results = os.path.join(self.directory, name)
+        synthetic_results.write_results(results, 4, seed=seed, laps_per_player=6, cut_rate=0.2)
+        cli.main(['--db', path, 'import', results])
+        database.DB_NAME = path
+        if telemetry_session:
+            session_id = database.get_sessions()[0][0]
+            lap_times = [lap[1] for lap in database.get_laps_for_session(session_id)]
+            csv_path = os.path.join(self.directory, f'{name}.csv')
+            synthetic_results.write_telemetry_csv(csv_path, lap_times, rate_hz=10)
+            telemetry.ingest_telemetry_csv(session_id, csv_path)
+        counts = table_counts()
+        database.close_connections()
+        return path, counts
+
+    def assertCombosConsistent(self):
+        stored, rebuilt = combo_stats_and_rebuilt()
+        self.assertTrue(stored)
+        self.assertEqual(stored, rebuilt)
+
+    def test_merge_two_rigs(self):
+        for path, counts in self.rigs:
+            stats = database.merge_database(path)
+            self.assertEqual((stats['sessions'], stats['laps'], stats['telemetry']), counts)
+            self.assertEqual(stats['duplicates'], 0)
+        expected = tuple(map(sum, zip(*(counts for _, counts in self.rigs))))
+        self.assertEqual(table_counts(), expected)
+        self.assertGreater(expected[2], 0)
+        self.assertEqual(sum(row[2] for row in database.get_all_combo_stats()), expected[0])
+        self.assertCombosConsistent()
+
+    def test_merging_again_adds_nothing(self):
+        for path, _ in self.rigs:
+            database.merge_database(path)
+        counts = table_counts()
+        for path, (sessions, _, _) in self.rigs:
+            self.assertEqual(database.merge_database(path)['sessions'], 0) # Watermark
+            stats = database.merge_database(path, full=True) # Content dedup
+            self.assertEqual((stats['sessions'], stats['duplicates']), (0, sessions))
+        self.assertEqual(table_counts(), counts)
+        self.assertCombosConsistent()
+
+    def test_legacy_source_without_hashes(self):
+        # The oldest layout: no content_hash, no sector_3 and none of the later tables
+        path = os.path.join(self.directory, 'legacy.db')
+        with sqlite3.connect(path) as conn:
+            conn.execute("""CREATE TABLE sessions (id INTEGER PRIMARY KEY, car_model TEXT NOT NULL, track_name TEXT NOT NULL,
+                            date_time TEXT NOT NULL, best_lap_time REAL, theoretical_lap_time REAL)""")
+            conn.execute("""CREATE TABLE laps (id INTEGER PRIMARY KEY, session_id INTEGER, lap_number INTEGER NOT NULL,
+                            lap_time REAL NOT NULL, sector_1 REAL, sector_2 REAL, cuts INTEGER, is_valid INTEGER)""")
+            for session_id, date_time in ((1, '2023-05-01 10:00:00'), (2, '2023-05-02 18:30:00')):
+                conn.execute("INSERT INTO sessions VALUES (?, 'legacy_car', 'legacy_track', ?, 91000, 90500)",
+                             (session_id, date_time))
+                conn.executemany("INSERT INTO laps (session_id, lap_number, lap_time, sector_1, sector_2, cuts, is_valid) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(session_id, 1, 91000, 45000, 46000, 0, 1), (session_id, 2, 93000, 45500, 47500, 1, 0)])
+        conn.close()
+
+        database.merge_database(self.rigs[0][0])
+        stats = database.merge_database(path)
+        self.assertEqual((stats['sessions'], stats['laps'], stats['duplicates']), (2, 4, 0))
+        self.assertEqual(database.merge_database(path, full=True)['duplicates'], 2) # Matched by car/track/date/best lap
+        self.assertEqual(table_counts(), tuple(a + b for a, b in zip(self.rigs[0][1], (2, 4, 0))))
+
+        combo = database.get_combo_stats('legacy_car', 'legacy_track')
+        self.assertEqual((combo['session_count'], combo['lap_count'], combo['valid_lap_count']), (2, 4, 2))
+        self.assertIsNone(combo['best_sector_3'])
+        self.assertCombosConsistent()
+
+if __name__ == '__main__':
+    unittest.main()
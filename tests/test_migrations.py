@@ -0,0 +1,100 @@
+"""setup_database on a file from before the migrations: schema up to date, no session data lost."""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+SESSIONS = [
+    (1, 'ks_mazda_mx5_cup', 'magione', '2023-03-04 10:15:00', 74500, 74100),
+    (2, 'ks_mazda_mx5_cup', 'magione', '2023-03-05 18:00:00', 74200, 74000),
+    (3, 'bmw_m3_e30', 'ks_monza', '2023-04-01T09:30:00', 118900, None),
+]
+LAPS = [
+    # (id, session_id, lap_number, lap_time, sector_1, sector_2, cuts, is_valid)
+    (1, 1, 1, 76000, 37000, 39000, 0, 1),
+    (2, 1, 2, 74500, 36500, 38000, 0, 1),
+    (3, 2, 1, 74200, 36000, 38200, 1, 0),
+    (4, 2, 2, 74900, 36400, 38500, 0, 1),
+    (5, 3, 1, 118900, 58000, 60900, 0, 1),
+    (6, 9, 1, 80000, 40000, 40000, 0, 1), # Orphans: their session was deleted before cascades existed
+    (7, 9, 2, 81000, 40500, 40500, 0, 1),
+]
+ORPHAN_LAP_IDS = {6, 7}
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        database.DB_NAME = os.path.join(self.directory, 'sim_data.db')
+        # The original layout: no content_hash, laps without sector_3 and without a cascade
+        with sqlite3.connect(database.DB_NAME) as conn:
+            conn.execute("""
+                CREATE TABLE sessions (
+                    id INTEGER PRIMARY KEY, car_model TEXT NOT NULL, track_name TEXT NOT NULL,
+                    date_time TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now')),
+                    best_lap_time REAL, theoretical_lap_time REAL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE laps (
+                    id INTEGER PRIMARY KEY, session_id INTEGER, lap_number INTEGER NOT NULL, lap_time REAL NOT NULL,
+                    sector_1 REAL, sector_2 REAL, cuts INTEGER, is_valid INTEGER,
+                    FOREIGN KEY (session_id) REFERENCES sessions (id)
+                )
+            """)
+            conn.executemany("INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?)", SESSIONS)
+            conn.executemany("INSERT INTO laps VALUES (?, ?, ?, ?, ?, ?, ?, ?)", LAPS)
+        conn.close()
+
+    def tearDown(self):
+        database.close_connections()
+        shutil.rmtree(self.directory)
+
+    def test_upgrade(self):
+        database.setup_database()
+        conn = database.get_connection()
+        self.assertEqual(database.get_schema_version(conn), database.SCHEMA_VERSION)
+
+        self.assertEqual(
+            conn.execute("SELECT id, car_model, track_name, date_time, best_lap_time, theoretical_lap_time "
+                         "FROM sessions ORDER BY id").fetchall(),
+            SESSIONS
+        )
+        self.assertEqual(
+            conn.execute("SELECT id, session_id, lap_number, lap_time, sector_1, sector_2, cuts, is_valid "
+                         "FROM laps ORDER BY id").fetchall(),
+            [lap for lap in LAPS if lap[0] not in ORPHAN_LAP_IDS]
+        )
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM laps WHERE sector_3 IS NOT NULL").fetchone()[0], 0)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM sessions WHERE content_hash IS NOT NULL").fetchone()[0], 0)
+        self.assertEqual(conn.execute("PRAGMA foreign_key_check").fetchall(), [])
+        # started_at is derived from date_time in both the space and the 'T' form
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM sessions WHERE started_at = 0").fetchone()[0], 0)
+
+        combo = database.get_combo_stats('ks_mazda_mx5_cup', 'magione')
+        self.assertEqual((combo['session_count'], combo['lap_count'], combo['valid_lap_count']), (2, 4, 3))
+        self.assertEqual((combo['best_lap_time'], combo['best_lap_session_id']), (74500, 1)) # 74200 was invalid
+
+    def test_cascade(self):
+        database.setup_database()
+        database.delete_sessions([1], reclaim=False)
+        conn = database.get_connection()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM laps WHERE session_id = 1").fetchone()[0], 0)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM laps").fetchone()[0], 3)
+        self.assertEqual(database.get_combo_stats('ks_mazda_mx5_cup', 'magione')['session_count'], 1)
+
+    def test_setup_is_idempotent(self):
+        database.setup_database()
+        database.close_connections()
+        database.setup_database()
+        conn = database.get_connection()
+        self.assertEqual(database.get_schema_version(conn), database.SCHEMA_VERSION)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM laps").fetchone()[0], len(LAPS) - len(ORPHAN_LAP_IDS))
+
+if __name__ == '__main__':
+    unittest.main()
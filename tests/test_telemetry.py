@@ -0,0 +1,97 @@
+"""Channel encoding and the memory-map cache of telemetry.py."""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli
+import database
+import synthetic_results
+import telemetry
+from telemetry import decode_channel, encode_channel
+
+class EncodingTest(unittest.TestCase):
+    def test_round_trip(self):
+        for values in (np.linspace(0, 300, 1001, dtype=np.float32), np.arange(5000, dtype=np.float64) / 7,
+                       np.array([], dtype=np.float32)):
+            dtype, sample_count, codec, checksum, data = encode_channel(values)
+            decoded = decode_channel(dtype, sample_count, codec, checksum, data)
+            self.assertEqual(decoded.dtype, values.dtype)
+            np.testing.assert_array_equal(decoded, values)
+
+    def test_raw_codec(self):
+        values = np.arange(10, dtype=np.float32)
+        dtype, sample_count, _, checksum, _ = encode_channel(values)
+        np.testing.assert_array_equal(decode_channel(dtype, sample_count, 'raw', checksum, values.tobytes()), values)
+
+    def test_checksum_mismatch(self):
+        dtype, sample_count, codec, checksum, data = encode_channel(np.linspace(0, 1, 100, dtype=np.float32))
+        with self.assertRaisesRegex(ValueError, "checksum"):
+            decode_channel(dtype, sample_count, codec, checksum ^ 1, data)
+
+    def test_unknown_codec(self):
+        dtype, sample_count, _, checksum, data = encode_channel(np.zeros(4, dtype=np.float32))
+        with self.assertRaisesRegex(ValueError, "codec"):
+            decode_channel(dtype, sample_count, 'lz4', checksum, data)
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        synthetic_results.write_results(os.path.join(self.directory, 'results'), 2, laps_per_player=4, cut_rate=0)
+        cli.main(['--db', os.path.join(self.directory, 'sim_data.db'), 'import', os.path.join(self.directory, 'results')])
+        self.session_ids = [session[0] for session in database.get_sessions()]
+        self.lap_ids = []
+        for session_id in self.session_ids:
+            lap_ids = database.get_lap_ids(session_id)
+            self.lap_ids.append(lap_ids[min(lap_ids)])
+            path = os.path.join(self.directory, f'{session_id}.csv')
+            with open(path, 'w') as f:
+                f.write("lap,time,speed,throttle\n")
+                for i in range(2000):
+                    f.write(f"{min(lap_ids)},{i / 100},{i % 250},{(i % 100) / 100}\n")
+            telemetry.ingest_telemetry_csv(session_id, path)
+
+    def tearDown(self):
+        database.close_connections()
+        telemetry._cache_roots.discard(self.cache_dir)
+        shutil.rmtree(self.directory)
+
+    def cached_files(self):
+        directory = telemetry._cache_directory(self.cache_dir)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def test_open_lap_maps_decoded_channels(self):
+        channels = telemetry.open_lap(self.lap_ids[0], cache_dir=self.cache_dir)
+        self.assertEqual(sorted(channels), ['speed', 'throttle', 'time'])
+        np.testing.assert_array_equal(channels['speed'], telemetry.load_lap(self.lap_ids[0])['speed'])
+        self.assertEqual(len(self.cached_files()), 3)
+
+    def test_deleting_a_session_prunes_its_files(self):
+        telemetry.open_lap(self.lap_ids[0], cache_dir=self.cache_dir)
+        telemetry.open_lap(self.lap_ids[1], cache_dir=self.cache_dir)
+        self.assertEqual(len(self.cached_files()), 6)
+        database.delete_sessions([self.session_ids[0]], reclaim=False)
+        files = self.cached_files()
+        self.assertEqual(len(files), 3)
+        self.assertTrue(all(name.startswith(f"{self.lap_ids[1]}-") for name in files))
+
+    def test_cap_evicts_oldest_files(self):
+        telemetry.open_lap(self.lap_ids[0], cache_dir=self.cache_dir)
+        directory = telemetry._cache_directory(self.cache_dir)
+        for name in self.cached_files():
+            os.utime(os.path.join(directory, name), (1, 1))
+        first_lap_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in self.cached_files())
+
+        telemetry.open_lap(self.lap_ids[1], cache_dir=self.cache_dir, max_bytes=first_lap_bytes)
+        files = self.cached_files()
+        self.assertEqual(len(files), 3)
+        self.assertTrue(all(name.startswith(f"{self.lap_ids[1]}-") for name in files))
+
+if __name__ == '__main__':
+    unittest.main()
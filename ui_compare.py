@@ -0,0 +1,142 @@
+import tkinter as tk
+from tkinter import messagebox, ttk
+
+# Import functions from other modules
+import diagnostics
+from analysis import format_ms_to_time
+from comparison import METRICS, METRIC_LABELS, compare_bests, compare_laps, lap_cache
+from tasks import TaskRunner
+
+MAX_COMPARE_SESSIONS = 8
+
+def format_time_delta(value, delta, reference=False):
+    """'1:17.276 (+0.512)'; the reference column and missing deltas show the time only."""
+    if value is None or value < 0:
+        return ""
+    if reference or delta is None:
+        return format_ms_to_time(value)
+    return f"{format_ms_to_time(value)} ({delta / 1000:+.3f})"
+
+class ComparisonWindow:
+    """
+    Compares the laps of several sessions (same car and track) against a reference session.
+    sessions: [(session_id, car, track, date)] as shown in the viewer's session list.
+    """
+    def __init__(self, master, sessions):
+        self.sessions = sessions
+        self.laps = {}  # session id -> SessionLaps, filled from the shared lap cache
+        self.reference = tk.StringVar()
+        self.metric = tk.StringVar(value=METRIC_LABELS['lap_time'])
+
+        self.window = tk.Toplevel(master)
+        car, track = sessions[0][1], sessions[0][2]
+        self.window.title(f"Compare Sessions - {car} @ {track}")
+        self.window.geometry("950x550")
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(0, weight=1)
+        self.tasks = TaskRunner(self.window, max_workers=1)
+
+        self.main_frame = ttk.Frame(self.window, padding="10")
+        self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.main_frame.columnconfigure(0, weight=1)
+        self.main_frame.rowconfigure(4, weight=1)
+
+        # --- Controls ---
+        controls = ttk.Frame(self.main_frame)
+        controls.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
+        tk.Label(controls, text=f"{car} @ {track}", font=('Arial', 14, 'bold')).pack(side=tk.LEFT)
+        ttk.Label(controls, text="Reference:").pack(side=tk.LEFT, padx=(20, 5))
+        reference_combobox = ttk.Combobox(
+            controls, textvariable=self.reference, state='readonly', width=28,
+            values=[self.session_label(session) for session in sessions]
+        )
+        reference_combobox.pack(side=tk.LEFT, padx=5)
+        reference_combobox.bind('<<ComboboxSelected>>', lambda event: self.redraw())
+        ttk.Label(controls, text="Compare:").pack(side=tk.LEFT, padx=(20, 5))
+        metric_combobox = ttk.Combobox(
+            controls, textvariable=self.metric, state='readonly', width=10,
+            values=[METRIC_LABELS[metric] for metric in METRICS]
+        )
+        metric_combobox.pack(side=tk.LEFT, padx=5)
+        metric_combobox.bind('<<ComboboxSelected>>', lambda event: self.redraw())
+        self.reference.set(self.session_label(sessions[0]))
+
+        # --- Bests (one row per session) ---
+        tk.Label(self.main_frame, text="Bests vs. Reference:", font=('Arial', 10, 'bold'), anchor='w').grid(
+            row=1, column=0, sticky=tk.W)
+        summary_cols = ('Session', 'Laps', 'Best Lap', 'S1', 'S2', 'S3', 'Theoretical')
+        self.summary_tree = ttk.Treeview(self.main_frame, columns=summary_cols, show='headings', height=min(len(sessions), MAX_COMPARE_SESSIONS))
+        for col in summary_cols:
+            self.summary_tree.heading(col, text=col)
+            self.summary_tree.column(col, width=125, anchor=tk.CENTER)
+        self.summary_tree.column('Session', width=190, anchor=tk.W)
+        self.summary_tree.column('Laps', width=60)
+        self.summary_tree.grid(row=2, column=0, sticky=(tk.W, tk.E))
+
+        # --- Lap by lap (one column per session) ---
+        tk.Label(self.main_frame, text="Lap by Lap (* = invalid lap):", font=('Arial', 10, 'bold'), anchor='w').grid(
+            row=3, column=0, sticky=tk.W, pady=(10, 0))
+        self.lap_tree = ttk.Treeview(self.main_frame, show='headings')
+        self.lap_tree.grid(row=4, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+        lap_scroll = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.lap_tree.yview)
+        lap_scroll.grid(row=4, column=1, sticky=(tk.N, tk.S))
+        lap_xscroll = ttk.Scrollbar(self.main_frame, orient=tk.HORIZONTAL, command=self.lap_tree.xview)
+        lap_xscroll.grid(row=5, column=0, sticky=(tk.W, tk.E))
+        self.lap_tree.configure(yscrollcommand=lap_scroll.set, xscrollcommand=lap_xscroll.set)
+
+        self.load_laps()
+
+    @staticmethod
+    def session_label(session):
+        session_id, _, _, date = session
+        return f"#{session_id}  {date}"
+
+    def load_laps(self):
+        """Reads the lap arrays from the shared cache; only uncached sessions hit the database."""
+        session_ids = [session[0] for session in self.sessions]
+        self.tasks.submit(
+            'laps', lap_cache.get_many, session_ids,
+            on_done=self.on_laps_loaded,
+            on_error=lambda e: messagebox.showerror("Database Error", str(e), parent=self.window)
+        )
+
+    def on_laps_loaded(self, laps):
+        self.laps = laps
+        self.redraw()
+
+    def redraw(self):
+        """Recomputes both tables from the cached arrays (no database access)."""
+        if not self.laps:
+            return
+        labels = [self.session_label(session) for session in self.sessions]
+        reference_index = labels.index(self.reference.get())
+        metric = next(m for m in METRICS if METRIC_LABELS[m] == self.metric.get())
+        sessions = [self.laps[session[0]] for session in self.sessions]
+        reference = sessions[reference_index]
+
+        with diagnostics.stage('comparison.redraw', sessions=len(sessions)):
+            self.summary_tree.delete(*self.summary_tree.get_children())
+            for index, (label, entry) in enumerate(zip(labels, compare_bests(reference, sessions))):
+                is_reference = index == reference_index
+                self.summary_tree.insert('', tk.END, values=(
+                    label + ("  (ref)" if is_reference else ""),
+                    f"{entry['valid_laps']}/{entry['laps']}",
+                    *(format_time_delta(*entry[key], reference=is_reference)
+                      for key in ('lap_time', 'sector_1', 'sector_2', 'sector_3', 'theoretical'))
+                ))
+
+            columns = ['Lap'] + [f"s{index}" for index in range(len(sessions))]
+            self.lap_tree.delete(*self.lap_tree.get_children())
+            self.lap_tree['columns'] = columns
+            self.lap_tree.heading('Lap', text='Lap #')
+            self.lap_tree.column('Lap', width=50, minwidth=50, stretch=False, anchor=tk.CENTER)
+            for index, label in enumerate(labels):
+                self.lap_tree.heading(f"s{index}", text=label + (" (ref)" if index == reference_index else ""))
+                self.lap_tree.column(f"s{index}", width=150, minwidth=150, stretch=False, anchor=tk.CENTER)
+
+            for lap_number, *cells in compare_laps(reference, sessions, metric):
+                values = [lap_number]
+                for index, (value, delta, valid) in enumerate(cells):
+                    text = format_time_delta(value, delta, reference=index == reference_index)
+                    values.append(text + " *" if text and not valid else text)
+                self.lap_tree.insert('', tk.END, values=values)
@@ -0,0 +1,156 @@
+import tkinter as tk
+from tkinter import filedialog, ttk
+
+# Import functions from other modules
+import diagnostics
+
+REFRESH_MS = 1000 # Live refresh interval while the screen is open
+
+class DiagnosticsViewer:
+    """Shows the per-stage timings and counters collected by the diagnostics module."""
+    def __init__(self, master, back_command):
+        self.master = master
+        self.back_command = back_command
+        self.profile_stage = tk.StringVar()
+
+        self.main_frame = ttk.Frame(master, padding="10")
+        self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.main_frame.columnconfigure(0, weight=1)
+        self.main_frame.rowconfigure(2, weight=1)
+        self.main_frame.rowconfigure(4, weight=1)
+
+        # --- Header ---
+        header_frame = ttk.Frame(self.main_frame)
+        header_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
+        tk.Label(header_frame, text="Diagnostics", font=('Arial', 18, 'bold')).pack(side=tk.LEFT)
+        ttk.Button(header_frame, text="< Back to Main Menu", command=self.back_command).pack(side=tk.RIGHT)
+
+        # --- Controls ---
+        controls = ttk.Frame(self.main_frame)
+        controls.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        ttk.Button(controls, text="Reset", command=self.reset).pack(side=tk.LEFT, padx=5)
+        self.jsonl_button = ttk.Button(controls, text="", command=self.toggle_jsonl)
+        self.jsonl_button.pack(side=tk.LEFT, padx=5)
+        ttk.Label(controls, text="Profile next run of:").pack(side=tk.LEFT, padx=(20, 5))
+        self.profile_combobox = ttk.Combobox(controls, textvariable=self.profile_stage, width=30)
+        self.profile_combobox.pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Arm cProfile", command=self.arm_profile).pack(side=tk.LEFT, padx=5)
+        self.status_label = tk.Label(controls, text="", fg='gray')
+        self.status_label.pack(side=tk.RIGHT)
+
+        # --- Stage timings ---
+        stage_cols = ('Stage', 'Count', 'Total', 'Mean', 'p50', 'p95', 'Min', 'Max')
+        self.stage_tree = ttk.Treeview(self.main_frame, columns=stage_cols, show='headings', height=10)
+        for col in stage_cols:
+            self.stage_tree.heading(col, text=col if col in ('Stage', 'Count') else f"{col} (ms)")
+            self.stage_tree.column(col, width=90, anchor=tk.E)
+        self.stage_tree.column('Stage', width=220, anchor=tk.W)
+        self.stage_tree.grid(row=2, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+        stage_scroll = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.stage_tree.yview)
+        self.stage_tree.configure(yscrollcommand=stage_scroll.set)
+        stage_scroll.grid(row=2, column=1, sticky=(tk.N, tk.S))
+        self.stage_tree.bind('<<TreeviewSelect>>', lambda event: self.show_details())
+
+        # --- Histogram / counters / profile output ---
+        tk.Label(self.main_frame, text="Histogram, Counters & Last Profile:", font=('Arial', 10, 'bold'), anchor='w').grid(
+            row=3, column=0, sticky=tk.W, pady=(10, 0))
+        self.detail_text = tk.Text(self.main_frame, wrap=tk.NONE, height=12, bg="#EAEAEA", font=('Courier', 9))
+        self.detail_text.grid(row=4, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+        detail_scroll = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.detail_text.yview)
+        self.detail_text.configure(yscrollcommand=detail_scroll.set)
+        detail_scroll.grid(row=4, column=1, sticky=(tk.N, tk.S))
+
+        self._stages = {}
+        self._counters = {}
+        self.refresh()
+
+    def refresh(self):
+        """Redraws the screen and re-schedules itself while the screen exists."""
+        if not self.main_frame.winfo_exists():
+            return
+        self.redraw()
+        self.main_frame.after(REFRESH_MS, self.refresh)
+
+    def redraw(self):
+        """Redraws the tables from a fresh snapshot, keeping the selected stage selected."""
+        self._stages, self._counters = diagnostics.snapshot()
+
+        selected = self.stage_tree.selection()
+        selected_name = self.stage_tree.item(selected[0], 'values')[0] if selected else None
+        self.stage_tree.delete(*self.stage_tree.get_children())
+        for name in sorted(self._stages):
+            s = self._stages[name]
+            item = self.stage_tree.insert('', tk.END, values=(
+                name, s['count'], f"{s['total_ms']:.1f}", f"{s['mean_ms']:.3f}", f"{s['p50_ms']:g}",
+                f"{s['p95_ms']:g}", f"{s['min_ms']:.3f}", f"{s['max_ms']:.3f}"
+            ))
+            if name == selected_name:
+                self.stage_tree.selection_set(item)
+
+        self.profile_combobox['values'] = tuple(sorted(self._stages))
+        path = diagnostics.jsonl_path()
+        armed = diagnostics.pending_profiles()
+        self.jsonl_button.config(text="Stop JSON Lines" if path else "Write JSON Lines...")
+        status = [f"Logging to {path}"] if path else []
+        if armed:
+            status.append("cProfile armed: " + ", ".join(armed))
+        self.status_label.config(text="  |  ".join(status))
+        self.show_details()
+
+    def show_details(self):
+        lines = []
+        selected = self.stage_tree.selection()
+        if selected:
+            name = self.stage_tree.item(selected[0], 'values')[0]
+            stats = self._stages.get(name)
+            if stats:
+                lines.append(f"{name}: {stats['count']} run(s)")
+                peak = max(stats['buckets']) or 1
+                lower = 0
+                for edge, count in zip(diagnostics.BUCKET_EDGES_MS + (None,), stats['buckets']):
+                    label = f"{lower:g}-{edge:g} ms" if edge is not None else f">{lower:g} ms"
+                    lines.append(f"  {label:>16} | {'#' * round(40 * count / peak):<40} {count}")
+                    lower = edge
+                lines.append("")
+
+        lines.append("Counters:")
+        for name in sorted(self._counters):
+            lines.append(f"  {name}: {self._counters[name]}")
+        if not self._counters:
+            lines.append("  (none)")
+
+        if diagnostics.last_profile:
+            name, text = diagnostics.last_profile
+            lines += ["", f"cProfile of {name}:", text]
+
+        # Keep the user's scroll position across live refreshes
+        position = self.detail_text.yview()[0]
+        self.detail_text.config(state=tk.NORMAL)
+        self.detail_text.delete('1.0', tk.END)
+        self.detail_text.insert(tk.END, "\n".join(lines))
+        self.detail_text.config(state=tk.DISABLED)
+        self.detail_text.yview_moveto(position)
+
+    def reset(self):
+        diagnostics.reset()
+        self.redraw()
+
+    def toggle_jsonl(self):
+        if diagnostics.jsonl_path():
+            diagnostics.stop_jsonl()
+        else:
+            path = filedialog.asksaveasfilename(
+                title="Write Timings as JSON Lines",
+                defaultextension=".jsonl",
+                filetypes=[("JSON Lines", "*.jsonl"), ("All Files", "*.*")]
+            )
+            if not path:
+                return
+            diagnostics.start_jsonl(path)
+        self.redraw()
+
+    def arm_profile(self):
+        name = self.profile_stage.get().strip()
+        if name:
+            diagnostics.profile_next(name)
+            self.redraw()
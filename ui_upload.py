@@ -1,11 +1,25 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
-from tkinterdnd2 import DND_FILES
 
 # Import functions from other modules
 from analysis import analyze_ac_session
-from database import save_session_data
+from database import save_session_data, DatabaseError, DuplicateSessionError
+from bulk_import import find_result_files, import_files
+from tasks import TaskRunner, BusyIndicator
+
+def enable_drag_and_drop(root):
+    """
+    Loads the tkdnd Tcl package into root on first use (the app starts with a plain tk.Tk,
+    so the main menu does not wait for it). Returns False if tkinterdnd2 is unavailable.
+    """
+    if getattr(root, 'TkdndVersion', None) is None:
+        try:
+            from tkinterdnd2 import TkinterDnD # Also adds drop_target_register/dnd_bind to all widgets
+            root.TkdndVersion = TkinterDnD._require(root)
+        except (ImportError, RuntimeError, tk.TclError):
+            return False
+    return True
 
 class LapAnalyzerApp:
     def __init__(self, master, back_command):
@@ -13,7 +27,7 @@ class LapAnalyzerApp:
         self.back_command = back_command
 
         self.file_path = tk.StringVar()
-        self.summary_data = None # Store summary data for saving (includes 'all_laps' and 'session_datetime')
+        self.session = None # The analyzed session (SessionAnalysis) waiting to be saved
 
         self.frame = ttk.Frame(master, padding="10")
         self.frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -34,12 +48,22 @@ class LapAnalyzerApp:
         self.browse_button = ttk.Button(self.frame, text="Browse", command=self.browse_file)
         self.browse_button.grid(row=1, column=2, padx=5, pady=(15, 5), sticky=tk.W)
 
+        self.folder_button = ttk.Button(self.frame, text="Import Folder", command=self.browse_folder)
+        self.folder_button.grid(row=1, column=3, padx=5, pady=(15, 5), sticky=tk.W)
+
         self.action_frame = ttk.Frame(self.frame)
         self.action_frame.grid(row=2, column=1, pady=10)
 
         self.save_button = ttk.Button(self.action_frame, text="Save Session to Database", command=self.save_session, state=tk.DISABLED)
         self.save_button.pack(side=tk.LEFT, padx=10)
 
+        self.full_report_button = ttk.Button(self.action_frame, text="All Drivers & Sessions Report", command=self.show_full_report, state=tk.DISABLED)
+        self.full_report_button.pack(side=tk.LEFT, padx=10)
+
+        # Parsing and saving run on worker threads so the window stays responsive
+        self.busy_indicator = BusyIndicator(self.action_frame, side=tk.LEFT, padx=10)
+        self.tasks = TaskRunner(self.frame, on_busy_change=self.busy_indicator.set_busy)
+
         self.output_text = tk.Text(self.frame, wrap=tk.WORD, height=20, width=80, bg="#EAEAEA")
         self.output_text.grid(row=3, column=0, columnspan=3, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
 
@@ -51,10 +75,13 @@ class LapAnalyzerApp:
         self.frame.rowconfigure(3, weight=1)
 
         # Drag-and-Drop setup: Already bound to self.file_entry
-        self.frame.drop_target_register(DND_FILES)
-        self.frame.dnd_bind('<<Drop>>', self.on_drop)
-
-        self.display_output(["Welcome! Drag and drop an Assetto Corsa session JSON file into the window or use the Browse button to begin."])
+        if enable_drag_and_drop(master.winfo_toplevel()):
+            from tkinterdnd2 import DND_FILES
+            self.frame.drop_target_register(DND_FILES)
+            self.frame.dnd_bind('<<Drop>>', self.on_drop)
+            self.display_output(["Welcome! Drag and drop an Assetto Corsa session JSON file into the window or use the Browse button to begin."])
+        else:
+            self.display_output(["Welcome! Use the Browse button to begin (drag and drop needs tkinterdnd2)."])
 
     def browse_file(self):
         filename = filedialog.askopenfilename(
@@ -65,22 +92,79 @@ class LapAnalyzerApp:
             self.file_path.set(filename)
             self.analyze_session()
 
+    def browse_folder(self):
+        directory = filedialog.askdirectory(title="Select Content Manager Results Folder")
+        if directory:
+            self.bulk_import([directory])
+
     def on_drop(self, event):
         """Handler for file drop on the entry box."""
-        # Clean up the path string which often includes surrounding braces/quotes
-        file_path = event.data.strip('{}').strip()
-        
-        # Handle cases where multiple files are dropped (only take the first)
-        if ' ' in file_path and not os.path.exists(file_path):
-             # This handles space-separated paths typically from D&D on Windows
-             file_path = file_path.split()[0]
-             
-        if os.path.exists(file_path):
-            self.file_path.set(file_path)
+        # splitlist understands the {braced paths with spaces} format used by tkdnd
+        dropped = [path for path in self.master.tk.splitlist(event.data) if os.path.exists(path)]
+
+        if not dropped:
+            self.display_output([f"Error: Dropped file path is invalid or file does not exist: {event.data}"])
+            return
+
+        # A single file keeps the analyze-then-save flow; folders or many files are bulk imported
+        if len(dropped) == 1 and os.path.isfile(dropped[0]):
+            self.file_path.set(dropped[0])
             self.analyze_session()
         else:
-            self.display_output([f"Error: Dropped file path is invalid or file does not exist: {file_path}"])
+            self.bulk_import(dropped)
+
+    def bulk_import(self, paths):
+        """Parses and saves every result JSON found under the given paths (on a worker thread)."""
+        self.save_button['state'] = tk.DISABLED
+        self.session = None
+        self.tasks.cancel('analyze')
+        self.display_output(["Bulk import: scanning for result files..."])
+
+        # Progress is reported from the worker thread, so hop back onto the Tk thread to draw it
+        progress = lambda stats: self.tasks.post(self.show_bulk_progress, dict(stats))
+
+        def run():
+            files = find_result_files(paths)
+            return import_files(files, progress_callback=progress) if files else None
+
+        self.set_import_controls(tk.DISABLED)
+        self.tasks.submit(
+            'bulk_import', run,
+            on_done=self.on_bulk_import_done,
+            on_error=lambda e: self.on_task_error("Bulk import failed", e)
+        )
 
+    def show_bulk_progress(self, stats):
+        self.output_text.delete(1.0, tk.END)
+        self.output_text.insert(tk.END,
+            f"Bulk import: {stats['done']}/{stats['total']} files parsed "
+            f"({stats['files_per_sec']:.1f} files/s), {stats['skipped']} skipped\n")
+
+    def on_bulk_import_done(self, stats):
+        self.set_import_controls(tk.NORMAL)
+        if stats is None:
+            self.display_output(["No JSON result files found in the selection."])
+            return
+        self.display_output([
+            "=" * 50,
+            "   BULK IMPORT COMPLETE   ",
+            "=" * 50,
+            f"Files processed:  {stats['done']}",
+            f"Sessions saved:   {stats['saved']}",
+            f"Unchanged (already imported): {stats['unchanged']}",
+            f"Duplicates (content already saved): {stats['duplicates']}",
+            f"Skipped (no valid laps / unreadable): {stats['skipped']}",
+            f"Elapsed:          {stats['elapsed']:.2f} s ({stats['files_per_sec']:.1f} files/s)",
+        ])
+
+    def set_import_controls(self, state):
+        """Enables/disables the file selection buttons while a bulk import is running."""
+        self.browse_button['state'] = state
+        self.folder_button['state'] = state
+
+    def on_task_error(self, title, error):
+        self.set_import_controls(tk.NORMAL)
+        self.display_output([f"{title}: {error}"])
 
     def analyze_session(self):
         """Analyzes the session file and displays the report."""
@@ -89,42 +173,79 @@ class LapAnalyzerApp:
             self.display_output(["Please select a file first."])
             return
 
-        # Use imported analysis function
-        # analyze_ac_session returns (report_lines, summary_data)
-        report, summary_data = analyze_ac_session(file_path)
+        # Use imported analysis function on a worker thread; a newer file replaces a pending analysis.
+        # This screen is the only place the text report is shown, so it is rendered here (also off-thread).
+        self.save_button['state'] = tk.DISABLED
+        self.full_report_button['state'] = tk.DISABLED
+        self.session = None
+        self.display_output([f"Analyzing {os.path.basename(file_path)}..."])
+
+        def run():
+            session = analyze_ac_session(file_path)
+            return session, session.report()
+
+        self.tasks.submit(
+            'analyze', run,
+            on_done=self.on_analysis_done,
+            on_error=lambda e: self.on_task_error("Analysis failed", e)
+        )
+
+    def on_analysis_done(self, result):
+        session, report = result
         self.display_output(report)
+        self.full_report_button['state'] = tk.NORMAL if session.readable else tk.DISABLED
 
         # Check for a valid session (best lap time > 0)
-        if summary_data and summary_data.get('best_lap_ms', -1) > 0:
+        if session.usable:
             self.save_button['state'] = tk.NORMAL
-            self.summary_data = summary_data
+            self.session = session
         else:
             self.save_button['state'] = tk.DISABLED
-            self.summary_data = None
+            self.session = None
 
 
+    def show_full_report(self):
+        """Runs the multi-driver, multi-session engine on the current file and shows its report."""
+        file_path = self.file_path.get()
+        if not file_path:
+            return
+        from engine import analyze_results # NumPy is only loaded once the full report is first used
+        self.display_output([f"Analyzing all drivers and sessions in {os.path.basename(file_path)}..."])
+        self.tasks.submit(
+            'analyze', lambda: analyze_results(file_path).render_report(),
+            on_done=self.display_output,
+            on_error=lambda e: self.on_task_error("Full analysis failed", e)
+        )
+
     def save_session(self):
         """Calls the function to write data to SQLite."""
-        if self.summary_data:
-            # Use imported save function
-            success = save_session_data(
-                raw_data=self.summary_data['raw_data'],
-                best_lap_ms=self.summary_data['best_lap_ms'],
-                theoretical_ms=self.summary_data['theoretical_ms'],
-                # Pass the 'all_laps' data
-                all_laps_data=self.summary_data['all_laps'], 
-                # Pass the extracted 'session_datetime'
-                session_datetime=self.summary_data.get('session_datetime') 
+        if self.session:
+            # Use imported save function on a worker thread; the content hash and file info
+            # carried by the session guard against saving the same file twice
+            self.save_button['state'] = tk.DISABLED
+            self.tasks.submit(
+                'save', save_session_data, self.session,
+                on_done=self.on_save_done,
+                on_error=self.on_save_error
             )
-
-            if success:
-                messagebox.showinfo("Success", "Session successfully saved to database!")
-                self.save_button['state'] = tk.DISABLED
-                self.back_command()
-            # Note: database.py handles error message for failed save
         else:
             messagebox.showwarning("Error", "No valid session data is currently loaded to save.")
 
+    def on_save_done(self, success):
+        messagebox.showinfo("Success", "Session successfully saved to database!")
+        self.back_command()
+
+    def on_save_error(self, error):
+        if isinstance(error, DuplicateSessionError):
+            messagebox.showwarning("Duplicate Session", str(error))
+            return # Saving again cannot succeed, so the button stays disabled
+        if isinstance(error, DatabaseError):
+            messagebox.showerror("Database Save Error", str(error))
+        else:
+            messagebox.showerror("Save Error", f"Failed to save session: {error}")
+        if self.session:
+            self.save_button['state'] = tk.NORMAL
+
     def display_output(self, lines):
         self.output_text.delete(1.0, tk.END)
         for line in lines:
@@ -1,10 +1,90 @@
+import datetime
 import tkinter as tk
-from tkinter import messagebox, ttk
+from collections import OrderedDict
+from tkinter import filedialog, messagebox, simpledialog, ttk
 
 # Import functions from other modules
-from analysis import format_ms_to_time
+import diagnostics
+from analysis import format_ms_to_time, format_ms_column
+from comparison import lap_cache
+from tasks import TaskRunner, BusyIndicator
 # UPDATED: Import the delete function
-from database import get_unique_cars_and_tracks, get_sessions, get_laps_for_session, delete_session_by_id
+from database import (
+    get_unique_cars_and_tracks, get_sessions_page, count_sessions, get_lap_analytics, get_session_consistency,
+    get_combo_stats, delete_sessions, get_reclaim_error, search_names, SESSION_PAGE_SIZE, ROLLING_WINDOW
+)
+
+MAX_LOADED_PAGES = 3 # Session rows kept in the Treeview = MAX_LOADED_PAGES * SESSION_PAGE_SIZE
+SCROLL_EDGE = 0.05   # Fraction of the scroll range that counts as "near the top/bottom"
+LAP_CACHE_SESSIONS = 64 # Sessions whose formatted lap rows are kept for instant re-selection
+SEARCH_DELAY_MS = 120   # Typing pause before the name search runs
+SEARCH_LIST_ROWS = 8
+
+# Date filter choices: label -> days back from today (None: no limit)
+DATE_RANGES = {'Any Time': None, 'Today': 0, 'Last 7 Days': 6, 'Last 30 Days': 29, 'Last 365 Days': 364}
+CUSTOM_RANGE = 'Custom...'
+
+# --- Row Formatting ---
+# Runs on the worker thread with the query, so the Tk thread only inserts ready-made rows.
+
+def format_session_rows(records):
+    """Formats session records (id, car, track, best, theoretical, date) column by column."""
+    best = format_ms_column([row[3] for row in records])
+    theoretical = format_ms_column([row[4] for row in records])
+    return [(row[0], row[1], row[2], b, t, row[5]) for row, b, t in zip(records, best, theoretical)]
+
+def _format_delta(ms):
+    return "" if ms is None else f"{ms / 1000:+.3f}"
+
+def format_lap_rows(laps):
+    """Formats lap analytics records (database.LAP_ANALYTICS_COLUMNS) column by column."""
+    if not laps:
+        return []
+    (lap_numbers, times, s1, s2, s3, cuts, valid,
+     deltas, rolling_avg, rolling_stddev, stints, stint_laps, percent_rank) = zip(*laps)
+    status = [
+        f"CUTS ({c})" if c > 0 else ("VALID" if v == 1 else "INVALID")
+        for c, v in zip(cuts, valid)
+    ]
+    averages = format_ms_column([round(ms) if ms is not None else None for ms in rolling_avg])
+    return list(zip(
+        lap_numbers, format_ms_column(times), format_ms_column(s1), format_ms_column(s2),
+        format_ms_column(s3), cuts, status,
+        [_format_delta(ms) for ms in deltas],
+        [a if ms is not None else "" for a, ms in zip(averages, rolling_avg)],
+        ["" if ms is None else f"{ms / 1000:.3f}" for ms in rolling_stddev],
+        ["" if stint is None else f"{stint}.{lap}" for stint, lap in zip(stints, stint_laps)],
+        ["" if rank is None else f"{100 * rank:.0f}%" for rank in percent_rank],
+    ))
+
+def format_consistency(stats):
+    """One-line summary of get_session_consistency() for the lap header."""
+    if not stats:
+        return ""
+    return (
+        f"Mean: {format_ms_to_time(stats['mean'])}  σ: {stats['stddev'] / 1000:.3f}s"
+        f" ({stats['consistency']:.2f}%)  |  p10/p50/p90: {format_ms_to_time(stats['p10'])}"
+        f" / {format_ms_to_time(stats['p50'])} / {format_ms_to_time(stats['p90'])}"
+        f"  |  Stints: {stats['stints']}"
+    )
+
+def fetch_session_page(**kwargs):
+    records = get_sessions_page(**kwargs)
+    return records, format_session_rows(records)
+
+def fetch_lap_rows(session_id):
+    """Returns (formatted lap rows, consistency summary) for one session."""
+    return format_lap_rows(get_lap_analytics(session_id)), format_consistency(get_session_consistency(session_id))
+
+def insert_rows(tree, rows, index=tk.END):
+    """
+    Inserts rows into a Treeview at index ('end' or a position), returning the item ids.
+    Calls the Tcl insert command directly, skipping Treeview.insert's per-call option handling.
+    """
+    call, widget = tree.tk.call, tree._w
+    if index == tk.END:
+        return [call(widget, 'insert', '', 'end', '-values', row) for row in rows]
+    return [call(widget, 'insert', '', index + offset, '-values', row) for offset, row in enumerate(rows)]
 
 class DatabaseViewer:
     def __init__(self, master, back_command):
@@ -12,6 +92,21 @@ class DatabaseViewer:
         self.back_command = back_command
         self.selected_car = tk.StringVar(value='All Cars')
         self.selected_track = tk.StringVar(value='All Tracks')
+        self.selected_range = tk.StringVar(value='Any Time')
+        self.date_from = None # Inclusive datetime.date bounds of the date filter
+        self.date_to = None
+
+        # Virtualized session list state: only a sliding window of pages lives in the Treeview
+        self.session_pages = []      # [{'items': [...], 'first': (started_at, id), 'last': (started_at, id)}]
+        self.rows_above = 0          # Rows dropped above the window
+        self.has_more_above = False
+        self.has_more_below = False
+        self.session_total = 0
+        self._paging = False
+
+        # Formatted rows for recently viewed sessions (session id -> lap rows) and car/track stats
+        self.lap_row_cache = OrderedDict()
+        self.combo_stats_cache = {}
 
         self.main_frame = ttk.Frame(master, padding="10")
         self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -25,22 +120,58 @@ class DatabaseViewer:
         tk.Label(header_frame, text="Saved Sessions Database", font=('Arial', 18, 'bold')).pack(side=tk.LEFT)
         ttk.Button(header_frame, text="< Back to Main Menu", command=self.back_command).pack(side=tk.RIGHT)
 
+        # Queries run on worker threads; a newer filter/selection makes a pending one obsolete
+        self.busy_indicator = BusyIndicator(header_frame, side=tk.RIGHT, padx=10)
+        self.tasks = TaskRunner(self.main_frame, on_busy_change=self.busy_indicator.set_busy)
+
         # --- Filters ---
         filter_frame = ttk.LabelFrame(self.main_frame, text="Filters", padding=5)
         filter_frame.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=5)
         ttk.Label(filter_frame, text="Car:").pack(side=tk.LEFT, padx=(5, 5))
-        self.car_combobox = ttk.Combobox(filter_frame, textvariable=self.selected_car, state="readonly", width=25)
+        self.car_combobox = ttk.Combobox(filter_frame, textvariable=self.selected_car, state="readonly", width=20)
         self.car_combobox.pack(side=tk.LEFT, padx=5)
         self.car_combobox.bind('<<ComboboxSelected>>', self.refresh_session_list)
-        ttk.Label(filter_frame, text="Track:").pack(side=tk.LEFT, padx=(20, 5))
-        self.track_combobox = ttk.Combobox(filter_frame, textvariable=self.selected_track, state="readonly", width=25)
+        ttk.Label(filter_frame, text="Track:").pack(side=tk.LEFT, padx=(15, 5))
+        self.track_combobox = ttk.Combobox(filter_frame, textvariable=self.selected_track, state="readonly", width=20)
         self.track_combobox.pack(side=tk.LEFT, padx=5)
         self.track_combobox.bind('<<ComboboxSelected>>', self.refresh_session_list)
+        ttk.Label(filter_frame, text="Date:").pack(side=tk.LEFT, padx=(15, 5))
+        self.range_combobox = ttk.Combobox(
+            filter_frame, textvariable=self.selected_range, state="readonly", width=13,
+            values=tuple(DATE_RANGES) + (CUSTOM_RANGE,)
+        )
+        self.range_combobox.pack(side=tk.LEFT, padx=5)
+        self.range_combobox.bind('<<ComboboxSelected>>', self.on_range_selected)
+        self.export_button = ttk.Button(filter_frame, text="Export Laps...", command=self.export_laps)
+        self.export_button.pack(side=tk.RIGHT, padx=5)
+
+        # Type-ahead search: matching cars/tracks drop down under the entry; picking one sets that filter
+        ttk.Label(filter_frame, text="Search:").pack(side=tk.LEFT, padx=(15, 5))
+        self.search_text = tk.StringVar()
+        self.search_entry = ttk.Entry(filter_frame, textvariable=self.search_text, width=16)
+        self.search_entry.pack(side=tk.LEFT, padx=5)
+        self.search_matches = []
+        self.search_list = tk.Listbox(self.main_frame, height=SEARCH_LIST_ROWS, activestyle='dotbox')
+        self.search_list.bind('<ButtonRelease-1>', lambda event: self.apply_search_match())
+        self.search_list.bind('<Return>', lambda event: self.apply_search_match())
+        self.search_list.bind('<Escape>', lambda event: self.hide_search_matches())
+        self._search_after = None
+        self.search_entry.bind('<KeyRelease>', self.on_search_key)
+        self.search_entry.bind('<Down>', lambda event: self.focus_search_matches())
+        self.search_entry.bind('<Return>', lambda event: self.apply_search_match(0))
+        self.search_entry.bind('<Escape>', lambda event: self.hide_search_matches())
 
         # --- Session List (Top Table) ---
-        tk.Label(self.main_frame, text="1. Select a Session:", font=('Arial', 10, 'bold'), anchor='w').grid(row=2, column=0, sticky=tk.W, pady=(10,0))
+        session_header = ttk.Frame(self.main_frame)
+        session_header.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(10,0))
+        tk.Label(session_header, text="1. Select a Session:", font=('Arial', 10, 'bold'), anchor='w').pack(side=tk.LEFT)
+        self.session_count_label = tk.Label(session_header, text="", fg='gray', anchor='e')
+        self.session_count_label.pack(side=tk.RIGHT)
+        # Ctrl/Shift-click several sessions of one car/track to compare them
+        self.compare_button = ttk.Button(session_header, text="Compare Selected", command=self.compare_selected, state=tk.DISABLED)
+        self.compare_button.pack(side=tk.RIGHT, padx=10)
         session_cols = ('ID', 'Car', 'Track', 'Best Lap', 'Theoretical', 'Date')
-        self.session_tree = ttk.Treeview(self.main_frame, columns=session_cols, show='headings', height=6)
+        self.session_tree = ttk.Treeview(self.main_frame, columns=session_cols, show='headings', height=6, selectmode='extended')
         self.session_tree.heading('ID', text='ID')
         self.session_tree.heading('Car', text='Car Model')
         self.session_tree.heading('Track', text='Track')
@@ -54,9 +185,9 @@ class DatabaseViewer:
         self.session_tree.column('Theoretical', width=80, anchor=tk.CENTER)
         self.session_tree.column('Date', width=140, anchor=tk.CENTER)
         self.session_tree.grid(row=3, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
-        sess_scroll = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.session_tree.yview)
-        self.session_tree.configure(yscrollcommand=sess_scroll.set)
-        sess_scroll.grid(row=3, column=1, sticky=(tk.N, tk.S))
+        self.sess_scroll = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.session_tree.yview)
+        self.session_tree.configure(yscrollcommand=self.on_session_scroll)
+        self.sess_scroll.grid(row=3, column=1, sticky=(tk.N, tk.S))
         
         # ADDED BINDINGS FOR DELETION
         self.session_tree.bind('<<TreeviewSelect>>', self.on_session_select)
@@ -64,8 +195,13 @@ class DatabaseViewer:
         self.session_tree.bind('<Button-3>', self.show_context_menu)         # Bind Right Click (Button-3)
 
         # --- Lap List (Bottom Table) ---
-        tk.Label(self.main_frame, text="2. Lap Details for Selected Session:", font=('Arial', 10, 'bold'), anchor='w').grid(row=4, column=0, sticky=tk.W, pady=(20,0))
-        lap_cols = ('Lap', 'Time', 'S1', 'S2', 'S3', 'Cuts', 'Status')
+        lap_header = ttk.Frame(self.main_frame)
+        lap_header.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(20,0))
+        tk.Label(lap_header, text="2. Lap Details for Selected Session:", font=('Arial', 10, 'bold'), anchor='w').pack(side=tk.LEFT)
+        # Personal bests for the selected session's car/track, read from the precomputed combo_stats table
+        self.combo_stats_label = tk.Label(lap_header, text="", fg='#004D40', anchor='e')
+        self.combo_stats_label.pack(side=tk.RIGHT)
+        lap_cols = ('Lap', 'Time', 'S1', 'S2', 'S3', 'Cuts', 'Status', 'Delta', 'Avg', 'StdDev', 'Stint', 'Rank')
         self.lap_tree = ttk.Treeview(self.main_frame, columns=lap_cols, show='headings', height=8)
         self.lap_tree.heading('Lap', text='Lap #')
         self.lap_tree.heading('Time', text='Lap Time')
@@ -74,55 +210,216 @@ class DatabaseViewer:
         self.lap_tree.heading('S3', text='Sector 3')
         self.lap_tree.heading('Cuts', text='Cuts')
         self.lap_tree.heading('Status', text='Status')
-        self.lap_tree.column('Lap', width=50, anchor=tk.CENTER)
-        self.lap_tree.column('Time', width=90, anchor=tk.CENTER)
-        self.lap_tree.column('S1', width=90, anchor=tk.CENTER)
-        self.lap_tree.column('S2', width=90, anchor=tk.CENTER)
-        self.lap_tree.column('S3', width=90, anchor=tk.CENTER)
-        self.lap_tree.column('Cuts', width=50, anchor=tk.CENTER)
-        self.lap_tree.column('Status', width=80, anchor=tk.CENTER)
+        self.lap_tree.heading('Delta', text='Δ Best')
+        self.lap_tree.heading('Avg', text=f'Avg ({ROLLING_WINDOW})')
+        self.lap_tree.heading('StdDev', text=f'σ ({ROLLING_WINDOW})')
+        self.lap_tree.heading('Stint', text='Stint')
+        self.lap_tree.heading('Rank', text='Top %')
+        self.lap_tree.column('Lap', width=45, anchor=tk.CENTER)
+        self.lap_tree.column('Time', width=80, anchor=tk.CENTER)
+        self.lap_tree.column('S1', width=75, anchor=tk.CENTER)
+        self.lap_tree.column('S2', width=75, anchor=tk.CENTER)
+        self.lap_tree.column('S3', width=75, anchor=tk.CENTER)
+        self.lap_tree.column('Cuts', width=40, anchor=tk.CENTER)
+        self.lap_tree.column('Status', width=75, anchor=tk.CENTER)
+        self.lap_tree.column('Delta', width=70, anchor=tk.CENTER)
+        self.lap_tree.column('Avg', width=80, anchor=tk.CENTER)
+        self.lap_tree.column('StdDev', width=60, anchor=tk.CENTER)
+        self.lap_tree.column('Stint', width=50, anchor=tk.CENTER)
+        self.lap_tree.column('Rank', width=55, anchor=tk.CENTER)
         self.lap_tree.grid(row=5, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
         lap_scroll = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.lap_tree.yview)
         self.lap_tree.configure(yscrollcommand=lap_scroll.set)
         lap_scroll.grid(row=5, column=1, sticky=(tk.N, tk.S))
+        # Consistency of the selected session's valid laps (window-function analytics in database.py)
+        self.consistency_label = tk.Label(self.main_frame, text="", fg='#37474F', anchor='w')
+        self.consistency_label.grid(row=6, column=0, sticky=tk.W)
 
         # Initial Load
-        self.populate_filters()
         self.refresh_session_list()
 
 
     def populate_filters(self):
         """Fetches unique car models and tracks to populate the comboboxes using database module."""
-        cars, tracks = get_unique_cars_and_tracks()
+        self.tasks.submit('filters', get_unique_cars_and_tracks, on_done=self.on_filters_loaded)
+
+    def on_filters_loaded(self, result):
+        cars, tracks = result
         self.car_combobox['values'] = tuple(cars)
         self.track_combobox['values'] = tuple(tracks)
 
+    def session_filters(self):
+        """The current car/track/date filters as keyword arguments for the session queries."""
+        return {
+            'car_filter': self.selected_car.get(), 'track_filter': self.selected_track.get(),
+            'date_from': self.date_from, 'date_to': self.date_to,
+        }
+
+    def on_range_selected(self, event=None):
+        """Applies a preset date range, or asks for a custom one."""
+        choice = self.selected_range.get()
+        if choice != CUSTOM_RANGE:
+            days = DATE_RANGES[choice]
+            self.date_to = None
+            self.date_from = datetime.date.today() - datetime.timedelta(days=days) if days is not None else None
+            self.refresh_session_list()
+            return
+
+        try:
+            date_from = self.ask_date("From Date", "First session date (YYYY-MM-DD), empty for no limit:", self.date_from)
+            date_to = self.ask_date("To Date", "Last session date (YYYY-MM-DD), empty for no limit:", self.date_to)
+        except ValueError as e:
+            messagebox.showerror("Invalid Date", str(e))
+            date_from, date_to = self.date_from, self.date_to
+        if date_from and date_to and date_from > date_to:
+            date_from, date_to = date_to, date_from
+        self.date_from, self.date_to = date_from, date_to
+        self.range_combobox.set(self.range_label())
+        self.refresh_session_list()
+
+    def ask_date(self, title, prompt, current):
+        """Returns the entered datetime.date, None for no limit or current if cancelled; raises ValueError on bad input."""
+        text = simpledialog.askstring(title, prompt, initialvalue=current.isoformat() if current else "", parent=self.master)
+        if text is None:
+            return current
+        if not text.strip():
+            return None
+        try:
+            return datetime.date.fromisoformat(text.strip())
+        except ValueError:
+            raise ValueError(f"'{text.strip()}' is not a YYYY-MM-DD date.") from None
+
+    def range_label(self):
+        if self.date_from is None and self.date_to is None:
+            return 'Any Time'
+        return f"{self.date_from or '...'} - {self.date_to or '...'}"
+
     def refresh_session_list(self, event=None):
-        """Updates the top table based on filters using database module."""
-        for item in self.session_tree.get_children():
-            self.session_tree.delete(item)
-        for item in self.lap_tree.get_children():
-            self.lap_tree.delete(item)
-
-        # Use imported database function
-        records = get_sessions(
-            car_filter=self.selected_car.get(),
-            track_filter=self.selected_track.get()
+        """Resets the top table to the first page of sessions matching the filters."""
+        # Deletes and imports add or remove cars and tracks, so the filter choices are reloaded too
+        self.populate_filters()
+        self.session_tree.delete(*self.session_tree.get_children())
+        self.lap_tree.delete(*self.lap_tree.get_children())
+        self.tasks.cancel('laps')
+        self.tasks.cancel('combo_stats')
+        self.combo_stats_label.config(text="")
+        self.consistency_label.config(text="")
+        self.combo_stats_cache.clear() # Imports since the last refresh may have changed them
+
+        self.session_pages = []
+        self.rows_above = 0
+        self.has_more_above = False
+        self.has_more_below = False
+        self._paging = True # No scroll paging until the first page is in
+        self.session_count_label.config(text="Loading...")
+
+        filters = self.session_filters()
+
+        def fetch():
+            total = count_sessions(**filters)
+            return total, fetch_session_page(**filters)
+
+        # Submitted under 'sessions' so it also supersedes any page load still in flight
+        self.tasks.submit('sessions', fetch, on_done=self.on_first_page_loaded, on_error=self.on_sessions_error)
+
+    def on_sessions_error(self, error):
+        self._paging = False
+        self.has_more_above = self.has_more_below = False
+        self.session_count_label.config(text="")
+        messagebox.showerror("Database Error", str(error))
+
+    def on_first_page_loaded(self, result):
+        self.session_total, page = result
+        self._paging = False
+        self.on_next_page_loaded(page)
+        self.session_tree.yview_moveto(0)
+
+    def _insert_session_rows(self, records, rows, index):
+        """Inserts the formatted rows of a page at index ('end' or 0). Returns the new page record."""
+        # records: (id, car_model, track_name, best_lap_time, theoretical_lap_time, date_time, started_at)
+        with diagnostics.stage('viewer.insert_session_rows', rows=len(rows)):
+            items = insert_rows(self.session_tree, rows, index)
+        return {'items': items, 'first': (records[0][6], records[0][0]), 'last': (records[-1][6], records[-1][0])}
+
+    def load_session_page(self):
+        """Fetches the next (older) page below the window on a worker thread."""
+        last_key = self.session_pages[-1]['last'] if self.session_pages else None
+        self._load_page(self.on_next_page_loaded, before=last_key)
+
+    def load_previous_session_page(self):
+        """Fetches the previous (newer) page above the window on a worker thread."""
+        if not self.session_pages:
+            return
+        self._load_page(self.on_previous_page_loaded, after=self.session_pages[0]['first'])
+
+    def _load_page(self, on_loaded, **keyset):
+        self._paging = True
+        def on_done(records):
+            self._paging = False
+            on_loaded(records)
+        self.tasks.submit(
+            'sessions', fetch_session_page,
+            **self.session_filters(),
+            on_done=on_done,
+            on_error=self.on_sessions_error,
+            **keyset
         )
 
-        for row in records:
-            # row: (id, car_model, track_name, best_lap_time, theoretical_lap_time, date_time)
-            formatted = (
-                row[0], row[1], row[2],
-                format_ms_to_time(row[3]),
-                format_ms_to_time(row[4]),
-                row[5]
-            )
-            self.session_tree.insert('', tk.END, values=formatted)
+    def on_next_page_loaded(self, page):
+        """Appends a page below the window, dropping the top page if the window is full."""
+        records, rows = page
+        self.has_more_below = len(records) == SESSION_PAGE_SIZE
+        if records:
+            anchor = self.session_pages[-1]['items'][-1] if self.session_pages else None
+            self.session_pages.append(self._insert_session_rows(records, rows, tk.END))
+
+            if len(self.session_pages) > MAX_LOADED_PAGES:
+                dropped = self.session_pages.pop(0)
+                self.session_tree.delete(*dropped['items'])
+                self.rows_above += len(dropped['items'])
+                self.has_more_above = True
+            if anchor:
+                self.session_tree.see(anchor)
+        self.update_session_count_label()
+
+    def on_previous_page_loaded(self, page):
+        """Prepends a page above the window, dropping the bottom page if the window is full."""
+        records, rows = page
+        if records:
+            anchor = self.session_pages[0]['items'][0]
+            self.session_pages.insert(0, self._insert_session_rows(records, rows, 0))
+            self.rows_above = max(0, self.rows_above - len(records))
+
+            if len(self.session_pages) > MAX_LOADED_PAGES:
+                dropped = self.session_pages.pop()
+                self.session_tree.delete(*dropped['items'])
+                self.has_more_below = True
+            self.session_tree.see(anchor)
+        self.has_more_above = len(records) == SESSION_PAGE_SIZE and self.rows_above > 0
+        self.update_session_count_label()
+
+    def update_session_count_label(self):
+        loaded = sum(len(page['items']) for page in self.session_pages)
+        if loaded:
+            text = f"Showing {self.rows_above + 1}-{self.rows_above + loaded} of {self.session_total} session(s)"
+        else:
+            text = f"{self.session_total} session(s)"
+        self.session_count_label.config(text=text)
+
+    def on_session_scroll(self, first, last):
+        """Scrollbar hook: pages sessions in/out lazily as the view nears either edge."""
+        self.sess_scroll.set(first, last)
+        if self._paging:
+            return
+        if float(last) >= 1.0 - SCROLL_EDGE and self.has_more_below:
+            self.load_session_page()
+        elif float(first) <= SCROLL_EDGE and self.has_more_above:
+            self.load_previous_session_page()
 
     def on_session_select(self, event):
         """Triggered when user clicks a row in the top table."""
         selected_items = self.session_tree.selection()
+        self.compare_button['state'] = tk.NORMAL if len(selected_items) > 1 else tk.DISABLED
         if not selected_items:
             return
         # Ensure focus is set on the clicked item for immediate deletion
@@ -131,83 +428,260 @@ class DatabaseViewer:
         item_values = self.session_tree.item(selected_items[0])['values']
         session_id = item_values[0]
         self.load_laps_for_session(session_id)
+        # Treeview may hand back numeric-looking names as ints, so convert back to str
+        self.load_combo_stats(str(item_values[1]), str(item_values[2]))
+
+    def load_combo_stats(self, car_model, track_name):
+        """Fetches the car/track personal bests (a single-row lookup) on a worker thread."""
+        key = (car_model, track_name)
+        if key in self.combo_stats_cache:
+            self.tasks.cancel('combo_stats')
+            self.show_combo_stats(car_model, track_name, self.combo_stats_cache[key])
+            return
+
+        def on_done(stats):
+            self.combo_stats_cache[key] = stats
+            self.show_combo_stats(car_model, track_name, stats)
+        self.tasks.submit('combo_stats', get_combo_stats, car_model, track_name, on_done=on_done)
+
+    def show_combo_stats(self, car_model, track_name, stats):
+        if not stats:
+            self.combo_stats_label.config(text="")
+            return
+        sectors = " / ".join(
+            format_ms_to_time(stats[key]) for key in ('best_sector_1', 'best_sector_2', 'best_sector_3')
+            if stats[key] is not None
+        )
+        self.combo_stats_label.config(text=(
+            f"{car_model} @ {track_name}  |  PB: {format_ms_to_time(stats['best_lap_time'])}"
+            f"  |  Ideal: {format_ms_to_time(stats['theoretical_best'])} ({sectors or 'N/A'})"
+            f"  |  Valid laps: {stats['valid_lap_count']}/{stats['lap_count']} in {stats['session_count']} session(s)"
+        ))
 
     def load_laps_for_session(self, session_id):
-        """Queries the database for laps belonging to the session and updates bottom table."""
-        for item in self.lap_tree.get_children():
-            self.lap_tree.delete(item)
-
-        # Use imported database function
-        laps = get_laps_for_session(session_id)
-
-        for lap in laps:
-            # lap: (lap_number, lap_time, sector_1, sector_2, sector_3, cuts, is_valid)
-            lap_number, lap_time, s1, s2, s3, cuts, is_valid = lap
-
-            valid_status = "VALID" if is_valid == 1 else "INVALID"
-            if cuts > 0:
-                valid_status = f"CUTS ({cuts})"
-
-            formatted = (
-                lap_number,
-                format_ms_to_time(lap_time),
-                format_ms_to_time(s1),
-                format_ms_to_time(s2),
-                format_ms_to_time(s3),
-                cuts,
-                valid_status
-            )
-            self.lap_tree.insert('', tk.END, values=formatted)
+        """Shows the session's laps, from the row cache or from the database (on a worker thread)."""
+        session_id = int(session_id)
+        laps = self.lap_row_cache.get(session_id)
+        if laps is not None:
+            # A session's laps never change once saved, so cached rows stay valid until it is deleted
+            self.lap_row_cache.move_to_end(session_id)
+            self.tasks.cancel('laps')
+            self.show_laps(laps)
+            return
 
-    # --- NEW DELETION LOGIC ---
-    def get_selected_session_id(self):
-        """Helper to get the ID of the currently selected session."""
-        selected_items = self.session_tree.selection()
-        if selected_items:
-            # The ID is the first value in the row
-            return self.session_tree.item(selected_items[0], 'values')[0]
-        return None
+        def on_done(laps):
+            self.lap_row_cache[session_id] = laps
+            if len(self.lap_row_cache) > LAP_CACHE_SESSIONS:
+                self.lap_row_cache.popitem(last=False)
+            self.show_laps(laps)
+
+        # Use imported database function; clicking another session makes this request obsolete
+        self.tasks.submit('laps', fetch_lap_rows, session_id, on_done=on_done)
 
+    def show_laps(self, laps):
+        """Updates the bottom table and consistency line from fetch_lap_rows() output."""
+        rows, consistency = laps
+        self.consistency_label.config(text=consistency)
+        with diagnostics.stage('viewer.insert_lap_rows', rows=len(rows)):
+            self.lap_tree.delete(*self.lap_tree.get_children())
+            insert_rows(self.lap_tree, rows)
+
+    # --- NEW DELETION LOGIC ---
     def confirm_delete_session(self, event=None):
-        """Prompts user and executes deletion if confirmed (triggered by Delete key or context menu)."""
-        session_id = self.get_selected_session_id()
-        if not session_id:
+        """Prompts user and deletes the selected session(s) in one transaction (Delete key or context menu)."""
+        selected_items = self.session_tree.selection()
+        if not selected_items:
             messagebox.showwarning("Warning", "Please select a session to delete.")
             return
 
-        # Get session details for confirmation message
-        selected_item = self.session_tree.selection()[0]
-        values = self.session_tree.item(selected_item, 'values')
-        # Display ID, Car, Track, and Date (index 0, 1, 2, 5)
-        session_info = f"Session ID: {values[0]}\nCar: {values[1]}\nTrack: {values[2]}\nDate: {values[5]}"
-
-        if messagebox.askyesno(
-            "Confirm Deletion", 
-            f"Are you sure you want to permanently delete this session and all its lap data?\n\n{session_info}"
-        ):
-            # Call the imported database function
-            if delete_session_by_id(session_id):
-                messagebox.showinfo("Success", f"Session {session_id} successfully deleted.")
-                self.refresh_session_list() # Reload the session list
-                # Clear the lap details tree
-                for i in self.lap_tree.get_children():
-                    self.lap_tree.delete(i)
-            # If deletion fails, delete_session_by_id handles the error message
+        rows = [self.session_tree.item(item, 'values') for item in selected_items]
+        session_ids = [int(values[0]) for values in rows]
+        if len(rows) == 1:
+            # Display ID, Car, Track, and Date (index 0, 1, 2, 5)
+            values = rows[0]
+            session_info = f"Session ID: {values[0]}\nCar: {values[1]}\nTrack: {values[2]}\nDate: {values[5]}"
+            prompt = f"Are you sure you want to permanently delete this session and all its lap data?\n\n{session_info}"
+        else:
+            prompt = f"Are you sure you want to permanently delete these {len(rows)} sessions and all their lap data?"
+
+        if messagebox.askyesno("Confirm Deletion", prompt):
+            # One transaction on a worker thread, followed by an incremental vacuum
+            self.tasks.submit(
+                'delete', delete_sessions, session_ids,
+                on_done=lambda deleted: self.on_sessions_deleted(session_ids, deleted),
+                on_error=lambda e: messagebox.showerror("Database Error", str(e))
+            )
+
+    def on_sessions_deleted(self, session_ids, deleted):
+        for session_id in session_ids:
+            self.lap_row_cache.pop(session_id, None)
+            lap_cache.invalidate(session_id) # Comparison lap arrays
+        if len(session_ids) == 1:
+            message = f"Session {session_ids[0]} successfully deleted."
+        else:
+            message = f"{deleted} sessions successfully deleted."
+        reclaim_error = get_reclaim_error()
+        if reclaim_error is not None:
+            message += f"\n\nThe freed disk space could not be reclaimed yet: {reclaim_error}"
+        messagebox.showinfo("Success", message)
+        self.refresh_session_list() # Reload the session list (also clears the lap details tree)
 
     def show_context_menu(self, event):
         """Displays a right-click context menu for deletion."""
         # Check if an item was clicked directly
         item_id = self.session_tree.identify_row(event.y)
         
-        # If an item was clicked, select it
+        # If an item was clicked, select it (keeping a multi-selection it belongs to)
         if item_id:
-            self.session_tree.selection_set(item_id)
-            
+            if item_id not in self.session_tree.selection():
+                self.session_tree.selection_set(item_id)
+            count = len(self.session_tree.selection())
+
             menu = tk.Menu(self.main_frame, tearoff=0)
-            menu.add_command(label="Delete Selected Session", command=self.confirm_delete_session)
+            menu.add_command(
+                label="Delete Selected Session" if count == 1 else f"Delete {count} Selected Sessions",
+                command=self.confirm_delete_session
+            )
+            if count == 1:
+                menu.add_command(label="Import Telemetry CSV...", command=self.import_telemetry)
             
             try:
                 # Display the menu at the cursor position
                 menu.tk_popup(event.x_root, event.y_root)
             finally:
-                menu.grab_release()
\ No newline at end of file
+                menu.grab_release()
+
+    # --- Car/Track Search ---
+    def on_search_key(self, event):
+        """Debounces typing: the search runs SEARCH_DELAY_MS after the last key press."""
+        if event.keysym in ('Down', 'Up', 'Return', 'Escape'):
+            return
+        if self._search_after is not None:
+            self.main_frame.after_cancel(self._search_after)
+        self._search_after = self.main_frame.after(SEARCH_DELAY_MS, self.run_search)
+
+    def run_search(self):
+        self._search_after = None
+        query = self.search_text.get()
+        if not query.strip():
+            self.tasks.cancel('search')
+            self.hide_search_matches()
+            return
+        # Each key press supersedes the previous search
+        self.tasks.submit('search', search_names, query, on_done=self.show_search_matches)
+
+    def show_search_matches(self, matches):
+        self.search_matches = matches
+        self.search_list.delete(0, tk.END)
+        if not matches:
+            self.hide_search_matches()
+            return
+        for kind, name in matches:
+            self.search_list.insert(tk.END, f"{'Car' if kind == 'car' else 'Track'}: {name}")
+        self.search_list.configure(height=min(len(matches), SEARCH_LIST_ROWS))
+        # Overlay the list just below the entry, above the session table
+        self.search_list.place(in_=self.search_entry, x=0, rely=1.0, relwidth=2.0)
+        self.search_list.lift()
+
+    def hide_search_matches(self):
+        self.search_list.place_forget()
+
+    def focus_search_matches(self):
+        if self.search_matches:
+            self.search_list.focus_set()
+            self.search_list.selection_clear(0, tk.END)
+            self.search_list.selection_set(0)
+            self.search_list.activate(0)
+
+    def apply_search_match(self, index=None):
+        """Sets the car or track filter to the chosen match (default: the selected list row)."""
+        if index is None:
+            selection = self.search_list.curselection()
+            if not selection:
+                return
+            index = selection[0]
+        if index >= len(self.search_matches):
+            return
+        kind, name = self.search_matches[index]
+        (self.selected_car if kind == 'car' else self.selected_track).set(name)
+        self.search_text.set("")
+        self.hide_search_matches()
+        self.search_entry.focus_set()
+        self.refresh_session_list()
+
+    # --- Comparison ---
+    def compare_selected(self):
+        """Opens a comparison window for the selected sessions (same car and track only)."""
+        from ui_compare import ComparisonWindow, MAX_COMPARE_SESSIONS
+
+        sessions = []
+        for item in self.session_tree.selection():
+            values = self.session_tree.item(item, 'values')
+            sessions.append((int(values[0]), str(values[1]), str(values[2]), str(values[5])))
+        if len(sessions) < 2:
+            messagebox.showwarning("Warning", "Select at least two sessions to compare.")
+            return
+        if len(sessions) > MAX_COMPARE_SESSIONS:
+            messagebox.showwarning("Warning", f"Select at most {MAX_COMPARE_SESSIONS} sessions to compare.")
+            return
+        if len({(car, track) for _, car, track, _ in sessions}) > 1:
+            messagebox.showwarning("Warning", "Only sessions with the same car and track can be compared.")
+            return
+        ComparisonWindow(self.master, sessions)
+
+    # --- Export ---
+    def export_laps(self):
+        """Streams the laps of all sessions matching the current filters to a CSV/Parquet/Arrow file."""
+        path = filedialog.asksaveasfilename(
+            title="Export Laps",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("Parquet", "*.parquet"), ("Arrow IPC", "*.arrow"), ("All Files", "*.*")]
+        )
+        if not path:
+            return
+        from export import export_laps # pyarrow is only imported when exporting
+
+        self.export_button['state'] = tk.DISABLED
+        self.tasks.submit(
+            'export', export_laps, path,
+            **self.session_filters(),
+            on_done=lambda rows: self.on_export_done(path, rows),
+            on_error=self.on_export_error
+        )
+
+    def on_export_done(self, path, rows):
+        self.export_button['state'] = tk.NORMAL
+        messagebox.showinfo("Export Complete", f"Exported {rows} lap(s) to {path}.")
+
+    def on_export_error(self, error):
+        self.export_button['state'] = tk.NORMAL
+        messagebox.showerror("Export Error", str(error))
+
+    # --- Telemetry ---
+    def import_telemetry(self):
+        """Stores a per-lap telemetry CSV with the selected session."""
+        selected_items = self.session_tree.selection()
+        if len(selected_items) != 1:
+            return
+        session_id = int(self.session_tree.item(selected_items[0], 'values')[0])
+        path = filedialog.askopenfilename(
+            title="Import Telemetry", filetypes=[("CSV", "*.csv"), ("All Files", "*.*")]
+        )
+        if not path:
+            return
+        from telemetry import ingest_telemetry_csv
+
+        self.tasks.submit(
+            'telemetry', ingest_telemetry_csv, session_id, path,
+            on_done=lambda stats: self.on_telemetry_imported(session_id, stats),
+            on_error=lambda e: messagebox.showerror("Telemetry Import Error", str(e))
+        )
+
+    def on_telemetry_imported(self, session_id, stats):
+        message = (
+            f"Stored {stats['samples']} samples of {stats['laps']} lap(s) with session {session_id} "
+            f"({stats['stored_bytes'] / 1048576:.1f} MB)."
+        )
+        if stats['skipped_laps']:
+            message += f"\n\nLaps not in the session were skipped: {', '.join(map(str, stats['skipped_laps']))}"
+        messagebox.showinfo("Telemetry Imported", message)
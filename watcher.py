@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+import traceback
+
+# Import functions from other modules
+from bulk_import import import_files
+from database import DatabaseError
+
+try:
+    # Optional: native change notifications (inotify on Linux, ReadDirectoryChangesW on Windows)
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+DEFAULT_RESULTS_DIR = os.path.join(os.path.expanduser('~'), 'Documents', 'Assetto Corsa', 'out', 'results')
+
+SETTLE_SECONDS = 0.4   # A file counts as fully written once its size/mtime stop changing for this long
+TICK_SECONDS = 0.1     # How often pending files are re-checked
+POLL_SECONDS = 0.25    # Directory scan interval for the polling fallback
+RETRY_SECONDS = 5.0    # Delay before files of a batch that failed to save are imported again
+
+class _ChangeHandler(FileSystemEventHandler):
+    """Forwards watchdog create/modify/move events for JSON files to the watcher."""
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.dest_path)
+
+class ResultsWatcher:
+    """
+    Watches a Content Manager results folder and auto-ingests new session files.
+
+    Change notifications come from watchdog when it is installed, otherwise from a polling
+    scan of the directory. A file is only ingested once its size and mtime have been stable
+    for SETTLE_SECONDS (AC writes results incrementally), and all files that settle in the
+    same tick are imported together in one transaction via bulk_import.import_files.
+
+    on_ingested(stats) is called from the watcher thread after every batch.
+    """
+    def __init__(self, directory=DEFAULT_RESULTS_DIR, on_ingested=None):
+        self.directory = directory
+        self.on_ingested = on_ingested
+        self.ingested_total = 0 # Sessions saved since start(); safe to read from any thread
+        self.last_error = None  # Most recent error of an ingest batch or on_ingested, if any
+
+        self._pending = {}      # path -> (size, mtime_ns, time the signature last changed)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = None
+        self._known = {}        # Polling fallback: path -> (size, mtime_ns) from the last scan
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def backend(self):
+        return "native" if self._observer is not None else "polling"
+
+    def start(self):
+        if self.running:
+            return
+        if not os.path.isdir(self.directory):
+            raise FileNotFoundError(f"Results folder does not exist: {self.directory}")
+
+        self._stop.clear()
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_ChangeHandler(self), self.directory, recursive=False)
+            self._observer.start()
+        else:
+            # Existing files are the baseline; only files that appear or change afterwards are ingested
+            self._known = self._scan()
+
+        self._thread = threading.Thread(target=self._run, name="aca-results-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def notify(self, path):
+        """Records a (possibly still growing) JSON file as pending. Thread-safe."""
+        if not path.lower().endswith('.json'):
+            return
+        with self._lock:
+            self._pending.setdefault(path, (-1, -1, time.monotonic()))
+
+    def _scan(self):
+        signatures = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith('.json'):
+                        stat = entry.stat()
+                        signatures[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            pass
+        return signatures
+
+    def _poll_directory(self):
+        signatures = self._scan()
+        for path, signature in signatures.items():
+            if self._known.get(path) != signature:
+                self.notify(path)
+        self._known = signatures
+
+    def _collect_settled(self):
+        """Returns pending files whose size/mtime have not changed for SETTLE_SECONDS."""
+        now = time.monotonic()
+        settled = []
+        with self._lock:
+            for path, (size, mtime, changed_at) in list(self._pending.items()):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    del self._pending[path] # Deleted or renamed before it settled
+                    continue
+
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if signature != (size, mtime):
+                    self._pending[path] = (*signature, now)
+                elif stat.st_size > 0 and now - changed_at >= SETTLE_SECONDS:
+                    settled.append(path)
+                    del self._pending[path]
+        return settled
+
+    def _requeue(self, paths):
+        """Makes failed files pending again; they settle (and are retried) after RETRY_SECONDS."""
+        retry_at = time.monotonic() + RETRY_SECONDS
+        with self._lock:
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                self._pending.setdefault(path, (stat.st_size, stat.st_mtime_ns, retry_at))
+
+    def _run(self):
+        next_poll = 0.0
+        while not self._stop.wait(TICK_SECONDS):
+            try:
+                if self._observer is None and time.monotonic() >= next_poll:
+                    self._poll_directory()
+                    next_poll = time.monotonic() + POLL_SECONDS
+                self._ingest_settled()
+            except Exception as e:
+                # Report and keep watching: one bad batch or callback must not end auto-import silently
+                self.last_error = e
+                traceback.print_exc()
+
+    def _ingest_settled(self):
+        settled = self._collect_settled()
+        if not settled:
+            return
+
+        # One batch (one transaction) for the whole burst; the ledger skips anything already stored
+        try:
+            stats = import_files(settled)
+        except DatabaseError as e:
+            # Batches committed before the error are already saved (and in the ingest ledger, which
+            # skips them when the files are queued again); retry the rest later
+            self.last_error = e
+            self._requeue(settled)
+            return
+        self.ingested_total += stats['saved']
+        if self.on_ingested:
+            self.on_ingested(stats)